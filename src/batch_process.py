@@ -0,0 +1,124 @@
+'''
+Reprocess a whole archive of scans at once: clean, process_points, re-base and generate_ifc for
+every walabotOut_$(time).txt log (or walabotSession_$(time) directory), several sessions at a time
+in a process pool. Each session's outputs are named after its timestamp. megascript saves a scan
+both as walabotOut_$(time).txt and walabotSession_$(time), so only the session of such a pair is
+processed; other inputs with the same timestamp (the same log name in two directories) get a
+_2, _3, ... suffix so no two workers write the same file.
+
+python batch_process.py walabotOut_txt
+python batch_process.py "walabotOut_txt/walabotOut_0425*.txt" --out batch_out --jobs 4 --plot
+python batch_process.py walabotOut_txt --clustering dbscan
+
+Stage results are cached in stage_cache/ (see stage_cache.py), so a rerun only redoes the stages
+whose inputs, parameters or code changed. --no-cache always runs everything.
+'''
+
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pipe_plotting.process_points as proc
+from session_pipeline import STAGES, output_paths, process_session, session_timestamp
+from scan_data.session_file import is_session
+from stage_cache import DEFAULT_DIR, DEFAULT_MAX_BYTES, StageCache
+
+
+def find_logs(patterns):
+    # a directory means every raw log and session in it; anything else is a path or glob
+    logs = []
+    for pattern in patterns:
+        if os.path.isdir(pattern) and not is_session(pattern):
+            found = glob.glob(os.path.join(pattern, 'walabotOut_*.txt'))
+            found += [path for path in glob.glob(os.path.join(pattern, 'walabotSession_*')) if is_session(path)]
+        else:
+            found = glob.glob(pattern)
+        logs.extend(sorted(found))
+    return list(dict.fromkeys(logs))  # drop repeats, keep order
+
+
+def drop_paired_logs(logs):
+    # walabotOut_X.txt next to walabotSession_X is the same scan: keep the session
+    sessions = {(os.path.dirname(os.path.normpath(log)), session_timestamp(log)) for log in logs if is_session(log)}
+    return [log for log in logs
+            if is_session(log) or (os.path.dirname(os.path.normpath(log)), session_timestamp(log)) not in sessions]
+
+
+def plan_outputs(logs, out_dir):
+    # output paths of every log, with a suffix on any timestamp already taken
+    plans, taken = {}, set()
+    for log in logs:
+        stamp = base = session_timestamp(log)
+        n = 1
+        while stamp in taken:
+            n += 1
+            stamp = f'{base}_{n}'
+        if stamp != base:
+            print(f"{log}: {base} is already used by another input, writing its outputs as {stamp}")
+        taken.add(stamp)
+        plans[log] = output_paths(log, out_dir, stamp)
+    return plans
+
+
+def print_summary(results, failed, wall_time, cached):
+    print(f"\n{len(results)} session(s) processed, {len(failed)} failed, {wall_time:.2f} s wall time")
+    if results:
+        print(f"{cached} of {len(results) * len(STAGES)} stages served from the cache")
+    for log, error in failed:
+        print(f"  FAILED {log}: {error}")
+    if not results:
+        return
+
+    print(f"\n{'stage':<10}{'total s':>10}{'mean s':>10}{'max s':>10}")
+    for stage in STAGES:
+        times = [timings[stage] for timings in results.values()]
+        print(f"{stage:<10}{sum(times):>10.3f}{sum(times) / len(times):>10.3f}{max(times):>10.3f}")
+    total = sum(sum(timings.values()) for timings in results.values())
+    print(f"{'all':<10}{total:>10.3f}{total / len(results):>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('inputs', nargs='+', help='directories, logs, sessions or glob patterns')
+    parser.add_argument('--out', default='batch_out', help='directory for every output file')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--plot', action='store_true', help='also save the process_points figure')
+    parser.add_argument('--clustering', choices=['axis', *proc.DENSITY_DIMS],
+                        help='process_points step 3 backend (default: its CLUSTERING)')
+    parser.add_argument('--cache', default=DEFAULT_DIR, help='stage cache directory')
+    parser.add_argument('--cache-mb', type=float, default=DEFAULT_MAX_BYTES / 2**20, help='stage cache size limit')
+    parser.add_argument('--no-cache', action='store_true', help='run every stage even if its inputs are unchanged')
+    args = parser.parse_args()
+
+    logs = drop_paired_logs(find_logs(args.inputs))
+    if not logs:
+        print("No walabotOut_*.txt logs or walabotSession_* directories found.")
+        return
+    os.makedirs(args.out, exist_ok=True)
+    cache = None if args.no_cache else StageCache(args.cache, int(args.cache_mb * 2**20))
+    plans = plan_outputs(logs, args.out)
+
+    results = {}
+    failed = []
+    cached = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(process_session, log, plans[log], args.plot, cache, args.clustering): log for log in logs}
+        for future in as_completed(futures):
+            log = futures[future]
+            try:
+                results[log], from_cache = future.result()
+            except Exception as e:
+                # one bad scan should not stop the rest of the archive
+                failed.append((log, f"{type(e).__name__}: {e}"))
+                continue
+            cached += len(from_cache)
+            note = f"  (cached: {', '.join(from_cache)})" if from_cache else ''
+            print(f"{log}: {sum(results[log].values()):.3f} s{note}")
+    print_summary(results, failed, time.perf_counter() - start, cached)
+
+
+if __name__ == '__main__':
+    main()
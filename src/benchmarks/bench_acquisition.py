@@ -0,0 +1,93 @@
+'''
+Benchmark Walabot acquisition against sensor/fake_walabot.py with simulated Trigger and Get times:
+    old        Trigger, GetImagingTargets, GetRawImageSlice and the journal append, one after the
+               other on one thread (what InWallApp did per Enter)
+    serial     Acquisition(pipelined=False): Trigger then Get on the sensor thread
+    pipelined  Acquisition(pipelined=True): Trigger and Get on their own threads
+For each: scans per second when the sensor is kept busy (continuous=True) and when captures come
+back to back (the default, a Trigger per capture), and how long one capture() (Enter) takes when
+the operator presses Enter at odd moments, both ways.
+
+Run from src/:
+    python -m benchmarks.bench_acquisition
+    python -m benchmarks.bench_acquisition --trigger-ms 40 --get-ms 30 --raw slice --seconds 3
+'''
+
+import argparse
+import os
+import tempfile
+import time
+
+import sensor.fake_walabot as wlbt
+from sensor.acquisition import Acquisition
+
+
+def old_loop(seconds, raw, journal):
+    # the sequential loop, run back to back: what the operator would get pressing Enter non-stop
+    count = 0
+    start = time.perf_counter()
+    with open(journal, 'a') as f:
+        while time.perf_counter() - start < seconds:
+            wlbt.Trigger()
+            targets = wlbt.GetImagingTargets()
+            if raw == 'image':
+                wlbt.GetRawImage()
+            else:
+                wlbt.GetRawImageSlice()
+            for target in targets:
+                f.write(f"x: {target.xPosCm} cm, y: {target.yPosCm} cm, z: {target.zPosCm} cm, a: {target.amplitude} cm\n")
+            count += 1
+    return count / (time.perf_counter() - start)
+
+
+def capture_latency(acquisition, captures):
+    # operator presses Enter at odd moments; time until capture() returns
+    total = 0.0
+    for i in range(captures):
+        time.sleep(0.013 * (i % 4))
+        start = time.perf_counter()
+        acquisition.capture()
+        total += time.perf_counter() - start
+    return total / captures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--trigger-ms', type=float, default=40.0)
+    parser.add_argument('--get-ms', type=float, default=25.0)
+    parser.add_argument('--raw', choices=['slice', 'image'], default=None)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--captures', type=int, default=20)
+    args = parser.parse_args()
+
+    wlbt.configure(args.trigger_ms / 1000, args.get_ms / 1000)
+    journal = os.path.join(tempfile.mkdtemp(), 'walabotOut_bench.txt')
+    print(f"Trigger {args.trigger_ms} ms, every Get {args.get_ms} ms, raw images: {args.raw}")
+    print(f"{'':<10}{'continuous':>24}{'on demand':>24}")
+    print(f"{'mode':<10}{'scans/s':>12}{'capture ms':>12}{'scans/s':>12}{'capture ms':>12}")
+
+    rate = old_loop(args.seconds, args.raw or 'slice', journal)
+    print(f"{'old':<10}{'':>24}{rate:>12.1f}{1000 / rate:>12.1f}")
+
+    for pipelined in (False, True):
+        row = f"{'pipelined' if pipelined else 'serial':<10}"
+        for continuous in (True, False):
+            acquisition = Acquisition(wlbt, raw_mode=args.raw, pipelined=pipelined, continuous=continuous).start()
+            start = time.perf_counter()
+            if continuous:
+                time.sleep(args.seconds)
+            else:
+                while time.perf_counter() - start < args.seconds:
+                    acquisition.capture()
+            rate = acquisition.scans / (time.perf_counter() - start)
+            latency = capture_latency(acquisition, args.captures)
+            acquisition.stop()
+            row += f"{rate:>12.1f}{latency * 1000:>12.1f}"
+        print(row)
+
+    os.remove(journal)
+    os.rmdir(os.path.dirname(journal))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+'''
+Benchmark the step 3 clustering backends of process_points ('axis' and 'dbscan',
+pipe_plotting/clustering.py).
+
+Scaling: extract_segments() and the bare dbscan() on fused scan points, one point per cm along
+straight pipes laid out on a growing wall (so the density stays that of a real scan).
+Shapes: small scans where the axis clustering is known to go wrong, with the pipes each backend
+finds: two pipes in the same column, a diagonal pipe, an elbow, two pipes crossing at different
+depths (which only 'dbscan3d' keeps apart).
+
+Run from src/:
+    python -m benchmarks.bench_clustering
+    python -m benchmarks.bench_clustering --points 10000 100000 300000 --axis-max 100000
+'''
+
+import argparse
+import contextlib
+import io
+import numpy as np
+
+import pipe_plotting.process_points as proc
+from benchmarks.bench_fusion import best_of
+from pipe_plotting.clustering import dbscan
+
+
+def wall_points(n_points, seed=0):
+    # horizontal and vertical pipes 20-80 cm long, one noisy point per cm, on a wall sized so
+    # pipes cover about 1/20 of it
+    rng = np.random.default_rng(seed)
+    side = np.sqrt(n_points * 20.0)
+    points = []
+    total = 0
+    while total < n_points:
+        length = int(rng.uniform(20, 80))
+        t = np.arange(length, dtype=np.float64)
+        x0, y0 = rng.uniform(0, side, 2)
+        if rng.random() < 0.5:
+            xy = np.column_stack([np.full(length, x0), y0 + t])
+        else:
+            xy = np.column_stack([x0 + t, np.full(length, y0)])
+        xy += rng.normal(0, 0.3, xy.shape)
+        points.append(np.column_stack([xy, np.full(length, 8.0)]))
+        total += length
+    return np.concatenate(points)[:n_points]
+
+
+def line(p, q, z=8.0, step=1.0, seed=0):
+    p, q = np.asarray(p, dtype=np.float64), np.asarray(q, dtype=np.float64)
+    n = int(np.linalg.norm(q - p) / step) + 1
+    xy = p + np.linspace(0, 1, n)[:, None] * (q - p)
+    xy += np.random.default_rng(seed).normal(0, 0.3, xy.shape)
+    return np.column_stack([xy, np.full(n, z)])
+
+
+SHAPES = {
+    'same column': [((10, 0), (10, 30)), ((12, 60), (12, 90))],
+    'diagonal': [((0, 0), (40, 30))],
+    'elbow': [((0, 0), (0, 40)), ((0, 40), (40, 40))],
+    'tee': [((0, 40), (60, 40)), ((30, 40), (30, 0))],
+    'crossing depths': [((0, 20), (40, 20), 2.0), ((20, 0), (20, 40), 8.0)],
+}
+
+
+def segments_quietly(points, clustering):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return proc.extract_segments(points, clustering=clustering)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--points', type=int, nargs='+', default=[1000, 10000, 100000, 300000])
+    parser.add_argument('--axis-max', type=int, default=100000, help='largest size to run the axis backend on')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'points':>8}{'axis ms':>10}{'pipes':>7}{'dbscan ms':>11}{'pipes':>7}{'dbscan() ms':>13}{'clusters':>10}")
+    for n in args.points:
+        points = wall_points(n)
+        repeat = args.repeat if n <= 100000 else 1
+        axis = ''
+        if n <= args.axis_max:
+            t_axis, segments = best_of(lambda: segments_quietly(points, 'axis'), repeat)
+            axis = f"{t_axis * 1000:>10.1f}{len(segments):>7}"
+        else:
+            axis = f"{'-':>10}{'-':>7}"
+        t_density, segments = best_of(lambda: segments_quietly(points, 'dbscan'), repeat)
+        t_labels, labels = best_of(lambda: dbscan(points[:, :2]), repeat)
+        print(f"{n:>8}{axis}{t_density * 1000:>11.1f}{len(segments):>7}{t_labels * 1000:>13.1f}{labels.max() + 1:>10}")
+
+    print(f"\n{'shape':<16}{'pipes':>6}{'axis':>6}{'dbscan':>8}{'dbscan3d':>10}")
+    for name, pipes in SHAPES.items():
+        points = np.concatenate([line(*pipe, seed=i) for i, pipe in enumerate(pipes)])
+        found = [len(segments_quietly(points, clustering)) for clustering in ('axis', 'dbscan', 'dbscan3d')]
+        print(f"{name:<16}{len(pipes):>6}{found[0]:>6}{found[1]:>8}{found[2]:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+'''
+Benchmark scan_data/fusion.py on a synthetic scan where the sensor is held still for several
+triggers at every position: each pipe point is reported by most of those triggers, a little
+moved each time, and a few stray targets flicker in. Reports the time fuse_hits() takes and
+what it saves process_points.extract_segments(), and how many pipes each finds.
+
+Run from src/:
+    python -m benchmarks.bench_fusion
+    python -m benchmarks.bench_fusion --pipes 40 --repeats 8
+'''
+
+import argparse
+import time
+import numpy as np
+
+import pipe_plotting.process_points as proc
+from scan_data import fusion
+
+
+def held_still_scan(n_pipes, repeats, per_pipe=40, seed=0):
+    # x, y, z, is_hit, amplitude, trigger of every reading
+    rng = np.random.default_rng(seed)
+    columns = []
+    trigger = 0
+    for _ in range(n_pipes):
+        t = np.linspace(0, rng.uniform(10, 80), per_pipe)
+        if rng.random() < 0.5:
+            x, y = np.full(per_pipe, rng.uniform(0, 20 * n_pipes)), rng.uniform(-200, 0) - t
+        else:
+            x, y = rng.uniform(0, 20 * n_pipes) + t, np.full(per_pipe, rng.uniform(-200, 0))
+        for px, py in zip(x, y):
+            for _ in range(repeats):
+                if rng.random() < 0.8:
+                    # the pipe, seen again with a little jitter
+                    columns.append((px + rng.normal(0, 0.2), py + rng.normal(0, 0.2), 8.0, rng.uniform(70, 90), True, trigger))
+                elif rng.random() < 0.3:
+                    # a flicker somewhere nearby
+                    columns.append((px + rng.uniform(-10, 10), py + rng.uniform(-10, 10), 8.0, rng.uniform(60, 70), True, trigger))
+                else:
+                    columns.append((px, py, 0.0, np.nan, False, trigger))
+                trigger += 1
+    x, y, z, amplitude, hit, trigger = (np.array(c) for c in zip(*columns))
+    return x, y, z, hit.astype(bool), amplitude, trigger.astype(np.int64)
+
+
+def best_of(fn, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pipes', type=int, default=20)
+    parser.add_argument('--repeats', type=int, default=5, help='triggers per sensor position')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    x, y, z, hit, amplitude, trigger = held_still_scan(args.pipes, args.repeats)
+    raw = np.column_stack([x[hit], y[hit], z[hit]])
+    print(f"{args.pipes} pipes, {args.repeats} triggers per position: {len(x)} readings, {len(raw)} targets")
+    print(f"{'points':<22}{'count':>8}{'fuse ms':>10}{'segments ms':>13}{'pipes':>7}")
+
+    t_segments, segments = best_of(lambda: proc.extract_segments(raw), args.repeat)
+    print(f"{'raw targets':<22}{len(raw):>8}{'':>10}{t_segments * 1000:>13.1f}{len(segments):>7}")
+    for min_triggers in (1, 2):
+        t_fuse, fused = best_of(lambda: fusion.fuse_hits(x, y, z, hit, amplitude, trigger,
+                                                         min_triggers=min_triggers), args.repeat)
+        points = np.column_stack([fused.x, fused.y, fused.z])
+        t_segments, segments = best_of(lambda: proc.extract_segments(points), args.repeat)
+        name = f"fused, >= {min_triggers} trigger(s)"
+        print(f"{name:<22}{len(points):>8}{t_fuse * 1000:>10.1f}{t_segments * 1000:>13.1f}{len(segments):>7}")
+
+
+if __name__ == '__main__':
+    main()
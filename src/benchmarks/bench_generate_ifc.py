@@ -0,0 +1,112 @@
+'''
+Benchmark generate_ifc on a generated wall: number of entities, file size, the time to write the
+IFC (in memory then model.write, and streamed with StreamingIfcWriter), the time to load it back
+with ifcopenshell.open, and the peak memory of a fresh process writing it both ways.
+
+With --walls, also times generate_building on that many walls of --pipes[0] pipes each, with the
+wall geometry prepared serially and in a pool of --jobs processes.
+
+Run from src/:
+    python -m benchmarks.bench_generate_ifc --pipes 100 500 2000
+    python -m benchmarks.bench_generate_ifc --pipes 200 --walls 40 --jobs 4
+'''
+
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import ifcopenshell
+
+import generate_ifc.generate_ifc as ifc
+
+
+def synthetic_pipes(n_pipes, seed=0):
+    # a chain of alternating horizontal and vertical runs, like segments from process_points
+    rng = np.random.default_rng(seed)
+    pipes = np.empty((n_pipes, 6))
+    x, y = 5.0, 5.0
+    for i in range(n_pipes):
+        step = rng.uniform(5, 40)
+        if i % 2:
+            pipes[i] = x, y, 8.0, x, y + step, 8.0
+            y += step
+        else:
+            pipes[i] = x, y, 8.0, x + step, y, 8.0
+            x += step
+    wall_dim = (pipes[:, [0, 3]].max() + 5, pipes[:, [1, 4]].max() + 5, 2.0)
+    return wall_dim, pipes
+
+
+def peak_rss_mb(n_pipes, stream):
+    # VmHWM of a fresh interpreter that only writes this wall (ru_maxrss would include this
+    # process's peak, which a forked child inherits)
+    code = f"""
+import contextlib, io
+import generate_ifc.generate_ifc as ifc
+from benchmarks.bench_generate_ifc import synthetic_pipes
+wall_dim, pipes = synthetic_pipes({n_pipes})
+with contextlib.redirect_stdout(io.StringIO()):
+    ifc.generate_from_arrays(wall_dim, pipes, {os.devnull!r}, stream={stream})
+with open('/proc/self/status') as f:
+    print(next(line.split()[1] for line in f if line.startswith('VmHWM')))
+"""
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return int(out.stdout) / 1024
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pipes', type=int, nargs='+', default=[100, 500, 2000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--walls', type=int, default=0)
+    parser.add_argument('--jobs', type=int, default=4)
+    args = parser.parse_args()
+
+    out = os.path.join(tempfile.mkdtemp(), 'bench.ifc')
+    print(f"{'pipes':>6}{'entities':>10}{'KiB':>9}{'write ms':>10}{'stream ms':>10}{'load ms':>9}"
+          f"{'peak MB':>9}{'stream MB':>10}")
+    for n_pipes in args.pipes:
+        wall_dim, pipes = synthetic_pipes(n_pipes)
+        with contextlib.redirect_stdout(io.StringIO()):
+            t_stream = best_of(lambda: ifc.generate_from_arrays(wall_dim, pipes, out, stream=True), args.repeat)
+            t_write = best_of(lambda: ifc.generate_from_arrays(wall_dim, pipes, out), args.repeat)
+        t_load = best_of(lambda: ifcopenshell.open(out), args.repeat)
+        n_entities = len(list(ifcopenshell.open(out)))
+        print(f"{n_pipes:>6}{n_entities:>10}{os.path.getsize(out) / 1024:>9.0f}{t_write * 1000:>10.1f}"
+              f"{t_stream * 1000:>10.1f}{t_load * 1000:>9.1f}{peak_rss_mb(n_pipes, False):>9.0f}"
+              f"{peak_rss_mb(n_pipes, True):>10.0f}")
+
+    if args.walls:
+        walls = [ifc.WallSpec(*synthetic_pipes(args.pipes[0], seed=i), origin=(0.0, 300.0 * i, 0.0))
+                 for i in range(args.walls)]
+        print(f"\n{args.walls} walls x {args.pipes[0]} pipes in one model")
+        for workers in (1, args.jobs):
+            with contextlib.redirect_stdout(io.StringIO()):
+                t_write = best_of(lambda: ifc.generate_building(walls, out, workers=workers), args.repeat)
+            print(f"workers={workers:<3} write {t_write * 1000:8.1f} ms")
+        start = time.perf_counter()
+        for wall in walls:
+            ifc.wall_geometry(wall.wall_dim, wall.pipes)
+        print(f"wall geometry alone, serial: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    os.remove(out)
+    os.rmdir(os.path.dirname(out))
+
+
+if __name__ == '__main__':
+    main()
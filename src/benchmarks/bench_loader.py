@@ -0,0 +1,99 @@
+'''
+Benchmark scan_data.loader against the old per-line read_data().
+
+Run from src/ with either real logs or a generated one:
+    python -m benchmarks.bench_loader ../prev_iterations/iteration2/walabotOut_txt/*.txt
+    python -m benchmarks.bench_loader --lines 200000
+'''
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import numpy as np
+
+from scan_data.loader import load_log
+
+
+# the parser that used to be copied into megascript_v2.py / temp.py, kept here as the baseline
+def legacy_read_data(filename):
+    x, y, z, is_hit = [], [], [], []
+    with open(filename, 'r') as f:
+        for line in f:
+            if line.strip().startswith("x:") or "No Target Detected at" in line:
+                parts = line.replace("cm", "").replace("No Target Detected at ", "").split(",")
+                try:
+                    x_val = float(parts[0].split(":")[1].strip())
+                    y_val = float(parts[1].split(":")[1].strip())
+                    z_val = float(parts[2].split(":")[1].strip())
+                    x.append(x_val)
+                    y.append(y_val)
+                    z.append(z_val)
+                    is_hit.append("a:" in line)
+                except:
+                    continue
+    return np.array(x), np.array(y), np.array(z), np.array(is_hit)
+
+
+def write_synthetic_log(filename, n_lines, seed=0):
+    rng = random.Random(seed)
+    with open(filename, 'w') as f:
+        # same shape as a real session: the walabot position steps by the spacing, targets are offset from it
+        for i in range(n_lines):
+            x = 3 + 2.0 * (i % 200)
+            y = -2.0 * (i // 200)
+            if rng.random() < 0.3:
+                f.write(f"x: {x + rng.uniform(-3, 4)} cm, y: {y - rng.uniform(-6, 4)} cm, z: 8.0 cm, "
+                        f"a: {rng.uniform(60, 90)} cm\n")
+            else:
+                f.write(f"No Target Detected at x: {x} cm, y: {y} cm, z: 0.0 cm\n")
+
+
+def best_of(fn, files, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for filename in files:
+            fn(filename)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--lines', type=int, default=100000, help='size of the generated log if no files are given')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    files = args.files
+    tmp = None
+    if not files:
+        tmp = tempfile.NamedTemporaryFile(suffix='.txt', delete=False)
+        tmp.close()
+        write_synthetic_log(tmp.name, args.lines)
+        files = [tmp.name]
+
+    # both parsers must agree before their timings mean anything. The legacy parser marks hits
+    # without an amplitude (the first logs) as misses, so compare hit flags only where it could tell
+    for filename in files:
+        old = legacy_read_data(filename)
+        new = load_log(filename)
+        for a, b in zip(old[:3], (new.x, new.y, new.z)):
+            assert np.array_equal(a, b), f"parsers disagree on {filename}"
+        assert np.array_equal(old[3], new.hit & ~np.isnan(new.amplitude)), f"parsers disagree on {filename}"
+
+    n_lines = sum(sum(1 for _ in open(filename)) for filename in files)
+    t_old = best_of(legacy_read_data, files, args.repeat)
+    t_new = best_of(load_log, files, args.repeat)
+    print(f"{len(files)} file(s), {n_lines} lines")
+    print(f"legacy read_data : {t_old * 1000:9.2f} ms")
+    print(f"scan_data.loader : {t_new * 1000:9.2f} ms  ({t_old / t_new:.1f}x)")
+
+    if tmp is not None:
+        os.remove(tmp.name)
+
+
+if __name__ == '__main__':
+    main()
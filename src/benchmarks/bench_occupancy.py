@@ -0,0 +1,50 @@
+'''
+Benchmark scan_data/occupancy.py against feeding process_points the raw targets, on the synthetic
+held-still scan of bench_fusion.py with more and more triggers per position over the same wall.
+Grid size and update time follow the wall area; the raw point cloud follows the trigger count.
+Also times one trigger at a time (what the scan loop would do) against one batch update.
+
+Run from src/:
+    python -m benchmarks.bench_occupancy
+    python -m benchmarks.bench_occupancy --pipes 40 --repeats 1 4 16
+'''
+
+import argparse
+import numpy as np
+
+import pipe_plotting.process_points as proc
+from benchmarks.bench_fusion import best_of, held_still_scan
+from scan_data.occupancy import OccupancyGrid
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pipes', type=int, default=20)
+    parser.add_argument('--repeats', type=int, nargs='+', default=[1, 4, 16], help='triggers per position')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'triggers':>9}{'targets':>9}{'raw seg ms':>12}{'pipes':>7}"
+          f"{'cells':>8}{'grid KiB':>10}{'update ms':>11}{'per reading ms':>16}{'seg ms':>8}{'pipes':>7}")
+    for repeats in args.repeats:
+        x, y, z, hit, _, _ = held_still_scan(args.pipes, repeats)
+        raw = np.column_stack([x[hit], y[hit], z[hit]])
+        t_raw, raw_segments = best_of(lambda: proc.extract_segments(raw), args.repeat)
+
+        t_update, grid = best_of(lambda: OccupancyGrid().update(x, y, z, hit), args.repeat)
+
+        def one_by_one():
+            incremental = OccupancyGrid()
+            for i in range(len(x)):
+                incremental.update(x[i:i + 1], y[i:i + 1], z[i:i + 1], hit[i:i + 1])
+        t_single, _ = best_of(one_by_one, 1)
+
+        points = grid.occupied()
+        t_grid, grid_segments = best_of(lambda: proc.extract_segments(points), args.repeat)
+        print(f"{repeats:>9}{len(raw):>9}{t_raw * 1000:>12.1f}{len(raw_segments):>7}"
+              f"{len(points):>8}{grid.nbytes / 1024:>10.0f}{t_update * 1000:>11.1f}"
+              f"{t_single / len(x) * 1000:>16.3f}{t_grid * 1000:>8.1f}{len(grid_segments):>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''
+Benchmark the 2D preview: the old one-scatter-call-per-point loop against ScatterPreview.
+
+Run from src/:
+    python -m benchmarks.bench_preview
+    python -m benchmarks.bench_preview --sizes 1000 10000 100000 --legacy-max 100000
+'''
+
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from matplotlib.figure import Figure
+
+from preview.scatter_preview import ScatterPreview
+
+
+# what plot_data_matplotlib used to do (on a Figure instead of pyplot), kept here as the baseline
+def legacy_plot(x, y, is_hit, save_path):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
+    for xi, yi, hit in zip(x, y, is_hit):
+        color = 'red' if hit else 'gray'
+        ax.scatter(xi, yi, c=color, marker='o')
+    ax.set_title('2D Visualization of Walabot Readings')
+    ax.set_xlabel('X Axis')
+    ax.set_ylabel('Y Axis')
+    ax.grid(True)
+    fig.savefig(save_path, dpi=300)
+
+
+def fake_readings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(0, 400, n)
+    y = rng.uniform(-200, 0, n)
+    return x, y, rng.random(n) < 0.3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--legacy-max', type=int, default=10000, help='skip the old renderer above this many points')
+    args = parser.parse_args()
+
+    out = os.path.join(tempfile.mkdtemp(), 'preview.png')
+    preview = ScatterPreview()
+    print(f"{'points':>8} {'legacy':>10} {'first':>10} {'reused':>10}")
+    for n in args.sizes:
+        x, y, is_hit = fake_readings(n)
+
+        t_old = float('nan')
+        if n <= args.legacy_max:
+            start = time.perf_counter()
+            legacy_plot(x, y, is_hit, out)
+            t_old = time.perf_counter() - start
+
+        # a fresh preview (first trigger) and the persistent one (every trigger after that)
+        start = time.perf_counter()
+        first = ScatterPreview()
+        first.update(x, y, is_hit)
+        first.save(out)
+        t_first = time.perf_counter() - start
+
+        preview.update(x, y, is_hit)
+        start = time.perf_counter()
+        preview.update(x, y, is_hit)
+        preview.save(out)
+        t_reused = time.perf_counter() - start
+
+        print(f"{n:>8} {t_old:>9.3f}s {t_first:>9.3f}s {t_reused:>9.3f}s")
+
+
+if __name__ == '__main__':
+    main()
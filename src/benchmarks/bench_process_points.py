@@ -0,0 +1,92 @@
+'''
+Benchmark process_points with and without the matplotlib figure.
+
+Import time is measured in a fresh interpreter for each case (the module alone, and the module plus
+matplotlib as it used to be imported). Run time is run_all() on the same points, once headless and
+once writing the PNG. Run from src/:
+    python -m benchmarks.bench_process_points pipe_plotting/epictest/cleaned_points.txt
+    python -m benchmarks.bench_process_points --pipes 40
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+import pipe_plotting.process_points as proc
+
+
+def import_time(statement, repeat):
+    # best of several fresh interpreters, minus the cost of starting one
+    code = f"import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)"
+    best = float('inf')
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        best = min(best, float(out.stdout))
+    return best
+
+
+def write_synthetic_points(filename, n_pipes, per_pipe=40, seed=0):
+    # straight horizontal and vertical runs with a little noise, like the cleaned hit points of a scan
+    rng = np.random.default_rng(seed)
+    points = []
+    for _ in range(n_pipes):
+        t = np.linspace(0, rng.uniform(10, 80), per_pipe)
+        noise = rng.normal(0, 0.5, per_pipe)
+        if rng.random() < 0.5:
+            x, y = np.full(per_pipe, rng.uniform(0, 20 * n_pipes)) + noise, rng.uniform(-200, 0) - t
+        else:
+            x, y = rng.uniform(0, 20 * n_pipes) + t, np.full(per_pipe, rng.uniform(-200, 0)) + noise
+        points.append(np.column_stack([x, y, np.full(per_pipe, 8.0)]))
+    np.savetxt(filename, np.concatenate(points), delimiter=', ')
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('points_file', nargs='?')
+    parser.add_argument('--pipes', type=int, default=20, help='size of the generated scan if no file is given')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    points_file = args.points_file
+    if points_file is None:
+        points_file = os.path.join(tmpdir, 'points.txt')
+        write_synthetic_points(points_file, args.pipes)
+    segments_file = os.path.join(tmpdir, 'segments.txt')
+    png_file = os.path.join(tmpdir, 'plot.png')
+
+    t_headless = import_time('import pipe_plotting.process_points', args.repeat)
+    t_plotting = import_time('import pipe_plotting.process_points; import matplotlib.pyplot', args.repeat)
+    print(f"import, headless       : {t_headless * 1000:8.1f} ms")
+    print(f"import, with matplotlib: {t_plotting * 1000:8.1f} ms")
+
+    # first figure pays for importing matplotlib; keep that out of the per-run numbers
+    proc.run_all(points_file, segments_file, png_file)
+    n_segments = sum(1 for _ in open(segments_file))
+    r_headless = best_of(lambda: proc.run_all(points_file, segments_file), args.repeat)
+    r_plotting = best_of(lambda: proc.run_all(points_file, segments_file, png_file), args.repeat)
+    print(f"{len(proc.read_points(points_file))} points, {n_segments} segments")
+    print(f"run_all, headless      : {r_headless * 1000:8.1f} ms")
+    print(f"run_all, with PNG      : {r_plotting * 1000:8.1f} ms")
+
+    for name in os.listdir(tmpdir):
+        os.remove(os.path.join(tmpdir, name))
+    os.rmdir(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
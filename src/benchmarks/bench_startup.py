@@ -0,0 +1,67 @@
+'''
+Benchmark cold start of megascript_v2.py: time from launching a fresh interpreter until the first
+prompt ("Please enter desired spacing") is on stdout.
+    lazy    megascript_v2.py as it is: the SDK is loaded after the first answer, matplotlib,
+            plotly and ifcopenshell (session_pipeline) on first use or by the warm-up thread
+    eager   the same imports done up front before the prompt, what the script used to do
+Every run is a new process in a scratch directory (the script creates its output folders in the
+working directory), answered "2", "n", "4" with sensor/fake_walabot.py as the SDK.
+
+Run from src/:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 10
+'''
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROMPT = "Please enter desired spacing"
+EAGER = ("import megascript_v2, session_pipeline, preview.scatter_preview, plotly.graph_objects; "
+         "megascript_v2.InWallApp()")
+
+
+def first_prompt(command, workdir):
+    # seconds until PROMPT is printed; the process is then answered and left to finish
+    env = dict(os.environ, PYTHONPATH=SRC, WALABOT_API=os.path.join(SRC, 'sensor', 'fake_walabot.py'))
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL, text=True)
+    for line in process.stdout:
+        if PROMPT in line:
+            break
+    elapsed = time.perf_counter() - start
+    process.communicate("2\nn\n4\n")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    commands = {
+        'lazy': [sys.executable, '-u', os.path.join(SRC, 'megascript_v2.py')],
+        'eager': [sys.executable, '-u', '-c', EAGER],
+    }
+    workdir = tempfile.mkdtemp()
+    try:
+        # one untimed run of each so both start from a warm disk cache
+        for command in commands.values():
+            first_prompt(command, workdir)
+        print(f"{'mode':<8}{'median ms':>12}{'min ms':>10}")
+        for mode, command in commands.items():
+            times = [first_prompt(command, workdir) for _ in range(args.runs)]
+            print(f"{mode:<8}{statistics.median(times) * 1000:>12.1f}{min(times) * 1000:>10.1f}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
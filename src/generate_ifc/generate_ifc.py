@@ -1,5 +1,13 @@
 import ifcopenshell
+import ifcopenshell.guid
+import argparse
+import json
 import math
+import os
+from datetime import datetime
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 
 '''
 IMPORTANT: All inputted coordinates are blown up by 100 because the online ifc viewer could
@@ -10,215 +18,527 @@ PIPE, 1200.1667, 3200.0000, 800.0000, 1200.1667, 1900.7923, 800.0000 (PIPE, x, y
 PIPE, 1200.1667, 1900.7923, 800.0000, 3700.6447, 1900.7923, 800.0000
 PIPE, 3700.6447, 1900.7923, 800.0000, 3700.6447, 900.0000, 800.0000
 
+Many walls (a whole floor) go into one model with generate_building(); each wall is placed in the
+room by its origin (cm, ifc axes: x/y on the floor, z up) and its rotation about the vertical axis.
+A layout file lists the walls for the command line:
+
+{"name": "Floor 1", "walls": [
+    {"input": "coordsForifc_050325_1835.txt", "origin": [0, 0, 0], "rotation": 0, "name": "North"},
+    {"input": "walabotSession_050325_1838", "origin": [500, 0, 0], "rotation": 90}
+]}
+
+python -m generate_ifc.generate_ifc coordsForifc_$(time).txt output.ifc
+python -m generate_ifc.generate_ifc --building layout.json output.ifc [--jobs 4] [--stream]
+
+--stream (StreamingIfcWriter) writes the STEP text entity by entity instead of building the whole
+model in memory, for very large pipe sets.
+
+--fittings (or "fittings": true for a wall of the layout) also adds an IfcPipeFitting, drawn as a
+sphere, at every elbow, tee and cross of the wall's pipe network (pipe_plotting/pipe_network.py).
 '''
+
+PIPE_RADIUS_CM = 1 # 100 meters right now, online ifc viewer can't show smt that small
+FITTING_RADIUS_CM = 1.5 * PIPE_RADIUS_CM  # sphere drawn at elbows and tees, a bit wider than the pipe
+FITTING_TYPES = {'elbow': 'BEND', 'tee': 'JUNCTION', 'cross': 'JUNCTION'}  # IfcPipeFittingTypeEnum
+
+# one wall of the building: the generate_from_arrays inputs plus where the wall stands in the room
+WallSpec = namedtuple('WallSpec', ['wall_dim', 'pipes', 'origin', 'rotation', 'name', 'fittings'],
+                      defaults=((0.0, 0.0, 0.0), 0.0, None, False))
+
+# numbers only (meters, y and z swapped), so walls can be prepared in other processes
+# fittings: (location, junction kind) of every elbow, tee and cross
+WallGeometry = namedtuple('WallGeometry', ['length', 'height', 'thickness', 'starts', 'directions', 'lengths',
+                                           'fittings'], defaults=((),))
+
+
+def read_wall(input_file):
+    # coordsForifc text file or binary session directory -> (wall_dim, pipes) in cm
+    custom_pipe_segments = []
+
+    if os.path.isdir(input_file):
+        # binary session directory (scan_data/session_file.py): wall from the header, pipes memory-mapped
+        from scan_data.session_file import open_session
+        session = open_session(input_file)
+        length_cm, height_cm, thickness_cm = session.wall_dim
+        if session.segments is not None:
+            custom_pipe_segments = session.segments
+    else:
+        with open(input_file, "r") as f:
+            for line in f:
+                parts = line.strip().split(",")
+                if parts[0].strip().upper() == "WALL":
+                    length_cm = float(parts[1])
+                    height_cm = float(parts[2])
+                    thickness_cm = float(parts[3])
+                elif parts[0].strip().upper() == "PIPE":
+                    custom_pipe_segments.append(list(map(float, parts[1:])))
+
+    return (length_cm, height_cm, thickness_cm), custom_pipe_segments
+
+
 def generate(input_file, output_file):
     # -------- Parse input
     #input_file = "coordsForIfc.txt"
-    custom_pipe_segments = []
+    wall_dim, custom_pipe_segments = read_wall(input_file)
+    generate_from_arrays(wall_dim, custom_pipe_segments, output_file)
 
-    with open(input_file, "r") as f:
-        for line in f:
-            parts = line.strip().split(",")
-            if parts[0].strip().upper() == "WALL":
-                length_cm = float(parts[1])
-                height_cm = float(parts[2])
-                thickness_cm = float(parts[3])
-            elif parts[0].strip().upper() == "PIPE":
-                coords = list(map(float, parts[1:]))
-                start = (coords[0], coords[1], coords[2])
-                end = (coords[3], coords[4], coords[5])
-                custom_pipe_segments.append((start, end))
 
+def generate_from_arrays(wall_dim, pipes, output_file, stream=False, fittings=False):
+    '''
+    wall_dim: (length, height, thickness) in cm. pipes: rows of x1, y1, z1, x2, y2, z2 in cm (a list
+    or an (m, 6) array), y already positive. Writes the IFC without any intermediate text file.
+    '''
+    generate_building([WallSpec(wall_dim, pipes, name="SimpleWall", fittings=fittings)], output_file, stream=stream)
+
+
+def pipe_geometry(pipes):
     # -------- Convert to meters
-    length = length_cm /100
-    height = height_cm / 100
-    thickness = thickness_cm / 100
-    pipe_radius_cm = 1 # 100 meters right now, online ifc viewer can't show smt that small
-    pipe_radius = pipe_radius_cm / 100
-    custom_pipe_segments = [
-        ((x1/100, z1/100, y1/100), (x2/100, z2/100, y2/100))
-        for (x1, y1, z1), (x2, y2, z2) in custom_pipe_segments
-    ]
-
-    # -------- Create blank IFC model
-    model = ifcopenshell.file(schema="IFC4")
-
-    # -------- Project structure
-    project = model.create_entity("IfcProject", GlobalId="0RANDOMGUID01", Name="WallWithPipesProject")
-    site = model.create_entity("IfcSite", GlobalId="0RANDOMGUID02", Name="Site")
-    building = model.create_entity("IfcBuilding", GlobalId="0RANDOMGUID03", Name="Building")
-    storey = model.create_entity("IfcBuildingStorey", GlobalId="0RANDOMGUID04", Name="Floor 1")
-
-    model.create_entity("IfcRelAggregates", GlobalId="rel01", RelatingObject=project, RelatedObjects=[site])
-    model.create_entity("IfcRelAggregates", GlobalId="rel02", RelatingObject=site, RelatedObjects=[building])
-    model.create_entity("IfcRelAggregates", GlobalId="rel03", RelatingObject=building, RelatedObjects=[storey])
-
-    # -------- Wall
-    wall = model.create_entity("IfcWallStandardCase", GlobalId="WALLGUID1234", Name="SimpleWall")
-
-    model.create_entity(
-        "IfcRelContainedInSpatialStructure",
-        GlobalId="rel04",
-        RelatingStructure=storey,
-        RelatedElements=[wall]
-    )
-
-    wall.ObjectPlacement = model.create_entity(
-        "IfcLocalPlacement",
-        PlacementRelTo=None,
-        RelativePlacement=model.create_entity(
-            "IfcAxis2Placement3D",
-            Location=model.create_entity("IfcCartesianPoint", Coordinates=[0.0, 0.0, 0.0]),
-            Axis=model.create_entity("IfcDirection", DirectionRatios=[0.0, 0.0, 1.0]),
-            RefDirection=model.create_entity("IfcDirection", DirectionRatios=[1.0, 0.0, 0.0])
-        )
-    )
-
-    wall_profile = model.create_entity(
-        "IfcArbitraryClosedProfileDef",
-        ProfileType="AREA",
-        OuterCurve=model.create_entity(
-            "IfcPolyline",
-            Points=[
-                model.create_entity("IfcCartesianPoint", Coordinates=[0.0, 0.0, 0.0]),
-                model.create_entity("IfcCartesianPoint", Coordinates=[length, 0.0, 0.0]),
-                model.create_entity("IfcCartesianPoint", Coordinates=[length, thickness, 0.0]),
-                model.create_entity("IfcCartesianPoint", Coordinates=[0.0, thickness, 0.0]),
-                model.create_entity("IfcCartesianPoint", Coordinates=[0.0, 0.0, 0.0]),
-            ]
+    pipes = np.asarray(pipes, dtype=np.float64).reshape(-1, 6) / 100
+
+    # not just naming convention, actually swaps y and z: (x, y, z) -> (x, z, y), ifc z is up
+    starts = pipes[:, [0, 2, 1]]
+    ends = pipes[:, [3, 5, 4]]
+
+    # Compute direction vector (swapped y and z)
+    delta = ends - starts
+    lengths = np.sqrt(delta[:, 0]**2 + delta[:, 1]**2 + delta[:, 2]**2)
+
+    # Normalize direction
+    if np.any(lengths == 0):
+        raise ValueError("Pipe start and end points cannot be the same.")
+    directions = delta / lengths[:, None]
+    return starts.tolist(), directions.tolist(), lengths.tolist()
+
+
+def fitting_geometry(pipes):
+    # junctions of the pipe network that need a fitting, in meters with y and z swapped like the pipes
+    import pipe_plotting.pipe_network as network
+    locations, kinds = network.fittings(network.build_network(pipes))
+    locations = locations[:, [0, 2, 1]] / 100
+    return list(zip(locations.tolist(), [network.JUNCTIONS[kind] for kind in kinds]))
+
+
+def wall_geometry(wall_dim, pipes, fittings=False):
+    length_cm, height_cm, thickness_cm = (float(v) for v in wall_dim)
+    return WallGeometry(length_cm / 100, height_cm / 100, thickness_cm / 100, *pipe_geometry(pipes),
+                        fitting_geometry(pipes) if fittings else ())
+
+
+class _Wall:
+    # what later pipes of a wall need: the placement they are relative to
+    def __init__(self, placement, name):
+        self.placement = placement
+        self.name = name
+        self.pipe_count = 0
+        self.fitting_count = 0
+
+
+class _ModelBuilder:
+    '''
+    One IFC model: project, site, building, storey, and the geometry every element shares (one
+    instance of every point, direction, placement and profile that is the same for all elements).
+    Each pipe then only adds what is its own (location, length, axis if new).
+    Entities are only made through create(), so StreamingIfcWriter can write them out instead.
+    '''
+    containment_batch = None  # elements per IfcRelContainedInSpatialStructure; None = one for all
+
+    def __init__(self, storey_name="Floor 1"):
+        # -------- Create blank IFC model
+        self.model = ifcopenshell.file(schema="IFC4")
+        self._setup(storey_name)
+
+    def create(self, ifc_type, **attributes):
+        return self.model.create_entity(ifc_type, **attributes)
+
+    def _setup(self, storey_name):
+        create = self.create
+        self.elements = []
+
+        # -------- Shared geometry
+        self.origin = create("IfcCartesianPoint", Coordinates=[0.0, 0.0, 0.0])
+        self.directions = {}
+        self.x_dir = self.direction((1.0, 0.0, 0.0))
+        self.y_dir = self.direction((0.0, 1.0, 0.0))
+        self.z_dir = self.direction((0.0, 0.0, 1.0))
+        self.identity = create("IfcAxis2Placement3D", Location=self.origin, Axis=self.z_dir, RefDirection=self.x_dir)
+
+        # -------- Project structure
+        project = create("IfcProject", GlobalId=ifcopenshell.guid.new(), Name="WallWithPipesProject")
+        site = create("IfcSite", GlobalId=ifcopenshell.guid.new(), Name="Site")
+        building = create("IfcBuilding", GlobalId=ifcopenshell.guid.new(), Name="Building")
+        self.storey = create("IfcBuildingStorey", GlobalId=ifcopenshell.guid.new(), Name=storey_name)
+
+        create("IfcRelAggregates", GlobalId=ifcopenshell.guid.new(), RelatingObject=project, RelatedObjects=[site])
+        create("IfcRelAggregates", GlobalId=ifcopenshell.guid.new(), RelatingObject=site, RelatedObjects=[building])
+        create("IfcRelAggregates", GlobalId=ifcopenshell.guid.new(), RelatingObject=building, RelatedObjects=[self.storey])
+
+        self.context = create(
+            "IfcGeometricRepresentationContext",
+            ContextIdentifier="Body",
+            ContextType="Model",
+            CoordinateSpaceDimension=3,
+            Precision=1.0e-5,
+            WorldCoordinateSystem=self.identity
         )
-    )
-
-    wall_solid = model.create_entity(
-        "IfcExtrudedAreaSolid",
-        SweptArea=wall_profile,
-        Position=model.create_entity(
-            "IfcAxis2Placement3D",
-            Location=model.create_entity("IfcCartesianPoint", Coordinates=[0.0, 0.0, 0.0]),
-            Axis=model.create_entity("IfcDirection", DirectionRatios=[0.0, 0.0, 1.0]),
-            RefDirection=model.create_entity("IfcDirection", DirectionRatios=[1.0, 0.0, 0.0])
-        ),
-        ExtrudedDirection=model.create_entity("IfcDirection", DirectionRatios=[0.0, 0.0, 1.0]),
-        Depth=height
-    )
-
-    context = model.create_entity(
-        "IfcGeometricRepresentationContext",
-        ContextIdentifier="Body",
-        ContextType="Model",
-        CoordinateSpaceDimension=3,
-        Precision=1.0e-5,
-        WorldCoordinateSystem=model.create_entity(
-            "IfcAxis2Placement3D",
-            Location=model.create_entity("IfcCartesianPoint", Coordinates=[0.0, 0.0, 0.0])
-        )
-    )
-
-    wall_shape = model.create_entity(
-        "IfcShapeRepresentation",
-        ContextOfItems=context,
-        RepresentationIdentifier="Body",
-        RepresentationType="SweptSolid",
-        Items=[wall_solid]
-    )
-
-    wall.Representation = model.create_entity(
-        "IfcProductDefinitionShape",
-        Representations=[wall_shape]
-    )
-
-    # -------- Pipes
-    pipe_counter = 0
-
-    for (start, end) in custom_pipe_segments:
-        '''
-            start = (1, 2, 3)  # (x, y, z)
-            (x1, z1, y1) = start
-            print(x1, z1, y1)  # Output: 1, 3, 2
-        '''
-        # not just naming convention, actually swaps y and z ^^
-        (x1, y1, z1) = start
-        (x2, y2, z2) = end
-
-        # Compute direction vector (swapped y and z)
-        dx = x2 - x1
-        dy = y2 - y1
-        dz = z2 - z1
-        length = math.sqrt(dx**2 + dy**2 + dz**2)
-
-        # Normalize direction
-        if length == 0:
-            raise ValueError("Pipe start and end points cannot be the same.")
-
-        dir_x = dx / length
-        dir_y = dy / length
-        dir_z = dz / length
-
-        pipe = model.create_entity("IfcPipeSegment", GlobalId=f"PIPEGUID{pipe_counter:04d}", Name=f"Pipe{pipe_counter}")
-
-        model.create_entity(
-            "IfcRelContainedInSpatialStructure",
-            GlobalId=f"relPipe{pipe_counter:04d}",
-            RelatingStructure=storey,
-            RelatedElements=[pipe]
+
+        # every pipe has the same cross section
+        self.pipe_profile = create(
+            "IfcCircleProfileDef",
+            ProfileType="AREA",
+            Radius=PIPE_RADIUS_CM / 100
         )
+        self.fitting_shape = None  # every fitting has the same sphere, made with the first one
 
-        pipe.ObjectPlacement = model.create_entity(
-            "IfcLocalPlacement",
-            PlacementRelTo=None,
-            RelativePlacement=model.create_entity(
+    def direction(self, ratios):
+        ratios = tuple(float(r) for r in ratios)
+        if ratios not in self.directions:
+            self.directions[ratios] = self.create("IfcDirection", DirectionRatios=list(ratios))
+        return self.directions[ratios]
+
+    def shape(self, solid, representation_type="SweptSolid"):
+        shape = self.create(
+            "IfcShapeRepresentation",
+            ContextOfItems=self.context,
+            RepresentationIdentifier="Body",
+            RepresentationType=representation_type,
+            Items=[solid]
+        )
+        return self.create("IfcProductDefinitionShape", Representations=[shape])
+
+    def _add_element(self, element):
+        self.elements.append(element)
+        if self.containment_batch and len(self.elements) >= self.containment_batch:
+            self._contain()
+
+    def _contain(self):
+        # one containment relationship for every wall and pipe (or per batch of them when streaming)
+        if self.elements:
+            self.create(
+                "IfcRelContainedInSpatialStructure",
+                GlobalId=ifcopenshell.guid.new(),
+                RelatingStructure=self.storey,
+                RelatedElements=self.elements
+            )
+        self.elements = []
+
+    def emit_wall(self, geometry, origin=(0.0, 0.0, 0.0), rotation=0.0, name="SimpleWall"):
+        create = self.create
+        length, height, thickness = geometry.length, geometry.height, geometry.thickness
+
+        # -------- Wall
+        # where the wall stands in the room; its pipes are placed relative to it
+        relative_placement = self.identity
+        if any(origin) or rotation:
+            angle = math.radians(rotation)
+            relative_placement = create(
                 "IfcAxis2Placement3D",
-                Location=model.create_entity("IfcCartesianPoint", Coordinates=[x1, y1, z1]),
-                Axis=model.create_entity("IfcDirection", DirectionRatios=[dir_x, dir_y, dir_z]),
-                RefDirection=model.create_entity("IfcDirection", DirectionRatios=[0.0, 1.0, 0.0]) 
-                # RefDirection specifies direction of local x-axis for the object.
-                # [0,1,0] means a vector in the y direction. Since the y-axis is orthogonal to the z-axis.
-                # So, orientation of the object will be in the xy-plane. 
+                Location=create("IfcCartesianPoint", Coordinates=[float(v) / 100 for v in origin]),
+                Axis=self.z_dir,
+                RefDirection=self.direction((round(math.cos(angle), 12), round(math.sin(angle), 12), 0.0))
             )
+        wall_placement = create(
+            "IfcLocalPlacement",
+            PlacementRelTo=None,
+            RelativePlacement=relative_placement
         )
 
-        pipe_profile = model.create_entity(
-            "IfcCircleProfileDef",
+        wall_profile = create(
+            "IfcArbitraryClosedProfileDef",
             ProfileType="AREA",
-            Radius=pipe_radius
+            OuterCurve=create(
+                "IfcPolyline",
+                Points=[
+                    self.origin,
+                    create("IfcCartesianPoint", Coordinates=[length, 0.0, 0.0]),
+                    create("IfcCartesianPoint", Coordinates=[length, thickness, 0.0]),
+                    create("IfcCartesianPoint", Coordinates=[0.0, thickness, 0.0]),
+                    self.origin,
+                ]
+            )
         )
 
-        pipe_solid = model.create_entity(
+        wall_solid = create(
             "IfcExtrudedAreaSolid",
-            SweptArea=pipe_profile,
-            Position=model.create_entity(
-                "IfcAxis2Placement3D",
-                Location=model.create_entity("IfcCartesianPoint", Coordinates=[0.0, 0.0, 0.0]),
-                Axis=model.create_entity("IfcDirection", DirectionRatios=[0.0, 0.0, 1.0]),
-                RefDirection=model.create_entity("IfcDirection", DirectionRatios=[1.0, 0.0, 0.0])
-            ),
-            ExtrudedDirection=model.create_entity("IfcDirection", DirectionRatios=[0.0, 0.0, 1.0]),
-            Depth=length
+            SweptArea=wall_profile,
+            Position=self.identity,
+            ExtrudedDirection=self.z_dir,
+            Depth=height
         )
 
-        pipe_shape = model.create_entity(
-            "IfcShapeRepresentation",
-            ContextOfItems=context,
-            RepresentationIdentifier="Body",
-            RepresentationType="SweptSolid",
-            Items=[pipe_solid]
-        )
+        self._add_element(create("IfcWallStandardCase", GlobalId=ifcopenshell.guid.new(), Name=name,
+                                 ObjectPlacement=wall_placement, Representation=self.shape(wall_solid)))
+
+        wall = _Wall(wall_placement, name)
+        self.emit_pipes(wall, geometry.starts, geometry.directions, geometry.lengths)
+        self.emit_fittings(wall, geometry.fittings)
+        return wall
+
+    def emit_pipes(self, wall, starts, directions, lengths):
+        create = self.create
+
+        # -------- Pipes
+        for start, axis, pipe_length in zip(starts, directions, lengths):
+            pipe_placement = create(
+                "IfcLocalPlacement",
+                PlacementRelTo=wall.placement,
+                RelativePlacement=create(
+                    "IfcAxis2Placement3D",
+                    Location=create("IfcCartesianPoint", Coordinates=start),
+                    Axis=self.direction(axis),
+                    RefDirection=self.y_dir
+                    # RefDirection specifies direction of local x-axis for the object.
+                    # [0,1,0] means a vector in the y direction. Since the y-axis is orthogonal to the z-axis.
+                    # So, orientation of the object will be in the xy-plane.
+                )
+            )
+
+            pipe_solid = create(
+                "IfcExtrudedAreaSolid",
+                SweptArea=self.pipe_profile,
+                Position=self.identity,
+                ExtrudedDirection=self.z_dir,
+                Depth=pipe_length
+            )
 
-        pipe.Representation = model.create_entity(
-            "IfcProductDefinitionShape",
-            Representations=[pipe_shape]
+            self._add_element(create("IfcPipeSegment", GlobalId=ifcopenshell.guid.new(),
+                                     Name=f"Pipe{wall.pipe_count}", Description=wall.name,
+                                     ObjectPlacement=pipe_placement, Representation=self.shape(pipe_solid)))
+            wall.pipe_count += 1
+
+    def emit_fittings(self, wall, fittings):
+        create = self.create
+
+        # -------- Fittings
+        for location, kind in fittings:
+            if self.fitting_shape is None:
+                sphere = create("IfcSphere", Position=self.identity, Radius=FITTING_RADIUS_CM / 100)
+                self.fitting_shape = self.shape(sphere, "CSG")
+            fitting_placement = create(
+                "IfcLocalPlacement",
+                PlacementRelTo=wall.placement,
+                RelativePlacement=create(
+                    "IfcAxis2Placement3D",
+                    Location=create("IfcCartesianPoint", Coordinates=location),
+                    Axis=self.z_dir,
+                    RefDirection=self.x_dir
+                )
+            )
+            self._add_element(create("IfcPipeFitting", GlobalId=ifcopenshell.guid.new(),
+                                     Name=f"{kind.capitalize()}{wall.fitting_count}", Description=wall.name,
+                                     ObjectPlacement=fitting_placement, Representation=self.fitting_shape,
+                                     PredefinedType=FITTING_TYPES[kind]))
+            wall.fitting_count += 1
+
+    def write(self, output_file):
+        self._contain()
+
+        # -------- Export IFC
+        self.model.write(output_file)
+
+
+class _Ref:
+    # an entity already written to the stream, referenced as #id
+    __slots__ = ('id',)
+
+    def __init__(self, id):
+        self.id = id
+
+
+_attribute_cache = {}
+
+
+def _attributes(ifc_type):
+    # STEP name and (attribute name, is enumeration) in schema order, looked up once per type
+    if ifc_type not in _attribute_cache:
+        declaration = ifcopenshell.ifcopenshell_wrapper.schema_by_name("IFC4").declaration_by_name(ifc_type)
+        attributes = []
+        for attribute in declaration.all_attributes():
+            kind = attribute.type_of_attribute()
+            is_enum = hasattr(kind, 'declared_type') and type(kind.declared_type()).__name__ == 'enumeration_type'
+            attributes.append((attribute.name(), is_enum))
+        _attribute_cache[ifc_type] = (declaration.name().upper(), attributes)
+    return _attribute_cache[ifc_type]
+
+
+def _step_real(value):
+    # shortest repr that reads back to the same double, in STEP's REAL syntax (1., 0.25, 1.E-05)
+    text = repr(float(value))
+    if 'e' in text:
+        mantissa, exponent = text.split('e')
+        return f"{mantissa if '.' in mantissa else mantissa + '.'}E{exponent}"
+    return text[:-1] if text.endswith('.0') else text
+
+
+def _step_string(value):
+    out = []
+    for ch in value:
+        if ch == "'":
+            out.append("''")
+        elif ch == '\\':
+            out.append('\\\\')
+        elif ' ' <= ch <= '~':
+            out.append(ch)
+        elif ord(ch) < 0x10000:
+            out.append(f'\\X2\\{ord(ch):04X}\\X0\\')
+        else:
+            out.append(f'\\X4\\{ord(ch):08X}\\X0\\')
+    return "'" + ''.join(out) + "'"
+
+
+def _step_value(value, is_enum=False):
+    if value is None:
+        return '$'
+    if isinstance(value, _Ref):
+        return f'#{value.id}'
+    if isinstance(value, bool):
+        return '.T.' if value else '.F.'
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        return _step_real(value)
+    if isinstance(value, str):
+        return f'.{value}.' if is_enum else _step_string(value)
+    return '(' + ','.join(_step_value(v) for v in value) + ')'
+
+
+class StreamingIfcWriter(_ModelBuilder):
+    '''
+    Same model as generate_building, written to disk entity by entity (STEP text, the same format
+    ifcopenshell writes) instead of being built in memory first. Only the shared entities and the
+    current batch of elements for the next containment relationship are kept, so memory stays
+    bounded however many pipes come in.
+
+        with StreamingIfcWriter("floor.ifc") as writer:
+            wall = writer.add_wall(wall_dim, origin=(0, 0, 0), name="North")
+            for chunk in segment_chunks:
+                writer.add_pipes(wall, chunk)
+    '''
+    containment_batch = 1000
+
+    def __init__(self, output_file, storey_name="Floor 1"):
+        self.output_file = output_file
+        self.next_id = 1
+        self.file = open(output_file, 'w')
+        stamp = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+        self.file.write(
+            "ISO-10303-21;\n"
+            "HEADER;\n"
+            "FILE_DESCRIPTION(('ViewDefinition [CoordinationView]'),'2;1');\n"
+            f"FILE_NAME({_step_string(os.path.basename(output_file))},'{stamp}',(''),(''),"
+            "'walasee generate_ifc','walasee generate_ifc','');\n"
+            "FILE_SCHEMA(('IFC4'));\n"
+            "ENDSEC;\n"
+            "DATA;\n"
         )
+        self._setup(storey_name)
+
+    def create(self, ifc_type, **attributes):
+        step_name, schema_attributes = _attributes(ifc_type)
+        unknown = set(attributes) - {name for name, _ in schema_attributes}
+        if unknown:
+            raise AttributeError(f"{ifc_type} has no attribute(s) {', '.join(sorted(unknown))}")
+        args = ','.join(_step_value(attributes.get(name), is_enum) for name, is_enum in schema_attributes)
+        ref = _Ref(self.next_id)
+        self.next_id += 1
+        self.file.write(f'#{ref.id}={step_name}({args});\n')
+        return ref
+
+    def add_wall(self, wall_dim, pipes=(), origin=(0.0, 0.0, 0.0), rotation=0.0, name="SimpleWall", fittings=False):
+        # wall_dim and pipes in cm, as for generate_from_arrays; returns the wall for add_pipes().
+        # fittings only look at the pipes given here, not at ones added later
+        return self.emit_wall(wall_geometry(wall_dim, pipes, fittings), origin, rotation, name)
+
+    def add_pipes(self, wall, pipes):
+        # more pipes of a wall (rows of x1, y1, z1, x2, y2, z2 in cm), written straight away
+        self.emit_pipes(wall, *pipe_geometry(pipes))
+
+    def close(self):
+        if self.file.closed:
+            return
+        self._contain()
+        self.file.write("ENDSEC;\nEND-ISO-10303-21;\n")
+        self.file.close()
+
+    def abort(self):
+        # a model that failed half way: close the file without finishing it and remove it
+        if not self.file.closed:
+            self.file.close()
+        if os.path.exists(self.output_file):
+            os.remove(self.output_file)
+
+    def write(self, output_file=None):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def generate_building(walls, output_file, workers=1, storey_name="Floor 1", stream=False):
+    '''
+    walls: WallSpec (or dicts with the same keys) for every wall of the floor, all written into one
+    model. Each wall's numbers are worked out first, in a process pool when workers > 1; the IFC
+    entities are then created in one pass, since an ifcopenshell model lives in one process.
+    With stream=True the entities go to disk as they are made (StreamingIfcWriter).
+    '''
+    walls = [wall if isinstance(wall, WallSpec) else WallSpec(**wall) for wall in walls]
+    dims = [wall.wall_dim for wall in walls]
+    pipes = [wall.pipes for wall in walls]
+    fittings = [wall.fittings for wall in walls]
+    builder = StreamingIfcWriter(output_file, storey_name) if stream else _ModelBuilder(storey_name)
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 and len(walls) > 1 else None
+    written = False
+    try:
+        if pool is not None:
+            geometries = pool.map(wall_geometry, dims, pipes, fittings, chunksize=max(1, len(walls) // (4 * workers)))
+        else:
+            geometries = map(wall_geometry, dims, pipes, fittings)
+        # walls are emitted in order as their geometry comes back
+        for i, (wall, geometry) in enumerate(zip(walls, geometries)):
+            builder.emit_wall(geometry, wall.origin, wall.rotation, wall.name or f"Wall{i + 1}")
+        builder.write(output_file)
+        written = True
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if stream and not written:
+            builder.abort()  # no truncated IFC left behind
 
-        pipe_counter += 1
+    print(f"IFC file created and saved as: {output_file}")
 
-    # -------- Export IFC
-    # output_dir = 'generate_ifc/output_ifc'
-    # os.makedirs(output_dir, exist_ok=True)
-    # timestamp_for_file = datetime.now().strftime("%m%d%y_%H%M")
-    # output_file = os.path.join(output_dir, f"wall_with_pipes_{timestamp_for_file}.ifc")
-    model.write(output_file)
 
-    print(f"IFC file created and saved as: {output_file}")
+def read_layout(layout_file, fittings=False):
+    # layout JSON (see the top of this file) -> storey name, WallSpecs; inputs are relative to the layout.
+    # fittings is the default for walls whose entry does not say
+    with open(layout_file, 'r') as f:
+        layout = json.load(f)
+    base = os.path.dirname(os.path.abspath(layout_file))
+    walls = []
+    for entry in layout['walls']:
+        wall_dim, pipes = read_wall(os.path.join(base, entry['input']))
+        walls.append(WallSpec(wall_dim, pipes, tuple(entry.get('origin', (0.0, 0.0, 0.0))),
+                              entry.get('rotation', 0.0), entry.get('name'), entry.get('fittings', fittings)))
+    return layout.get('name', "Floor 1"), walls
+
 
 if __name__ == "__main__":
-    generate("coordsForIfc.txt")
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input', help='coordsForifc text file, session directory, or with --building a layout JSON')
+    parser.add_argument('output')
+    parser.add_argument('--building', action='store_true', help='input is a layout of many walls')
+    parser.add_argument('--jobs', type=int, default=1, help='processes preparing wall geometry')
+    parser.add_argument('--stream', action='store_true', help='write entities to disk as they are made')
+    parser.add_argument('--fittings', action='store_true', help='add pipe fittings at elbows and tees')
+    args = parser.parse_args()
+
+    if args.building:
+        storey_name, walls = read_layout(args.input, args.fittings)
+    else:
+        storey_name, walls = "Floor 1", [WallSpec(*read_wall(args.input), name="SimpleWall", fittings=args.fittings)]
+    generate_building(walls, args.output, workers=args.jobs, storey_name=storey_name, stream=args.stream)
@@ -1,24 +1,49 @@
 from __future__ import print_function
+import argparse
 from sys import platform
 from os import makedirs
 from importlib.machinery import SourceFileLoader
 from os.path import join
 from datetime import datetime
-import matplotlib.pyplot as plt
-import plotly.graph_objects as go
+import importlib
+import threading
 import numpy as np
 import os
 
-import pipe_plotting.process_points as proc
-import generate_ifc.generate_ifc as ifc
+from scan_data.point_store import PointStore
+import scan_data.session_file as session_file
+from scan_data.raw_store import RawImageStore
+from sensor.acquisition import Acquisition, Stage
+from stage_cache import StageCache
+from preview.render_worker import PreviewWorker
+from preview.live_server import LivePreviewServer
 
 if platform == 'win32':
     modulePath = join('C:/', 'Program Files', 'Walabot', 'WalabotSDK', 'python', 'WalabotAPI.py')
 elif platform.startswith('linux'):
     modulePath = join('/usr', 'share', 'walabot', 'python', 'WalabotAPI.py')
 
-wlbt = SourceFileLoader('WalabotAPI', modulePath).load_module()
-wlbt.Init()
+
+# plotting and ifc libraries, imported on first use; warm_up() loads them while the operator is busy
+# with the first prompts (a first use before it is done just waits for that import)
+LAZY_MODULES = ('preview.scatter_preview', 'session_pipeline', 'plotly.graph_objects')
+
+
+def warm_up():
+    def run():
+        for name in LAZY_MODULES:
+            importlib.import_module(name)
+    thread = threading.Thread(target=run, name='warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def load_sdk():
+    # WALABOT_API=sensor/fake_walabot.py runs the scan loop without the sensor
+    wlbt = SourceFileLoader('WalabotAPI', os.environ.get('WALABOT_API', modulePath)).load_module()
+    wlbt.Init()
+    return wlbt
+
 
 # set up directories, files, and locations
 timestamp_for_file = datetime.now().strftime("%m%d%y_%H%M")
@@ -26,6 +51,23 @@ output_dir1 = 'walabotOut_txt'
 makedirs(output_dir1, exist_ok=True)
 unprocessed_filename = join(output_dir1, f'walabotOut_{timestamp_for_file}.txt')
 cleaned_filename = join(output_dir1, f'walabotClean_{timestamp_for_file}.txt')
+session_dirname = join(output_dir1, f'walabotSession_{timestamp_for_file}')
+
+# option "3" works in memory; set to also write the cleaned points, segments and ifc coordinates as text
+WRITE_DEBUG_TEXT = False
+# option "3" also adds a pipe fitting (IfcPipeFitting) at every elbow and tee of the ifc model
+IFC_FITTINGS = False
+# option "3" merges the repeated targets of each spot into one amplitude-weighted point (scan_data/fusion.py)
+# before looking for pipes; helps when the sensor was held still for several triggers
+FUSE_READINGS = False
+# option "3" looks for pipes in the cells of an occupancy grid of every reading, the "No Target Detected"
+# ones included (scan_data/occupancy.py), instead of in the raw targets; takes precedence over FUSE_READINGS
+OCCUPANCY_GRID = False
+# also keep the raw energy image of every trigger in the session directory (scan_data/raw_store.py):
+# None, 'slice' (GetRawImageSlice) or 'image' (GetRawImage, the whole 3D arena)
+RECORD_RAW_IMAGES = None
+# longest wait (s) for the scan after Enter; a sensor that stopped answering raises instead of hanging
+CAPTURE_TIMEOUT_S = 10.0
 
 output_dir2 = 'pipe_plotting/pipeOut_txt'
 makedirs(output_dir2, exist_ok=True)
@@ -43,26 +85,16 @@ output_dir5 = 'generate_ifc/output_ifc'
 makedirs(output_dir5, exist_ok=True)
 ifc_filename = join(output_dir5, f"wall_with_pipes_{timestamp_for_file}.ifc")
 
+# every reading of this session, in memory; walabotOut_*.txt is only kept as a journal
+store = PointStore()
+# results of option "3" by input hash; pressing "3" again without new triggers reuses them
+stage_cache = StageCache()
+# 2D preview figure, created on first use and reused for every trigger (only touched by the preview thread)
+scatter_preview = None
 
-def read_data(filename):
-    x, y, z, is_hit = [], [], [], []
-    with open(filename, 'r') as f:
-        for line in f:
-            if line.strip().startswith("x:") or "No Target Detected at" in line:
-                parts = line.replace("cm", "").replace("No Target Detected at ", "").split(",")
-                try:
-                    x_val = float(parts[0].split(":")[1].strip())
-                    y_val = float(parts[1].split(":")[1].strip())
-                    z_val = float(parts[2].split(":")[1].strip())
-                    x.append(x_val)
-                    y.append(y_val)
-                    z.append(z_val)
-                    is_hit.append("a:" in line)
-                except:
-                    continue
-    return np.array(x), np.array(y), np.array(z), np.array(is_hit)
 
 def plot_data_plotly(x, y, z, is_hit, save_path):
+    import plotly.graph_objects as go
     colors = np.where(is_hit, 'red', 'gray')
     fig = go.Figure(data=[go.Scatter3d(
         x=x, y=y, z=z,
@@ -79,44 +111,61 @@ def plot_data_plotly(x, y, z, is_hit, save_path):
     print(f"3D plot saved as: {save_path}")
 
 def plot_data_matplotlib(x, y, is_hit, save_path):
-    plt.figure(figsize=(10, 6))
-    for xi, yi, hit in zip(x, y, is_hit):
-        color = 'red' if hit else 'gray'
-        plt.scatter(xi, yi, c=color, marker='o')
-    plt.title('2D Visualization of Walabot Readings')
-    plt.xlabel('X Axis')
-    plt.ylabel('Y Axis')
-    plt.grid(True)
-    plt.savefig(save_path, dpi=300)
-    plt.close()
+    global scatter_preview
+    if scatter_preview is None:
+        from preview.scatter_preview import ScatterPreview
+        scatter_preview = ScatterPreview()
+    scatter_preview.update(x, y, is_hit)
+    scatter_preview.save(save_path)
     print(f"2D plot saved as: {save_path}")
 
-def PrintSensorTargets(targets, xL, yL):
+def render_previews(x, y, z, is_hit):
+    # the 3D view is live in the browser (LivePreviewServer); its HTML file is only written at the end
+    outputs_dir = "walabotOut_plots"
+    os.makedirs(outputs_dir, exist_ok=True)
+    plot_data_matplotlib(x, y, is_hit, f"{outputs_dir}/{timestamp_for_file}.png")
+
+def PrintSensorTargets(targets, xL, yL, trigger=0, row=0):
+    lines = []
+    if targets:
+        xVals = [xL + target.xPosCm for target in targets]
+        yVals = [yL - target.yPosCm for target in targets]
+        zVals = [target.zPosCm for target in targets]
+        aVals = [target.amplitude for target in targets]
+        store.append(xVals, yVals, zVals, aVals, True, trigger, row)
+        for xVal, yVal, zVal, aVal in zip(xVals, yVals, zVals, aVals):
+            lines.append(f"x: {xVal} cm, y: {yVal} cm, z: {zVal} cm, a: {aVal} cm")
+    else:
+        xVal = xL
+        yVal = yL
+        store.append(xVal, yVal, 0.0, np.nan, False, trigger, row)
+        lines.append(f"No Target Detected at x: {xVal} cm, y: {yVal} cm, z: 0.0 cm")
+
+    # write-behind journal of the readings already in the store
     with open(unprocessed_filename, 'a') as f:
-        if targets:
-            for target in targets:
-                xVal = xL + target.xPosCm
-                yVal = yL - target.yPosCm
-                line = f"x: {xVal} cm, y: {yVal} cm, z: {target.zPosCm} cm, a: {target.amplitude} cm"
-                print(line)
-                f.write(line + '\n')
-        else:
-            xVal = xL
-            yVal = yL
-            line = f"No Target Detected at x: {xVal} cm, y: {yVal} cm, z: 0.0 cm"
+        for line in lines:
             print(line)
             f.write(line + '\n')
 
-def InWallApp():
+def InWallApp(sdk=None, read_input=input):
+    # sdk: a loaded WalabotAPI (load_sdk() if None); read_input: where the operator's answers come
+    # from. sensor/replay.py passes a recording and a script for both
+    warm_up()
     xArenaMin, xArenaMax, xArenaRes = -3, 4, 0.5
     yArenaMin, yArenaMax, yArenaRes = -6, 4, 0.5
     zArenaMin, zArenaMax, zArenaRes = 3, 8, 0.5
     xLength = -xArenaMin
     yLength = 0
+    trigger = 0  # number of recorded wall images
+    row = 0  # number of "start a new y line"
     print("Please enter desired spacing: ")
-    xspacing = input()
+    xspacing = read_input()
     xspacing = float(xspacing)
     first = True
+    # the SDK is only loaded once the operator is ready to scan
+    wlbt = sdk if sdk is not None else load_sdk()
+    arena = {'x': [xArenaMin, xArenaMax, xArenaRes], 'y': [yArenaMin, yArenaMax, yArenaRes],
+             'z': [zArenaMin, zArenaMax, zArenaRes], 'threshold': 80}
 
     wlbt.Initialize()
     wlbt.ConnectAny()
@@ -128,132 +177,134 @@ def InWallApp():
     wlbt.SetThreshold(80)
     wlbt.Start()
 
-    print("Type C to calibrate")
-    response = input()
-    if response.lower() == "c":
-        wlbt.StartCalibration()
-        while wlbt.GetStatus()[0] == wlbt.STATUS_CALIBRATING:
-            wlbt.Trigger()
-
-    while True:
-        print("Press Enter to record wall image\n2: start a new y line\n3: generate ifc\n4: end program")
-        response = input()
-
-        if response == "":
-            if not first:
-                xLength += float(xspacing)
-            first = False
-            wlbt.Trigger()
-            targets = wlbt.GetImagingTargets()
-            wlbt.GetRawImageSlice()
-            PrintSensorTargets(targets, xLength, yLength)
-
-            x, y, z, is_hit = read_data(unprocessed_filename)
-            outputs_dir = "walabotOut_plots"
-            os.makedirs(outputs_dir, exist_ok=True)
-            plot_data_matplotlib(x, y, is_hit, f"{outputs_dir}/{timestamp_for_file}.png")
-            plot_data_plotly(x, y, z, is_hit, f"{outputs_dir}/{timestamp_for_file}.html")
-
-        elif response == "2":
-            # Don't click enter until the Walabot is in proper position
-            print("Specify height you are moving by on wall. Use negative to indicate moving down")
-            yChange = input()
-            yLength += float(yChange)
-            xLength = -xArenaMin
-            wlbt.Trigger()
-            targets = wlbt.GetImagingTargets()
-            wlbt.GetRawImageSlice()
-            PrintSensorTargets(targets, xLength, yLength)
-
-            x, y, z, is_hit = read_data(unprocessed_filename)
-            outputs_dir = "walabotOut_plots"
-            os.makedirs(outputs_dir, exist_ok=True)
-            plot_data_matplotlib(x, y, is_hit, f"{outputs_dir}/{timestamp_for_file}.png")
-            plot_data_plotly(x, y, z, is_hit, f"{outputs_dir}/{timestamp_for_file}.html")
-            
-
-        elif response == "3":
-            # -------------- The action -> and the file that's outputted from that action
-            # 1) Clean data txt file, aka removes "No Target Detected" -> 'walabotOut_txt/walaboutClean_{time}.txt'
-            # 2) Run cleaned data through ML pipe_plotting/process_points.py -> 'pipe_plotting/pass3_final.txt'
-            # 3) Reformat 'pass3_final.txt' to use for IFC generation -> 'generate_ifc/coordinates/coordsForIfc_{time}.txt'
-            # 4) Run reformatted data through generate_ifc/generate_ifc.py -> 'generate_ifc/outputted_ifc/wall_with_pipes_{time}.txt'
-
-            # read uncleaned data
-            x, y, z, is_hit = read_data(unprocessed_filename)
-
-            # transforms -y to +y and make so min(y) is always 0
-            low_y = min(y)
-            if low_y < 0:
-                for i in range(len(y)):
-                    y[i] -= low_y
-
-            # before data is cleaned and after y all made positive, grab the max xyz of all data collected (even if no target) to get wall dimensions
-            wall_dim = (max(x), max(y), max(z) - 6) #max(z) always 8, so subtract 6 to get 2cm thick wall
-
-            # clean the unprocessed data by getting rid of No Target Detected x: y: z: cm, and a: with anything after it
-            with open(unprocessed_filename, "r") as infile, open(cleaned_filename, "w") as outfile:
-                for line in infile:
-                    # Skip lines containing "No Target Detected"
-                    if "No Target Detected" in line:
-                        continue                    
-                    cleaned_line = (
-                        line.split("a:")[0]  # Remove "a:" and anything after it
-                            .replace("x: ", "")
-                            .replace(" y:", "")
-                            .replace(" z:", "")
-                            .replace("cm", "")
-                            .strip()
-                    )           
-                    outfile.write(cleaned_line + "\n")
-
-            # Input cleaned data through ML algorithm
-            proc.run_all(cleaned_filename, processed_filename, processed_plot_png) #saves ML processed points as /pipe_plotting/segments_{time}.txt
-
-            # reformat segments.txt for ifcCoords.txt, aka make all negative y positive
-            with open(processed_filename, 'r') as infile, open(ifcCoords_filename, 'w') as outfile:
-                # Write in wall dimensions that were collected a little earlier in this program file
-                line = f'WALL, {wall_dim[0]}, {wall_dim[1]}, {wall_dim[2]}'
-                outfile.write(line + '\n')
-
-                lines = infile.readlines()
-                y_values = []
-
-                # Collect all y1 and y2 values to determine the minimum y
-                for line in lines:
-                    parts = line.strip().split(',')
-                    y1 = float(parts[1])
-                    y2 = float(parts[4])
-                    y_values.extend([y1, y2])
-
-                # Find the minimum y value
-                low_y = min(y_values)
-
-                # If the minimum y is negative, adjust all y values
-                for line in lines:
-                    parts = line.strip().split(',')
-                    x1, y1, z1, x2, y2, z2 = map(float, parts)
-
-                    if low_y < 0:
-                        y1 -= low_y
-                        y2 -= low_y
-
-                    # Write the adjusted line to the output file
-                    outfile.write(f"PIPE, {x1}, {y1}, {z1}, {x2}, {y2}, {z2}\n")
-
-            # Input reformatted data into ifc generation program
-            ifc.generate(ifcCoords_filename, ifc_filename)
-
-        elif response == "4":
-            break
-
-        else:
-            print("Please type a valid input.")
-
-    wlbt.Stop()
-    wlbt.Disconnect()
-    wlbt.Clean()
+    raw_store = RawImageStore(session_dirname, RECORD_RAW_IMAGES, arena) if RECORD_RAW_IMAGES else None
+
+    # plots are drawn in the background; only the newest data is drawn if triggers come in quickly
+    previews = PreviewWorker(render_previews)
+    # the 3D view: a local page that receives only the newly added points after each trigger
+    live = LivePreviewServer(store).start()
+    print(f"Live 3D preview at {live.url}")
+    acquisition = recorder = None
+
+    def record(frame, xL, yL, trigger, row):
+        if raw_store is not None:
+            raster, power, depth, energy = frame.raw
+            raw_store.append(raster, trigger, row, xL, yL, power, depth, energy)
+        PrintSensorTargets(frame.targets, xL, yL, trigger, row)
+
+        # store columns are append-only, so they are a safe snapshot for the preview thread
+        previews.submit(*store.columns())
+        live.notify()
+
+    def capture():
+        # the scan for this Enter, or None if the sensor failed (reported, nothing is recorded)
+        try:
+            return acquisition.capture(CAPTURE_TIMEOUT_S)
+        except (TimeoutError, RuntimeError) as e:
+            print(f"Walabot scan failed, nothing recorded: {e}\nPress Enter to try again")
+            return None
+
+    # whatever goes wrong, the session recorded so far is saved and the sensor is stopped
+    try:
+        print("Type C to calibrate")
+        response = read_input()
+        if response.lower() == "c":
+            wlbt.StartCalibration()
+            while wlbt.GetStatus()[0] == wlbt.STATUS_CALIBRATING:
+                wlbt.Trigger()
+
+        # the sensor keeps triggering and getting on its own threads; Enter only waits for the next scan
+        acquisition = Acquisition(wlbt, raw_mode=RECORD_RAW_IMAGES).start()
+        # logging, raw images and previews of each trigger are written in the background, in order
+        recorder = Stage(record, name='recorder')
+
+        while True:
+            print("Press Enter to record wall image\n2: start a new y line\n3: generate ifc\n4: end program")
+            response = read_input()
+
+            if response == "":
+                # the position only moves on once the image there is recorded
+                xNext = xLength if first else xLength + float(xspacing)
+                frame = capture()
+                if frame is None:
+                    continue
+                xLength, first = xNext, False
+                recorder.submit(frame, xLength, yLength, trigger, row)
+                trigger += 1
+
+            elif response == "2":
+                # Don't click enter until the Walabot is in proper position
+                print("Specify height you are moving by on wall. Use negative to indicate moving down")
+                yChange = read_input()
+                yLength += float(yChange)
+                xLength = -xArenaMin
+                row += 1
+                # if this scan fails, the next Enter records the start of the new line
+                first = True
+                frame = capture()
+                if frame is not None:
+                    first = False
+                    recorder.submit(frame, xLength, yLength, trigger, row)
+                    trigger += 1
+
+            elif response == "3":
+                # -------------- The action -> and the file that's outputted from that action
+                # 1) Clean data txt file, aka removes "No Target Detected" -> 'walabotOut_txt/walaboutClean_{time}.txt'
+                # 2) Run cleaned data through ML pipe_plotting/process_points.py -> 'pipe_plotting/pass3_final.txt'
+                # 3) Reformat 'pass3_final.txt' to use for IFC generation -> 'generate_ifc/coordinates/coordsForIfc_{time}.txt'
+                # 4) Run reformatted data through generate_ifc/generate_ifc.py -> 'generate_ifc/outputted_ifc/wall_with_pipes_{time}.txt'
+
+                # all of it runs on the store's arrays; the text files are only written with WRITE_DEBUG_TEXT
+                from session_pipeline import run_pipeline
+                recorder.drain()
+                x, y, z, is_hit = store.columns()
+                debug = None
+                if WRITE_DEBUG_TEXT:
+                    debug = {'clean': cleaned_filename, 'segments': processed_filename, 'ifc_coords': ifcCoords_filename}
+
+                # binary copy of the session, kept with its pipes for later reprocessing
+                session_file.save_session(session_dirname, store, arena=arena, spacing=xspacing)
+
+                wall_dim, pipes = run_pipeline(x, y, z, is_hit, ifc_filename, processed_plot_png, debug, stage_cache,
+                                               fittings=IFC_FITTINGS, fuse=FUSE_READINGS,
+                                               amplitude=store.amplitude, trigger=store.trigger,
+                                               occupancy_grid=OCCUPANCY_GRID)
+                session_file.save_segments(session_dirname, pipes, wall_dim)
+
+            elif response == "4":
+                break
+
+            else:
+                print("Please type a valid input.")
+
+    finally:
+        if acquisition is not None:
+            acquisition.stop()
+        if recorder is not None:
+            recorder.close()  # runs every record still queued
+        session_file.save_session(session_dirname, store, arena=arena, spacing=xspacing)
+        previews.close()
+        live.close()
+        if raw_store is not None:
+            raw_store.close()
+        # standalone copy of the 3D view for the record
+        outputs_dir = "walabotOut_plots"
+        os.makedirs(outputs_dir, exist_ok=True)
+        x, y, z, is_hit = store.columns()
+        plot_data_plotly(x, y, z, is_hit, f"{outputs_dir}/{timestamp_for_file}.html")
+        wlbt.Stop()
+        wlbt.Disconnect()
+        wlbt.Clean()
     print('Terminated successfully')
 
 if __name__ == '__main__':
-    InWallApp()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--replay', metavar='RECORDING',
+                        help='run on an archived walabotOut_*.txt log or walabotSession_* without the Walabot')
+    args = parser.parse_args()
+
+    if args.replay:
+        from sensor.replay import replay
+        replay(args.replay, InWallApp)
+    else:
+        InWallApp()
@@ -0,0 +1,207 @@
+'''
+Density clustering backend for process_points (extract_segments(..., clustering='dbscan')).
+
+The default 'axis' clustering of process_points groups points that share a column (x within
+X_TOLERANCE) or a row, so it only finds horizontal and vertical pipes and puts two pipes in the
+same column into one. Here the points are clustered by DBSCAN in the wall plane (or in 3-D) and
+every cluster is fitted with a straight segment by PCA:
+
+    GridIndex   points bucketed by a hash of their grid cell (cell = eps); the neighbours of a point
+                are in the 3^d cells around it, so every pair within eps is found by a few sorted
+                lookups per cell offset instead of comparing all pairs
+    dbscan()    core points (>= min_samples neighbours, itself included) joined by union-find over
+                core-core pairs, border points take the cluster of a core neighbour, the rest is
+                noise (-1); all of it vectorized over the pair arrays
+    straight_runs()
+                a cluster (an elbow, a tee, a crooked run) cut into straight pieces by a Hough
+                vote over line angle and offset, best line first
+    fit_segments / density_segments
+                principal axis of every piece (all pieces in one vectorized pass), ends at the
+                extreme projections
+
+The cost is O(n + pairs): near-linear for scan points, which are never denser than a few per cm.
+Segments within AXIS_DEGREES of horizontal or vertical come back in process_points' step 3 row
+format so steps 4-6 (snap, straighten, align) still apply; the others are returned as is.
+'''
+
+import itertools
+import numpy as np
+
+EPS_CM = 3.0  # neighbourhood radius (a little more than the scan spacing along a pipe)
+MIN_SAMPLES = 2  # points within EPS_CM (itself included) that make a core point
+LINE_WIDTH_CM = 3.0  # width of the band of points taken as one straight pipe
+HOUGH_DEGREES = 2.0  # angle step of the line search
+AXIS_DEGREES = 10.0  # segments closer than this to an axis are made horizontal/vertical
+
+
+class GridIndex:
+    def __init__(self, points, cell):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.cell = float(cell)
+        n, dims = self.points.shape
+        cells = np.floor(self.points / self.cell).astype(np.int64)
+        self.low = cells.min(axis=0) if n else np.zeros(dims, dtype=np.int64)
+        cells -= self.low
+        # one more cell on each side so a neighbour offset never wraps around in the hash
+        self.shape = tuple(int(v) for v in (cells.max(axis=0) + 3 if n else np.ones(dims, dtype=np.int64)))
+        keys = np.ravel_multi_index((cells + 1).T, self.shape)
+        self.order = np.argsort(keys, kind='stable')
+        self.keys, self.starts, self.counts = np.unique(keys[self.order], return_index=True, return_counts=True)
+
+    def pairs(self, radius):
+        '''
+        Every ordered pair (i, j), i != j, of points at most radius apart (radius <= cell), as two
+        index arrays. Built one cell offset at a time, so memory stays O(pairs).
+        '''
+        dims = len(self.shape)
+        cell_coords = np.stack(np.unravel_index(self.keys, self.shape), axis=1)
+        found_i, found_j = [], []
+        for offset in itertools.product((-1, 0, 1), repeat=dims):
+            neighbour = np.ravel_multi_index((cell_coords + offset).T, self.shape)
+            at = np.searchsorted(self.keys, neighbour)
+            at[at == len(self.keys)] = 0
+            hit = np.flatnonzero(self.keys[at] == neighbour)
+            if len(hit) == 0:
+                continue
+            # every member of cell a against every member of its neighbour b
+            a, b = hit, at[hit]
+            na, nb = self.counts[a], self.counts[b]
+            sizes = na * nb
+            pair = np.repeat(np.arange(len(a)), sizes)
+            local = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            i = self.order[self.starts[a][pair] + local // nb[pair]]
+            j = self.order[self.starts[b][pair] + local % nb[pair]]
+            near = (i != j) & (((self.points[i] - self.points[j]) ** 2).sum(axis=1) <= radius * radius)
+            found_i.append(i[near])
+            found_j.append(j[near])
+        if not found_i:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+        return np.concatenate(found_i), np.concatenate(found_j)
+
+
+def _roots(parent):
+    # point every entry at the root of its tree
+    while True:
+        grand = parent[parent]
+        if np.array_equal(grand, parent):
+            return parent
+        parent = grand
+
+
+def dbscan(points, eps=EPS_CM, min_samples=MIN_SAMPLES):
+    # cluster label of every point (0, 1, ...), -1 for noise
+    points = np.asarray(points, dtype=np.float64)
+    n = len(points)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    i, j = GridIndex(points, eps).pairs(eps)
+    core = np.bincount(i, minlength=n) + 1 >= min_samples
+
+    # ---- union-find over core-core pairs: hook the larger root under the smaller, compress ----
+    parent = np.arange(n)
+    both = core[i] & core[j]
+    a, b = i[both], j[both]
+    while len(a):
+        ra, rb = parent[a], parent[b]
+        differ = ra != rb
+        if not differ.any():
+            break
+        np.minimum.at(parent, np.maximum(ra, rb)[differ], np.minimum(ra, rb)[differ])
+        parent = _roots(parent)
+        a, b = a[differ], b[differ]
+
+    # ---- border points join a core neighbour's cluster; the rest is noise ----
+    labels = np.where(core, parent, -1)
+    border = ~core[i] & core[j]
+    labels[i[border]] = parent[j[border]]
+    clustered = labels >= 0
+    labels[clustered] = np.unique(labels[clustered], return_inverse=True)[1].ravel()
+    return labels
+
+
+def straight_runs(points, eps=EPS_CM):
+    '''
+    Pieces of one cluster that each lie on a straight line: the line through the most points is
+    found by a Hough vote (every point votes for the LINE_WIDTH_CM wide band through it at every
+    HOUGH_DEGREES angle), its points are taken out, split where they are more than eps apart along
+    the line, and the rest is voted on again. Elbows, tees and crosses come apart into their arms.
+    '''
+    theta = np.radians(np.arange(0, 180, HOUGH_DEGREES))
+    normals = np.stack([np.cos(theta), np.sin(theta)])  # (2, angles)
+    runs = []
+    rest = points
+    while len(rest) >= 2:
+        rho = rest[:, :2] @ normals  # (n, angles) distance of every point from the origin, per angle
+        band = np.floor(rho / LINE_WIDTH_CM).astype(np.int64)
+        band -= band.min(axis=0)
+        width = band.max() + 1
+        votes = np.bincount((band + np.arange(len(theta)) * width).ravel(), minlength=len(theta) * width)
+        best = int(np.argmax(votes))
+        angle, peak = divmod(best, width)
+        if votes[best] < 2:
+            break
+        # re-centre the band on its points, so a pipe straddling two bands is not cut in two
+        centre = np.median(rho[band[:, angle] == peak, angle])
+        inliers = np.abs(rho[:, angle] - centre) <= LINE_WIDTH_CM / 2
+        line = rest[inliers]
+        direction = np.array([-normals[1, angle], normals[0, angle]])
+        along = line[:, :2] @ direction
+        order = np.argsort(along)
+        gaps = np.flatnonzero(np.diff(along[order]) > eps) + 1
+        runs += [piece for piece in np.split(line[order], gaps) if len(piece) >= 2]
+        rest = rest[~inliers]
+    return runs
+
+
+def fit_segments(pieces):
+    '''
+    Principal axis of every piece at once (means, 2x2 covariances and their angle from bincount
+    sums). Returns centre (k, 2), direction (k, 2), low / high ends of every piece along it,
+    the x and y range and the mean z of every piece.
+    '''
+    sizes = np.array([len(piece) for piece in pieces])
+    ids = np.repeat(np.arange(len(pieces)), sizes)
+    starts = np.cumsum(sizes) - sizes
+    points = np.concatenate(pieces)
+    mean = np.stack([np.bincount(ids, points[:, i]) / sizes for i in range(3)], axis=1)
+    dx, dy = (points[:, :2] - mean[ids, :2]).T
+    cxx, cyy, cxy = (np.bincount(ids, v) / sizes for v in (dx * dx, dy * dy, dx * dy))
+    angle = 0.5 * np.arctan2(2 * cxy, cxx - cyy)  # of the larger eigenvector
+    direction = np.stack([np.cos(angle), np.sin(angle)], axis=1)
+    along = dx * direction[ids, 0] + dy * direction[ids, 1]
+    low, high = np.minimum.reduceat(along, starts), np.maximum.reduceat(along, starts)
+    x_range = np.minimum.reduceat(points[:, 0], starts), np.maximum.reduceat(points[:, 0], starts)
+    y_range = np.minimum.reduceat(points[:, 1], starts), np.maximum.reduceat(points[:, 1], starts)
+    return mean[:, :2], direction, low, high, x_range, y_range, mean[:, 2]
+
+
+def density_segments(points, min_length, eps=EPS_CM, min_samples=MIN_SAMPLES, dims=2):
+    '''
+    (n, 3) hit points -> (rows, oblique). rows: [x1, y1, x2, y2, z1, z2, is_vertical] of the
+    pieces within AXIS_DEGREES of an axis (process_points' step 3 format); oblique: (k, 6)
+    x1, y1, z1, x2, y2, z2 of the others. dims 2 clusters on x/y, 3 on x/y/z. Segments shorter
+    than min_length are dropped.
+    '''
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    labels = dbscan(points[:, :dims], eps, min_samples)
+    order = np.argsort(labels, kind='stable')
+    bounds = np.flatnonzero(np.diff(labels[order], prepend=-2, append=-2))
+    pieces = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        if labels[order[start]] >= 0:
+            pieces += straight_runs(points[order[start:stop]], eps)
+    if not pieces:
+        return [], np.empty((0, 6))
+
+    centre, direction, low, high, (x_low, x_high), (y_low, y_high), z_val = fit_segments(pieces)
+    tolerance = np.sin(np.radians(AXIS_DEGREES))
+    rows, oblique = [], []
+    for k in np.flatnonzero(high - low >= min_length):
+        if abs(direction[k, 0]) <= tolerance:
+            rows.append([centre[k, 0], y_low[k], centre[k, 0], y_high[k], z_val[k], z_val[k], True])
+        elif abs(direction[k, 1]) <= tolerance:
+            rows.append([x_low[k], centre[k, 1], x_high[k], centre[k, 1], z_val[k], z_val[k], False])
+        else:
+            (x1, y1), (x2, y2) = centre[k] + low[k] * direction[k], centre[k] + high[k] * direction[k]
+            oblique.append([x1, y1, z_val[k], x2, y2, z_val[k]])
+    return rows, np.array(oblique, dtype=np.float64).reshape(-1, 6)
@@ -0,0 +1,182 @@
+'''
+Pipe network of the segments from process_points (rows x1, y1, z1, x2, y2, z2): every distinct
+segment endpoint is a node, every piece of a segment between two nodes an edge.
+
+Endpoints are the same node when their x and y agree to NODE_DECIMALS decimals (the rounding
+step 6 of process_points aligns corners with); a node's z is the mean z of the endpoints at it.
+A pipe ending part way along another (a T-contact: the endpoint within CONTACT_CM of the other
+pipe in x-y) cuts that pipe in two there, so the stem and both halves meet at one node, a tee.
+This is what finds the tees once step 6b has merged the pieces of a straight run into one pipe.
+Adjacency is stored CSR style: the edges at node i are incident[indptr[i]:indptr[i + 1]], so
+walking the network, finding connected runs and summing their lengths are all O(edges).
+
+    network = build_network(segments)
+    kinds = junction_types(network)               # index into JUNCTIONS, per node
+    runs, n_runs = connected_runs(network)        # run of every edge
+    lengths = run_lengths(network, runs, n_runs)  # total pipe length (cm) of every run
+'''
+
+import numpy as np
+from collections import namedtuple
+
+NODE_DECIMALS = 3
+CONTACT_CM = 1e-3  # an endpoint this close to another pipe, away from its ends, is a T-contact
+COLLINEAR_COS = 1 - 1e-6  # two pipes leaving a node this close to opposite directions are one straight run
+
+END, COUPLING, ELBOW, TEE, CROSS = range(5)
+JUNCTIONS = ('end', 'coupling', 'elbow', 'tee', 'cross')
+
+# nodes: (n, 3) x, y, z; edges: (m, 2) node of each end; indptr: (n + 1,), incident: (2m,) edge ids
+# grouped by node; lengths: (m,) length of every edge; segment: (m,) segment every edge is a piece of
+# (non-decreasing, edge k is segment k when no segment was cut)
+PipeNetwork = namedtuple('PipeNetwork', ['nodes', 'edges', 'indptr', 'incident', 'lengths', 'segment'])
+
+
+def _contacts(segments):
+    # (segment, endpoint, t) of every endpoint lying on a segment in x-y strictly between its ends,
+    # t the fraction of the way along it. Candidates are the endpoints inside the segment's box
+    # along its narrower side (y for a horizontal pipe, x for a vertical one), found by binary
+    # search in the endpoints sorted by that coordinate, so axis-aligned pipes cost O(m log m)
+    ends = segments.reshape(-1, 3)[:, :2]
+    start = segments[:, :2]
+    delta = segments[:, 3:5] - start
+    length = np.linalg.norm(delta, axis=1)
+    low = np.minimum(start, segments[:, 3:5]) - CONTACT_CM
+    high = np.maximum(start, segments[:, 3:5]) + CONTACT_CM
+    narrow = (high - low).argmin(axis=1)
+
+    found_s, found_e = [], []
+    for axis in (0, 1):
+        seg = np.flatnonzero(narrow == axis)
+        order = np.argsort(ends[:, axis], kind='stable')
+        values = ends[order, axis]
+        first = np.searchsorted(values, low[seg, axis], 'left')
+        count = np.searchsorted(values, high[seg, axis], 'right') - first
+        local = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        found_s.append(np.repeat(seg, count))
+        found_e.append(order[np.repeat(first, count) + local])
+    s, e = np.concatenate(found_s), np.concatenate(found_e)
+
+    rel = ends[e] - start[s]
+    t = (rel * delta[s]).sum(axis=1) / np.maximum(length[s] ** 2, np.finfo(np.float64).tiny)
+    off = rel - t[:, None] * delta[s]
+    along = t * length[s]
+    inside = ((off ** 2).sum(axis=1) <= CONTACT_CM ** 2) & (along > CONTACT_CM)
+    inside &= along < length[s] - CONTACT_CM
+    return s[inside], e[inside], t[inside]
+
+
+def split_at_contacts(segments):
+    '''
+    Every segment cut at the T-contacts on it, at the touching endpoint's x and y (z along the
+    segment). Returns the (m', 6) pieces, in segment order, and the segment of every piece.
+    '''
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 6)
+    s, e, t = _contacts(segments)
+    if len(s) == 0:
+        return segments, np.arange(len(segments))
+    ends = segments.reshape(-1, 3)
+    cut = np.column_stack([ends[e, :2], segments[s, 2] + t * (segments[s, 5] - segments[s, 2])])
+
+    # one cut per distinct point of a segment, in order along it
+    _, first = np.unique(np.column_stack([s, np.round(cut[:, :2], NODE_DECIMALS)]), axis=0, return_index=True)
+    order = first[np.lexsort((t[first], s[first]))]
+    s, cut = s[order], cut[order]
+
+    # every segment as a chain: start, its cuts, end; a piece between each consecutive pair
+    n_cuts = np.bincount(s, minlength=len(segments))
+    chain_start = np.cumsum(n_cuts + 2) - (n_cuts + 2)
+    chain = np.empty((int(chain_start[-1] + n_cuts[-1] + 2), 3))
+    chain[chain_start] = segments[:, :3]
+    chain[chain_start + n_cuts + 1] = segments[:, 3:]
+    rank = np.arange(len(s)) - (np.cumsum(n_cuts) - n_cuts)[s]
+    chain[chain_start[s] + 1 + rank] = cut
+    last = np.zeros(len(chain), dtype=bool)
+    last[chain_start + n_cuts + 1] = True
+    at = np.flatnonzero(~last)
+    return np.hstack([chain[at], chain[at + 1]]), np.repeat(np.arange(len(segments)), n_cuts + 1)
+
+
+def build_network(segments):
+    segments, segment = split_at_contacts(segments)
+    ends = segments.reshape(-1, 3)  # endpoint 2k and 2k + 1 belong to edge k
+
+    keys, node_of_end = np.unique(np.round(ends[:, :2], NODE_DECIMALS), axis=0, return_inverse=True)
+    node_of_end = node_of_end.reshape(-1)
+    n_nodes = len(keys)
+    count = np.bincount(node_of_end, minlength=n_nodes)
+    z = np.bincount(node_of_end, weights=ends[:, 2], minlength=n_nodes) / np.maximum(count, 1)
+    nodes = np.column_stack([keys, z]) if n_nodes else np.empty((0, 3))
+
+    edges = node_of_end.reshape(-1, 2)
+    indptr = np.concatenate([[0], np.cumsum(count)])
+    incident = np.argsort(node_of_end, kind='stable') // 2
+    lengths = np.linalg.norm(segments[:, 3:] - segments[:, :3], axis=1)
+    return PipeNetwork(nodes, edges, indptr, incident, lengths, segment)
+
+
+def degrees(network):
+    return np.diff(network.indptr)
+
+
+def junction_types(network):
+    # one of END, COUPLING, ELBOW, TEE, CROSS per node, by how many pipes meet there and, for two,
+    # whether they continue straight on
+    degree = degrees(network)
+    kinds = np.full(len(degree), CROSS, dtype=np.int8)
+    kinds[degree <= 3] = TEE
+    kinds[degree <= 2] = ELBOW
+    kinds[degree <= 1] = END
+
+    two = np.flatnonzero(degree == 2)
+    if len(two):
+        first = network.incident[network.indptr[two]]
+        second = network.incident[network.indptr[two] + 1]
+        cos = np.einsum('ij,ij->i', _heading(network, two, first), _heading(network, two, second))
+        kinds[two[cos <= -COLLINEAR_COS]] = COUPLING
+    return kinds
+
+
+def _heading(network, node, edge):
+    # unit vector in the x-y plane from node along edge
+    edges = network.edges[edge]
+    other = np.where(edges[:, 0] == node, edges[:, 1], edges[:, 0])
+    delta = network.nodes[other, :2] - network.nodes[node, :2]
+    norm = np.linalg.norm(delta, axis=1)
+    return delta / np.maximum(norm, np.finfo(np.float64).tiny)[:, None]
+
+
+def connected_runs(network):
+    # label every edge with the connected run (component) it belongs to, by depth-first search over
+    # the CSR adjacency. Returns (run of every edge, number of runs)
+    indptr = network.indptr.tolist()
+    incident = network.incident.tolist()
+    edges = network.edges.tolist()
+    run_of_node = [-1] * len(indptr[:-1])
+    n_runs = 0
+    for start in range(len(run_of_node)):
+        if run_of_node[start] >= 0:
+            continue
+        run_of_node[start] = n_runs
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for edge in incident[indptr[node]:indptr[node + 1]]:
+                for other in edges[edge]:
+                    if run_of_node[other] < 0:
+                        run_of_node[other] = n_runs
+                        stack.append(other)
+        n_runs += 1
+    runs = np.asarray(run_of_node, dtype=np.intp)[network.edges[:, 0]] if len(edges) else np.empty(0, np.intp)
+    return runs, n_runs
+
+
+def run_lengths(network, runs, n_runs):
+    return np.bincount(runs, weights=network.lengths, minlength=n_runs)
+
+
+def fittings(network):
+    # (node positions, junction kind) of every node where a fitting goes: elbows, tees and crosses
+    kinds = junction_types(network)
+    at = np.flatnonzero(kinds >= ELBOW)
+    return network.nodes[at], kinds[at]
@@ -1,11 +1,21 @@
 import numpy as np
-import matplotlib.pyplot as plt
 import sys
+import os
+import heapq
+
+try:
+    from pipe_plotting.pipe_network import build_network
+except ImportError:  # run as python process_points.py from pipe_plotting/
+    from pipe_network import build_network
 
 # ---- CONFIGURATION ----
 X_TOLERANCE = 4.0  # maximum X distance between points to be in same vertical cluster (cm)
 Y_TOLERANCE = 4.0  # maximum Y distance between points to be in same horizontal cluster (cm)
 MIN_SEGMENT_LENGTH = 5.0  # minimum length of a segment to be valid (cm)
+MERGE_COLLINEAR = True  # fuse touching/overlapping segments on the same line into one pipe (step 6b)
+MERGE_Z_TOLERANCE = 1.0  # step 6b only fuses segments whose depths (z) are this close (cm)
+CLUSTERING = 'axis'  # step 3: 'axis' (1-D tolerance clusters along x and y) or 'dbscan' / 'dbscan3d' (below)
+DENSITY_DIMS = {'dbscan': 2, 'dbscan3d': 3}  # density clusterings (pipe_plotting/clustering.py): on x, y (and z)
 
 # # ---- COMMAND LINE ARGUMENTS ----
 # if len(sys.argv) != 4:
@@ -19,6 +29,11 @@ MIN_SEGMENT_LENGTH = 5.0  # minimum length of a segment to be valid (cm)
 
 # ---- STEP 1: READ XYZ POINT DATA FROM FILE ----
 def read_points(filename):
+    # binary session directory (scan_data/session_file.py): memory-map the hit columns
+    if os.path.isdir(filename):
+        from scan_data.session_file import open_session
+        return open_session(filename).hits()
+
     points = []
     with open(filename, 'r') as f:
         for line in f:
@@ -30,91 +45,244 @@ def read_points(filename):
 
 
 # ---- STEP 2: CLUSTER POINTS ALONG AN AXIS ----
-def cluster_by_axis(points, axis_idx, tolerance):    
-    sorted_points = points[np.argsort(points[:, axis_idx])]  #sort points along axis
-    clusters = []
-    current_cluster = [sorted_points[0]]
-    current_val = sorted_points[0][axis_idx]
-
-    for pt in sorted_points[1:]:
-        if abs(pt[axis_idx] - current_val) <= tolerance:
-            current_cluster.append(pt)
-        else:
-            clusters.append(np.array(current_cluster))
-            current_cluster = [pt]
-            current_val = pt[axis_idx]
-    clusters.append(np.array(current_cluster))  # add last cluster
-    return clusters
+def cluster_bounds(points, axis_idx, tolerance):
+    # Sort once along the axis; cluster k is points[order[starts[k]:starts[k+1]]].
+    # A cluster takes every following point within tolerance of its *first* point, so the next
+    # cluster starts at the first value > start + tolerance: one searchsorted per cluster, no
+    # Python loop over points.
+    order = np.argsort(points[:, axis_idx])  #sort points along axis
+    vals = points[order, axis_idx]
+    n = len(vals)
+    starts = []
+    start = 0
+    while start < n:
+        starts.append(start)
+        end = int(np.searchsorted(vals, vals[start] + tolerance, side='right'))
+        # start + tolerance can round differently from the abs(pt - start) <= tolerance test
+        # used to define clusters, so settle the boundary with that exact test
+        while end < n and abs(vals[end] - vals[start]) <= tolerance:
+            end += 1
+        while end > start + 1 and abs(vals[end - 1] - vals[start]) > tolerance:
+            end -= 1
+        start = end
+    return order, np.array(starts, dtype=np.intp)
 
-def run_all(input_file, output_file, output_png):
-    points = read_points(input_file)
 
-    # Cluster points vertically and horizontally
-    vertical_clusters = cluster_by_axis(points, axis_idx=0, tolerance=X_TOLERANCE)
-    horizontal_clusters = cluster_by_axis(points, axis_idx=1, tolerance=Y_TOLERANCE)
+def cluster_by_axis(points, axis_idx, tolerance):
+    order, starts = cluster_bounds(points, axis_idx, tolerance)
+    return np.split(points[order], starts[1:])
 
-    segments = []
 
-    # ---- STEP 3: CREATE LINE SEGMENTS FROM CLUSTERS ----
-    for cluster in vertical_clusters:
-        if len(cluster) < 2:
-            continue
-        mean_x = np.mean(cluster[:, 0])
-        min_y = np.min(cluster[:, 1])
-        max_y = np.max(cluster[:, 1])
-        z_val = np.mean(cluster[:, 2])
-        segment_length = abs(max_y - min_y)
-        if segment_length >= MIN_SEGMENT_LENGTH:
-            segments.append([mean_x, min_y, mean_x, max_y, z_val, z_val, True])  # True: vertical
-
-    for cluster in horizontal_clusters:
-        if len(cluster) < 2:
-            continue
-        mean_y = np.mean(cluster[:, 1])
-        min_x = np.min(cluster[:, 0])
-        max_x = np.max(cluster[:, 0])
+# ---- STEP 3: CREATE LINE SEGMENTS FROM CLUSTERS ----
+def cluster_segments(points, axis_idx, tolerance):
+    # axis_idx 0: vertical pipes (clusters share an x), 1: horizontal pipes (clusters share a y).
+    # Size and extent of every cluster come from reduceat over the sorted points; only the
+    # clusters long enough to become a segment are visited, as offset views.
+    if len(points) == 0:
+        return []
+    order, starts = cluster_bounds(points, axis_idx, tolerance)
+    sorted_points = points[order]
+    stops = np.append(starts[1:], len(sorted_points))
+    along = 1 - axis_idx  # the coordinate the pipe runs along
+
+    low = np.minimum.reduceat(sorted_points[:, along], starts)
+    high = np.maximum.reduceat(sorted_points[:, along], starts)
+    keep = (stops - starts >= 2) & (np.abs(high - low) >= MIN_SEGMENT_LENGTH)
+
+    segments = []
+    for k in np.flatnonzero(keep):
+        cluster = sorted_points[starts[k]:stops[k]]
+        # np.mean, not an add.reduceat sum: reduceat adds sequentially and np.mean pairwise, and
+        # the last-bit difference is enough to flip exact ties in the snapping steps
+        mean_across = np.mean(cluster[:, axis_idx])
         z_val = np.mean(cluster[:, 2])
-        segment_length = abs(max_x - min_x)
-        if segment_length >= MIN_SEGMENT_LENGTH:
-            segments.append([min_x, mean_y, max_x, mean_y, z_val, z_val, False])  # False: horizontal
+        if axis_idx == 0:
+            segments.append([mean_across, low[k], mean_across, high[k], z_val, z_val, True])  # True: vertical
+        else:
+            segments.append([low[k], mean_across, high[k], mean_across, z_val, z_val, False])  # False: horizontal
+    return segments
 
-    # ---- STEP 4: SNAP CLOSE ENDPOINTS TO ALIGN THEM ----
-    snapped_points = {}  # maps original endpoints to snapped positions
+# ---- STEP 4 HELPERS: GRID OF SEGMENT ENDPOINTS FOR SNAPPING ----
+class EndpointGrid:
+    # Uniform grid over segment endpoints with cells one tolerance wide, so every endpoint within
+    # (X_TOLERANCE, Y_TOLERANCE) of a point is in the 3x3 block of cells around it.
+    def __init__(self, segments, x_tol, y_tol):
+        # a hair wider than the tolerance so float rounding in the division can't skip a cell
+        self.cell_x = x_tol * (1 + 1e-9)
+        self.cell_y = y_tol * (1 + 1e-9)
+        self.cells = {}  # (cx, cy) -> set of segment indices with an endpoint in that cell
+        self.keys = {}  # segment index -> the cells its two endpoints are in
+        for idx, seg in enumerate(segments):
+            self.update(idx, seg)
+
+    def _cell(self, x, y):
+        return (int(np.floor(x / self.cell_x)), int(np.floor(y / self.cell_y)))
+
+    def update(self, idx, seg):
+        # (re)file segment idx under the cells of its current endpoints
+        for key in self.keys.get(idx, ()):
+            self.cells[key].discard(idx)
+        keys = {self._cell(seg[0], seg[1]), self._cell(seg[2], seg[3])}
+        for key in keys:
+            self.cells.setdefault(key, set()).add(idx)
+        self.keys[idx] = keys
+
+    def near(self, x, y):
+        cx, cy = self._cell(x, y)
+        found = set()
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                found |= self.cells.get((cx + dx, cy + dy), set())
+        return found
+
+
+def snap_pair(segments, i, j, snapped_points):
+    # snap every endpoint pair of segments i and j that is within tolerance (the body of the
+    # original all-pairs loop, unchanged). Returns True if anything was snapped.
+    xi1, yi1, xi2, yi2, _, _, _ = segments[i]
+    xj1, yj1, xj2, yj2, _, _, _ = segments[j]
+
+    endpoints_i = [(xi1, yi1), (xi2, yi2)]
+    endpoints_j = [(xj1, yj1), (xj2, yj2)]
+
+    snapped = False
+    for idx_i, (xi, yi) in enumerate(endpoints_i):
+        for idx_j, (xj, yj) in enumerate(endpoints_j):
+            dx = abs(xi - xj)
+            dy = abs(yi - yj)
+            if dx <= X_TOLERANCE and dy <= Y_TOLERANCE:
+                snapped = True
+
+                # Snap to the closer coordinate axis
+                snap_x = xi if dx < dy else xj
+                snap_y = yi if dy <= dx else yj
+
+                # Update segment i endpoint
+                if idx_i == 0:
+                    snapped_points[(segments[i][0], segments[i][1])] = (snap_x, snap_y)
+                    segments[i][0], segments[i][1] = snap_x, snap_y
+                else:
+                    snapped_points[(segments[i][2], segments[i][3])] = (snap_x, snap_y)
+                    segments[i][2], segments[i][3] = snap_x, snap_y
+
+                # Update segment j endpoint
+                if idx_j == 0:
+                    snapped_points[(segments[j][0], segments[j][1])] = (snap_x, snap_y)
+                    segments[j][0], segments[j][1] = snap_x, snap_y
+                else:
+                    snapped_points[(segments[j][2], segments[j][3])] = (snap_x, snap_y)
+                    segments[j][2], segments[j][3] = snap_x, snap_y
+    return snapped
+
+
+def snap_endpoints(segments):
+    # Same result as checking every (i, j) pair in order, but only pairs with an endpoint in a
+    # neighbouring grid cell are visited. Pairs further apart never snap, so skipping them
+    # changes nothing. For each i the candidate js are still handled in increasing order, and
+    # when i moves, the grid is asked again for the js still ahead.
+    snapped_points = {}
+    grid = EndpointGrid(segments, X_TOLERANCE, Y_TOLERANCE)
     for i in range(len(segments)):
-        for j in range(len(segments)):
-            if i == j:
-                continue
-            xi1, yi1, xi2, yi2, _, _, _ = segments[i]
-            xj1, yj1, xj2, yj2, _, _, _ = segments[j]
-
-            endpoints_i = [(xi1, yi1), (xi2, yi2)]
-            endpoints_j = [(xj1, yj1), (xj2, yj2)]
-
-            for idx_i, (xi, yi) in enumerate(endpoints_i):
-                for idx_j, (xj, yj) in enumerate(endpoints_j):
-                    dx = abs(xi - xj)
-                    dy = abs(yi - yj)
-                    if dx <= X_TOLERANCE and dy <= Y_TOLERANCE:
-
-                        # Snap to the closer coordinate axis
-                        snap_x = xi if dx < dy else xj
-                        snap_y = yi if dy <= dx else yj
-
-                        # Update segment i endpoint
-                        if idx_i == 0:
-                            snapped_points[(segments[i][0], segments[i][1])] = (snap_x, snap_y)
-                            segments[i][0], segments[i][1] = snap_x, snap_y
-                        else:
-                            snapped_points[(segments[i][2], segments[i][3])] = (snap_x, snap_y)
-                            segments[i][2], segments[i][3] = snap_x, snap_y
-
-                        # Update segment j endpoint
-                        if idx_j == 0:
-                            snapped_points[(segments[j][0], segments[j][1])] = (snap_x, snap_y)
-                            segments[j][0], segments[j][1] = snap_x, snap_y
-                        else:
-                            snapped_points[(segments[j][2], segments[j][3])] = (snap_x, snap_y)
-                            segments[j][2], segments[j][3] = snap_x, snap_y
+        pending, queued = [], set()
+
+        def queue_near(after):
+            seg = segments[i]
+            for j in grid.near(seg[0], seg[1]) | grid.near(seg[2], seg[3]):
+                if j > after and j != i and j not in queued:
+                    heapq.heappush(pending, j)
+                    queued.add(j)
+
+        queue_near(-1)
+        while pending:
+            j = heapq.heappop(pending)
+            if snap_pair(segments, i, j, snapped_points):
+                grid.update(i, segments[i])
+                grid.update(j, segments[j])
+                queue_near(j)
+    return snapped_points
+
+# ---- STEP 6b: MERGE COLLINEAR SEGMENTS ----
+def merge_collinear_segments(segments, z_tolerance=None):
+    '''
+    segments: rows x1, y1, z1, x2, y2, z2. Segments on the same vertical (same x) or horizontal
+    (same y) line that touch or overlap, at depths within z_tolerance of each other, become one
+    segment spanning all of them, at their length-weighted mean z; parallel pipes at different
+    depths stay apart. Zero-length rows are dropped. Coordinates are compared rounded to
+    3 decimals, as in step 6. z_tolerance defaults to MERGE_Z_TOLERANCE as it is when called.
+    Returns the merged (k, 6) array and how many segments were saved.
+    '''
+    z_tolerance = MERGE_Z_TOLERANCE if z_tolerance is None else z_tolerance
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 6)
+    x1, y1, z1, x2, y2, z2 = segments.T
+    vertical = np.round(x1, 3) == np.round(x2, 3)
+    horizontal = np.round(y1, 3) == np.round(y2, 3)
+    on_line = vertical ^ horizontal  # both: a point, neither: not axis aligned (kept as is)
+
+    fixed = np.round(np.where(vertical, x1, y1), 3)
+    low = np.where(vertical, np.minimum(y1, y2), np.minimum(x1, x2))
+    high = np.where(vertical, np.maximum(y1, y2), np.maximum(x1, x2))
+
+    # walk each line in order of the low end; a segment joins an open run at its depth that it
+    # reaches, else starts a new one. Runs keep the place of their first segment in the output
+    rows = [(i, segments[i]) for i in np.flatnonzero(~vertical & ~horizontal)]
+    line = np.flatnonzero(on_line)
+    runs = []  # open runs of the current line
+    for i in line[np.lexsort((low[line], fixed[line], vertical[line]))]:
+        z_mid = (z1[i] + z2[i]) / 2
+        if runs and runs[0]['line'] != (vertical[i], fixed[i]):
+            rows += [_merged_row(run) for run in runs]
+            runs = []
+        run = next((run for run in runs if round(low[i], 3) <= round(run['high'], 3)
+                    and abs(z_mid - run['z_length'] / run['length']) <= z_tolerance), None)
+        if run is None:
+            run = {'line': (vertical[i], fixed[i]), 'first': i, 'low': low[i], 'high': high[i],
+                   'z_length': 0.0, 'length': 0.0}
+            runs.append(run)
+        run['first'] = min(run['first'], i)
+        run['high'] = max(run['high'], high[i])
+        run['z_length'] += z_mid * (high[i] - low[i])
+        run['length'] += high[i] - low[i]
+    rows += [_merged_row(run) for run in runs]
+
+    rows.sort(key=lambda row: row[0])
+    merged = np.array([row for _, row in rows], dtype=np.float64).reshape(-1, 6)
+    return merged, len(segments) - len(merged)
+
+
+def _merged_row(run):
+    is_vertical, fixed = run['line']
+    z_val = run['z_length'] / run['length']  # a segment on a line has a nonzero length
+    if is_vertical:
+        return run['first'], np.array([fixed, run['low'], z_val, fixed, run['high'], z_val])
+    return run['first'], np.array([run['low'], fixed, z_val, run['high'], fixed, z_val])
+
+
+def extract_segments(points, merge=None, clustering=None):
+    '''
+    Steps 3-6 on an (n, 3) array of hit points. Returns an (m, 6) float array of pipe segments,
+    one row x1, y1, z1, x2, y2, z2 (same column order as the segments text file). Never imports
+    matplotlib, so batch jobs and the IFC path do not pay for plotting. merge adds step 6b
+    (None: MERGE_COLLINEAR as it is when called, like the other settings above).
+    clustering 'dbscan' finds the segments of step 3 by density clustering in the wall plane
+    instead, 'dbscan3d' in x, y and z (so pipes crossing at different depths stay apart); their
+    segments that are not horizontal or vertical skip steps 4-6 (None: CLUSTERING when called).
+    '''
+    merge = MERGE_COLLINEAR if merge is None else merge
+    clustering = clustering or CLUSTERING
+    if clustering in DENSITY_DIMS:
+        from pipe_plotting.clustering import density_segments
+        segments, oblique = density_segments(np.asarray(points).reshape(-1, 3), MIN_SEGMENT_LENGTH,
+                                             dims=DENSITY_DIMS[clustering])
+    elif clustering == 'axis':
+        # Cluster points vertically and horizontally, one line segment per long enough cluster
+        segments = cluster_segments(points, axis_idx=0, tolerance=X_TOLERANCE)
+        segments += cluster_segments(points, axis_idx=1, tolerance=Y_TOLERANCE)
+        oblique = np.empty((0, 6))
+    else:
+        raise ValueError(f"unknown clustering {clustering!r}, expected 'axis', 'dbscan' or 'dbscan3d'")
+
+    # ---- STEP 4: SNAP CLOSE ENDPOINTS TO ALIGN THEM ----
+    snapped_points = snap_endpoints(segments)  # maps original endpoints to snapped positions
 
     # ---- STEP 5: STRAIGHTEN SEGMENTS USING SNAP ANCHORS ----
     for idx, seg in enumerate(segments):
@@ -144,51 +312,64 @@ def run_all(input_file, output_file, output_png):
                 segments[idx][1], segments[idx][3] = y1, y1
 
     # ---- STEP 6: ALIGN SEGMENTS AT SHARED CORNERS ----
-    corner_points = {}  # maps rounded (x,y) → list of segments touching that corner
-    for seg in segments:
-        for coord in [(seg[0], seg[1]), (seg[2], seg[3])]:
-            key = (round(coord[0], 3), round(coord[1], 3))
-            if key not in corner_points:
-                corner_points[key] = []
-            corner_points[key].append(seg)
-
-    for (x_key, y_key), touching_segments in corner_points.items():
-        has_horizontal = any(not s[6] for s in touching_segments)
-        has_vertical = any(s[6] for s in touching_segments)
-        for seg in touching_segments:
-            if has_horizontal and not seg[6]:
-                seg[1], seg[3] = y_key, y_key  # align Y for horizontal
-            if has_vertical and seg[6]:
-                seg[0], seg[2] = x_key, x_key  # align X for vertical
+    # corners and T-contacts are the nodes of the pipe network (pipe_network.py); every segment
+    # takes the coordinate of the node at its start: y for a horizontal one, x for a vertical one
+    segments = np.array(segments, dtype=np.float64).reshape(-1, 7)
+    net = build_network(segments[:, [0, 1, 4, 2, 3, 5]])
+    start = net.nodes[net.edges[np.searchsorted(net.segment, np.arange(len(segments))), 0]]
+    vertical = segments[:, 6].astype(bool)
+    segments[vertical, 0] = segments[vertical, 2] = start[vertical, 0]  # align X for vertical
+    segments[~vertical, 1] = segments[~vertical, 3] = start[~vertical, 1]  # align Y for horizontal
+    segments = np.concatenate([segments[:, [0, 1, 4, 2, 3, 5]], oblique])
+    if merge:
+        segments, saved = merge_collinear_segments(segments)
+        if saved:
+            print(f"Merged collinear segments: {len(segments) + saved} -> {len(segments)} ({saved} fewer IFC pipes)")
+    return segments
 
+
+def plot_segments(points, segments, output_png):
     # ---- STEP 7: PLOT RESULTS ----
-    plt.figure(figsize=(10, 8))
-    plt.scatter(points[:, 0], points[:, 1], color='blue', label='Raw Points')
-    for seg in segments:
-        x1, y1, x2, y2, _, _, _ = seg
-        plt.plot([x1, x2], [y1, y2], color='red', linewidth=4)
-    plt.xlabel('X (cm)')
-    plt.ylabel('Y (cm)')
-    plt.title('Pipe Path Detection')
-    #plt.gca().invert_yaxis()  # flip Y axis for top-down view
-    plt.axis('equal')
-    plt.grid(True)
-    plt.savefig(output_png)
-    #plt.show()
+    # opt-in; matplotlib is only imported when a figure is actually asked for. Figure instead of
+    # pyplot so nothing is left open in pyplot's figure manager after each run
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 8))
+    ax = fig.add_subplot()
+    ax.scatter(points[:, 0], points[:, 1], color='blue', label='Raw Points')
+    for x1, y1, _, x2, y2, _ in segments:
+        ax.plot([x1, x2], [y1, y2], color='red', linewidth=4)
+    ax.set_xlabel('X (cm)')
+    ax.set_ylabel('Y (cm)')
+    ax.set_title('Pipe Path Detection')
+    #ax.invert_yaxis()  # flip Y axis for top-down view
+    ax.axis('equal')
+    ax.grid(True)
+    fig.savefig(output_png)
 
+
+def write_segments(segments, output_file):
     # ---- STEP 8: WRITE FINAL SEGMENTS TO FILE ----
     with open(output_file, 'w') as f:
-        print("here")
-        for seg in segments:
-            # x1, y1, z1, x2, y2, z2
-            f.write(f"{seg[0]:.4f}, {seg[1]:.4f}, {seg[4]:.4f}, {seg[2]:.4f}, {seg[3]:.4f}, {seg[5]:.4f}\n")
+        for x1, y1, z1, x2, y2, z2 in segments:
+            f.write(f"{x1:.4f}, {y1:.4f}, {z1:.4f}, {x2:.4f}, {y2:.4f}, {z2:.4f}\n")
+
+
+def run_all(input_file, output_file, output_png=None, merge=None, clustering=None):
+    points = read_points(input_file)
+    segments = extract_segments(points, merge, clustering)
+    if output_png:
+        plot_segments(points, segments, output_png)
+    write_segments(segments, output_file)
+    return segments
+
 
 if __name__ == '__main__':
-    if len(sys.argv) != 4:
-        print("Usage: python process_points.py pathTo/walabotClean_$(time).txt output_filename output_png")
+    if len(sys.argv) not in (3, 4):
+        print("Usage: python process_points.py pathTo/walabotClean_$(time).txt output_filename [output_png]")
         sys.exit(1)
 
     input_file = sys.argv[1]
     output_file = sys.argv[2]
-    output_png = sys.argv[3]
+    output_png = sys.argv[3] if len(sys.argv) == 4 else None
     run_all(input_file, output_file, output_png)
@@ -0,0 +1,152 @@
+'''
+Live 3D preview of the scan in the browser, served from this machine.
+
+Instead of rewriting a standalone plotly HTML file with every point after each trigger, a small
+HTTP server holds the session's PointStore. The page opens an event stream (Server-Sent Events,
+plain HTTP, no extra packages) and the server pushes only the readings added since the last
+message, which the page appends to the plot with Plotly.extendTraces. plotly.js is served from the
+installed plotly package, so no internet connection is needed.
+
+    /              the viewer page
+    /plotly.min.js plotly.js
+    /events        stream of new readings (resumes from Last-Event-ID after a reconnect)
+'''
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 8050
+KEEPALIVE_SECONDS = 15
+
+PAGE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Walabot live preview</title>
+<script src="/plotly.min.js"></script>
+</head>
+<body style="margin:0">
+<div id="plot" style="width:100vw;height:100vh"></div>
+<script>
+var marker = function (color) { return {size: 5, color: color, opacity: 0.8}; };
+Plotly.newPlot('plot', [
+    {type: 'scatter3d', mode: 'markers', name: 'Target', x: [], y: [], z: [], marker: marker('red')},
+    {type: 'scatter3d', mode: 'markers', name: 'No target', x: [], y: [], z: [], marker: marker('gray')}
+], {
+    scene: {xaxis: {title: 'X Axis'}, yaxis: {title: 'Y Axis'}, zaxis: {title: 'Z Axis'}},
+    margin: {r: 20, b: 10, l: 10, t: 35},
+    title: {text: '3D Visualization of Walabot Readings', x: 0.5},
+    uirevision: 'keep'
+});
+var events = new EventSource('/events');
+events.onmessage = function (e) {
+    var d = JSON.parse(e.data);
+    Plotly.extendTraces('plot', {x: [d.hit.x, d.miss.x], y: [d.hit.y, d.miss.y], z: [d.hit.z, d.miss.z]}, [0, 1]);
+};
+</script>
+</body>
+</html>
+'''
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass  # keep the operator's console clean
+
+    def _send(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        live = self.server.live
+        path = self.path.split('?')[0]
+        if path == '/':
+            self._send(PAGE.encode(), 'text/html; charset=utf-8')
+        elif path == '/plotly.min.js':
+            self._send(live.plotly_js(), 'application/javascript')
+        elif path == '/events':
+            self._stream(live)
+        else:
+            self.send_error(404)
+
+    def _stream(self, live):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        # the browser sends back the last id it saw when it reconnects
+        cursor = int(self.headers.get('Last-Event-ID') or 0)
+        try:
+            while True:
+                stop, message = live.wait_for_points(cursor, KEEPALIVE_SECONDS)
+                if message is None:
+                    if live.closed:
+                        return
+                    self.wfile.write(b': keepalive\n\n')
+                else:
+                    self.wfile.write(f'id: {stop}\ndata: {message}\n\n'.encode())
+                    cursor = stop
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            return  # browser tab closed
+
+
+class LivePreviewServer:
+    def __init__(self, store, host='127.0.0.1', port=DEFAULT_PORT):
+        self.store = store
+        self.closed = False
+        self._cond = threading.Condition()
+        self._plotly_js = None
+        try:
+            self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        except OSError:
+            self._httpd = ThreadingHTTPServer((host, 0), _Handler)  # port taken: let the OS pick one
+        self._httpd.daemon_threads = True
+        self._httpd.live = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='live-preview', daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def plotly_js(self):
+        if self._plotly_js is None:
+            from plotly.offline import get_plotlyjs
+            self._plotly_js = get_plotlyjs().encode()
+        return self._plotly_js
+
+    def notify(self):
+        # call after appending to the store; wakes every open page
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait_for_points(self, cursor, timeout):
+        # returns (new cursor, JSON of the readings after cursor), or (cursor, None) on timeout/close
+        with self._cond:
+            self._cond.wait_for(lambda: self.closed or len(self.store) > cursor, timeout)
+        if len(self.store) <= cursor:
+            return cursor, None
+
+        stop, x, y, z, hit = self.store.since(cursor)
+        message = json.dumps({
+            'hit': {'x': x[hit].tolist(), 'y': y[hit].tolist(), 'z': z[hit].tolist()},
+            'miss': {'x': x[~hit].tolist(), 'y': y[~hit].tolist(), 'z': z[~hit].tolist()},
+        })
+        return stop, message
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,54 @@
+'''
+Background preview rendering for the scan loop.
+
+The operator's thread only hands the latest data to submit() and goes straight back to the prompt.
+One worker thread does the rendering. If several triggers come in while a render is running, only
+the newest submission is kept, so the worker never falls behind by more than one render.
+'''
+
+import threading
+import traceback
+
+
+class PreviewWorker:
+    def __init__(self, render, name='preview-render'):
+        self._render = render
+        self._cond = threading.Condition()
+        self._pending = None
+        self._closed = False
+        self.rendered = 0
+        self.coalesced = 0  # submissions replaced by a newer one before they were drawn
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, *args):
+        # never blocks on rendering: just replaces whatever is still waiting
+        with self._cond:
+            if self._pending is not None:
+                self.coalesced += 1
+            self._pending = args
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return  # closed and nothing left to draw
+                args, self._pending = self._pending, None
+
+            try:
+                self._render(*args)
+            except Exception:
+                # a failed preview must not kill the worker (or the scan)
+                traceback.print_exc()
+            self.rendered += 1
+
+    def close(self, wait=True):
+        # draws whatever is still pending, then stops the worker
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if wait:
+            self._thread.join()
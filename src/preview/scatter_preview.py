@@ -0,0 +1,42 @@
+'''
+2D preview of the Walabot readings (x/y, red = target, gray = no target).
+
+The figure, axes and the two scatter collections are created once and reused for every trigger;
+an update only swaps the point offsets of the two collections and re-saves the PNG. Uses
+matplotlib's Figure directly (no pyplot), so it can live on the preview thread.
+'''
+
+import numpy as np
+from matplotlib.figure import Figure
+
+PAD = 0.05  # fraction of the data range left empty around the points
+
+
+class ScatterPreview:
+    def __init__(self, figsize=(10, 6)):
+        self.fig = Figure(figsize=figsize)
+        self.ax = self.fig.add_subplot()
+        empty = np.empty((0, 2))
+        # misses first so hits are drawn on top
+        self.misses = self.ax.scatter(empty[:, 0], empty[:, 1], c='gray', marker='o')
+        self.hits = self.ax.scatter(empty[:, 0], empty[:, 1], c='red', marker='o')
+        self.ax.set_title('2D Visualization of Walabot Readings')
+        self.ax.set_xlabel('X Axis')
+        self.ax.set_ylabel('Y Axis')
+        self.ax.grid(True)
+
+    def update(self, x, y, is_hit):
+        xy = np.column_stack([x, y])
+        is_hit = np.asarray(is_hit, dtype=bool)
+        self.hits.set_offsets(xy[is_hit])
+        self.misses.set_offsets(xy[~is_hit])
+
+        # collections are not picked up by autoscale, so set the limits from the data
+        if len(xy):
+            low, high = xy.min(axis=0), xy.max(axis=0)
+            pad = np.maximum((high - low) * PAD, 0.5)
+            self.ax.set_xlim(low[0] - pad[0], high[0] + pad[0])
+            self.ax.set_ylim(low[1] - pad[1], high[1] + pad[1])
+
+    def save(self, save_path, dpi=300):
+        self.fig.savefig(save_path, dpi=dpi)
@@ -0,0 +1,118 @@
+'''
+Fuse the targets of repeated triggers into one point per spot.
+
+With the Walabot held still, every Enter reports the same pipe again (slightly moved, or not at
+all), so a session holds many near-duplicate targets. fuse() bins the hits of a session on a
+BIN_CM grid and keeps one point per occupied bin:
+
+    x, y, z     amplitude-weighted centroid of the bin's targets
+    amplitude   mean amplitude of the bin's targets
+    readings    how many targets fell in the bin
+    triggers    how many different triggers saw something there (the confidence of the point)
+
+Everything is a handful of NumPy passes over the session columns (unique + bincount), no Python
+loop over points. min_triggers drops the spots seen by fewer triggers, i.e. the flickers.
+
+A text log has no trigger numbers; log_triggers() numbers its readings the way sensor/replay.py
+reads a log (a "No Target Detected" line is one trigger, consecutive target lines are one).
+
+python -m scan_data.fusion pathTo/walabotSession_$(time) [--bin 1.0] [--min-triggers 2]
+'''
+
+import argparse
+from collections import namedtuple
+import numpy as np
+
+BIN_CM = 1.0  # edge of the grid cells targets are fused in
+MIN_TRIGGERS = 1  # keep every spot seen at least this many times
+
+FusedPoints = namedtuple('FusedPoints', ['x', 'y', 'z', 'amplitude', 'readings', 'triggers'])
+
+
+def log_triggers(hit):
+    # trigger number of every reading of a text log
+    hit = np.asarray(hit, dtype=bool)
+    starts = ~hit
+    starts[1:] |= hit[1:] & ~hit[:-1]
+    if len(hit):
+        starts[0] = True
+    return np.cumsum(starts) - 1
+
+
+def fuse(x, y, z, amplitude=None, trigger=None, bin_cm=BIN_CM, min_triggers=MIN_TRIGGERS):
+    '''
+    Target readings (hits only) -> FusedPoints, one per occupied bin, in grid order. amplitude None
+    weighs every target the same; trigger None counts every target as its own trigger.
+    '''
+    points = np.column_stack([x, y, z]).astype(np.float64, copy=False)
+    n = len(points)
+    if amplitude is None:
+        amplitude = np.ones(n)
+    amplitude = np.asarray(amplitude, dtype=np.float64)
+    if trigger is None:
+        trigger = np.arange(n)
+    trigger = np.asarray(trigger, dtype=np.int64)
+    if n == 0:
+        empty = np.empty(0)
+        return FusedPoints(empty, empty, empty, empty, np.empty(0, np.int64), np.empty(0, np.int64))
+
+    # ---- bin every target; inverse maps a target to its bin ----
+    cells = np.floor(points / bin_cm).astype(np.int64)
+    cells -= cells.min(axis=0)
+    key = np.ravel_multi_index(cells.T, cells.max(axis=0) + 1)  # one int per cell: a 1-D unique
+    _, inverse = np.unique(key, return_inverse=True)
+    bins = inverse.max() + 1
+
+    # ---- amplitude-weighted centroids (equal weights where a bin has no usable amplitude) ----
+    usable = np.isfinite(amplitude) & (amplitude > 0)
+    weight = np.where(usable, amplitude, 0.0)
+    weight = np.where(np.bincount(inverse, weight, bins)[inverse] > 0, weight, 1.0)
+    total = np.bincount(inverse, weight, bins)
+    centroid = np.stack([np.bincount(inverse, weight * points[:, i], bins) for i in range(3)], axis=1) / total[:, None]
+    readings = np.bincount(inverse, minlength=bins)
+    measured = np.bincount(inverse, usable, bins)
+    with np.errstate(invalid='ignore'):
+        mean_amplitude = np.bincount(inverse, np.where(usable, amplitude, 0.0), bins) / measured
+
+    # ---- distinct triggers per bin ----
+    trigger = trigger - trigger.min()
+    pairs = np.unique(inverse * (trigger.max() + 1) + trigger)
+    triggers = np.bincount(pairs // (trigger.max() + 1), minlength=bins)
+
+    keep = triggers >= min_triggers
+    return FusedPoints(centroid[keep, 0], centroid[keep, 1], centroid[keep, 2], mean_amplitude[keep],
+                       readings[keep], triggers[keep])
+
+
+def fuse_hits(x, y, z, is_hit, amplitude=None, trigger=None, bin_cm=BIN_CM, min_triggers=MIN_TRIGGERS):
+    # fuse() on the hits of every reading of a scan; trigger None numbers them as a text log
+    is_hit = np.asarray(is_hit, dtype=bool)
+    if trigger is None:
+        trigger = log_triggers(is_hit)
+    amplitude = None if amplitude is None else np.asarray(amplitude)[is_hit]
+    return fuse(np.asarray(x)[is_hit], np.asarray(y)[is_hit], np.asarray(z)[is_hit], amplitude,
+                np.asarray(trigger)[is_hit], bin_cm, min_triggers)
+
+
+if __name__ == '__main__':
+    from scan_data.loader import load_log
+    from scan_data.session_file import is_session, open_session
+
+    parser = argparse.ArgumentParser(description="Fuse the repeated targets of a scan")
+    parser.add_argument('scan', help='walabotOut_$(time).txt log or walabotSession_$(time) directory')
+    parser.add_argument('--bin', type=float, default=BIN_CM, help='grid cell edge in cm')
+    parser.add_argument('--min-triggers', type=int, default=MIN_TRIGGERS)
+    args = parser.parse_args()
+
+    if is_session(args.scan):
+        session = open_session(args.scan)
+        columns = [session.column(name) for name in ('x', 'y', 'z', 'hit', 'amplitude', 'trigger')]
+        columns[3] = columns[3] != 0
+    else:
+        log = load_log(args.scan)
+        columns = [log.x, log.y, log.z, log.hit, log.amplitude, None]
+    fused = fuse_hits(*columns, bin_cm=args.bin, min_triggers=args.min_triggers)
+    print(f"{int(np.count_nonzero(columns[3]))} targets -> {len(fused.x)} fused points "
+          f"({args.bin} cm bins, seen by >= {args.min_triggers} trigger(s))")
+    if len(fused.x):
+        print(f"triggers per point: mean {fused.triggers.mean():.2f}, max {fused.triggers.max()}")
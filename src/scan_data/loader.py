@@ -0,0 +1,126 @@
+'''
+Bulk loader for walabotOut_*.txt scan logs.
+
+The log has two kinds of lines (see PrintSensorTargets in megascript_v2.py):
+    x: 40.4 cm, y: 0.0 cm, z: 8.0 cm, a: 66.78199522070048 cm
+    No Target Detected at x: 3 cm, y: 0 cm, z: 0.0 cm
+
+Instead of splitting and converting every line on its own, the whole file is turned into a plain
+list of numbers with two bytes.replace calls and one bytes.translate, read with a single
+np.fromstring call, and cut into rows with NumPy. Only if the file does not parse cleanly are its
+lines checked one by one, so bad lines are counted instead of silently dropped.
+
+python -m scan_data.loader pathTo/walabotOut_$(time).txt
+'''
+
+import sys
+import warnings
+from collections import namedtuple
+import numpy as np
+
+HIT_PREFIX = b"x:"
+MISS_PREFIX = b"No Target Detected at"
+# every label/unit character becomes a space; none of them can appear in a number
+BLANK_LABELS = bytes.maketrans(b"xyzacm:,\r", b"         ")
+
+# amplitude is NaN for "No Target Detected" readings and for the early logs that did not record it
+ScanLog = namedtuple('ScanLog', ['x', 'y', 'z', 'amplitude', 'hit', 'malformed'])
+
+
+def _fromstring(block):
+    # numpy warns (newer versions raise) when fromstring stops early on unparsable text
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", DeprecationWarning)
+            return np.fromstring(block, dtype=np.float64, sep=" ")
+    except (ValueError, DeprecationWarning):
+        return None
+
+
+def _parse_bulk(data):
+    # Every line start is tagged with a sentinel number (inf = hit, -inf = no target), labels are
+    # blanked, and the whole file goes through one fromstring call. Rows are then cut out of the
+    # flat array at the sentinels. Returns None if anything does not fit, so the caller can
+    # fall back to checking line by line.
+    text = (b"\n" + data).replace(b"\n" + MISS_PREFIX, b"\n-inf ").replace(b"\n" + HIT_PREFIX, b"\ninf ")
+    values = _fromstring(text.translate(BLANK_LABELS))
+    if values is None:
+        return None
+
+    starts = np.flatnonzero(np.isinf(values))
+    if len(starts) == 0:
+        if len(values):
+            return None
+        return np.empty((0, 4)), np.empty(0, dtype=bool)
+    if starts[0] != 0:
+        return None
+
+    hit = values[starts] > 0
+    n_fields = np.diff(np.append(starts, len(values))) - 1
+    # hits carry x, y, z, a (x, y, z in the first logs), no-target lines x, y, z
+    if not np.all(np.where(hit, (n_fields == 4) | (n_fields == 3), n_fields == 3)):
+        return None
+
+    rows = np.full((len(starts), 4), np.nan)
+    rows[:, :3] = values[starts[:, None] + np.arange(1, 4)]
+    has_amplitude = n_fields == 4
+    rows[has_amplitude, 3] = values[starts[has_amplitude] + 4]
+    return rows, hit
+
+
+def _parse_lines(data):
+    # slow path: one line at a time, counting the lines that cannot be read
+    rows, hit, malformed = [], [], 0
+    for line in data.splitlines():
+        line = line.strip()
+        if line.startswith(HIT_PREFIX):
+            is_hit, n_fields = True, (4, 3)
+        elif line.startswith(MISS_PREFIX):
+            is_hit, n_fields = False, (3,)
+            line = line[len(MISS_PREFIX):]
+        else:
+            malformed += bool(line)
+            continue
+
+        parts = line.translate(BLANK_LABELS).split()
+        try:
+            if len(parts) not in n_fields:
+                raise ValueError
+            values = [float(p) for p in parts]
+        except ValueError:
+            malformed += 1
+            continue
+        rows.append(values + [np.nan] * (4 - len(values)))
+        hit.append(is_hit)
+    return np.array(rows, dtype=np.float64).reshape(-1, 4), np.array(hit, dtype=bool), malformed
+
+
+def load_log(filename):
+    with open(filename, 'rb') as f:
+        data = f.read()
+
+    parsed = _parse_bulk(data)
+    if parsed is not None:
+        (rows, hit), malformed = parsed, 0
+    else:
+        rows, hit, malformed = _parse_lines(data)
+
+    return ScanLog(rows[:, 0].copy(), rows[:, 1].copy(), rows[:, 2].copy(), rows[:, 3].copy(), hit, malformed)
+
+
+def read_data(filename):
+    # drop-in for the old per-line read_data(): x, y, z, is_hit
+    log = load_log(filename)
+    if log.malformed:
+        print(f"Warning: skipped {log.malformed} malformed line(s) in {filename}")
+    return log.x, log.y, log.z, log.hit
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Usage: python -m scan_data.loader pathTo/walabotOut_$(time).txt")
+        sys.exit(1)
+
+    log = load_log(sys.argv[1])
+    print(f"{len(log.hit)} readings: {int(log.hit.sum())} hits, {int((~log.hit).sum())} no target, "
+          f"{log.malformed} malformed line(s)")
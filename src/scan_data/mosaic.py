@@ -0,0 +1,219 @@
+'''
+One voxel volume of the whole wall, mosaicked from the raw image of every trigger (raw_store.py).
+
+Each trigger images the same arena (x in [-3, 4], y in [-6, 4], z in [3, 8] cm at 0.5 cm in
+InWallApp) around the sensor position (x, y) the operator moved to. A voxel of the frame at arena
+coordinates (X, Y, Z) is the wall voxel
+    x = x_sensor + X,  y = y_sensor - Y,  z = Z
+(the same mapping PrintSensorTargets uses for targets), on a global grid with the arena's
+resolution; sensor positions are rounded to the nearest voxel.
+
+Where frames overlap the wall value is their weighted average: every chunk keeps the running sum
+of weight * value and of weight, and a voxel reads as sum / weight. The default weight tapers
+from the middle of the arena to its edges, so seams between triggers are feathered.
+
+The wall is cut into cubes of CHUNK voxels that are only allocated when a frame touches them.
+With a directory, each chunk is a .npy file there and at most max_open of them are mapped at a
+time (least recently used are flushed and closed), so walls larger than RAM work; without one
+the chunks are plain arrays.
+
+    mosaic = mosaic_session('walabotSession_$(time)', 'walabotSession_$(time)/mosaic')
+    volume, origin = mosaic.volume()   # dense float32 grid (nan = never seen), origin in cm
+    points = mosaic.points(threshold)  # (n, 4) x, y, z, value: input for process_points
+
+python -m scan_data.mosaic pathTo/walabotSession_$(time) [out_dir]
+'''
+
+import json
+import os
+import sys
+from collections import OrderedDict
+import numpy as np
+
+CHUNK = 32  # voxels along each side of a chunk
+DEFAULT_MAX_OPEN = 64  # chunks mapped at once when on disk (2 * 32^3 float32 = 256 KiB each)
+MOSAIC_FILE = 'mosaic.json'
+
+
+def taper_weights(shape):
+    # 1 at the edge of the frame rising linearly to the middle, per axis, multiplied together
+    weights = np.ones(shape, dtype=np.float32)
+    for axis, n in enumerate(shape):
+        ramp = 1 + np.minimum(np.arange(n), np.arange(n)[::-1]).astype(np.float32)
+        weights *= ramp.reshape([-1 if i == axis else 1 for i in range(len(shape))])
+    return weights
+
+
+class WallMosaic:
+    def __init__(self, voxel, path=None, chunk=CHUNK, max_open=DEFAULT_MAX_OPEN):
+        self.voxel = float(voxel)
+        self.path = path
+        self.chunk = chunk
+        self.max_open = max_open
+        self._chunks = OrderedDict()  # (cx, cy, cz) -> (2, chunk, chunk, chunk) float32: sum, weight
+        self._on_disk = set()  # chunks with a file in path
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            meta_path = os.path.join(path, MOSAIC_FILE)
+            if os.path.exists(meta_path):
+                with open(meta_path, 'r') as f:
+                    meta = json.load(f)
+                if meta['voxel'] != self.voxel or meta['chunk'] != chunk:
+                    raise ValueError(f"{path} holds a mosaic with voxel {meta['voxel']} and chunk {meta['chunk']}")
+                self._on_disk = {tuple(key) for key in meta['chunks']}
+
+    # ---- chunk storage ----
+    def _chunk_file(self, key):
+        return os.path.join(self.path, 'chunk_{}_{}_{}.npy'.format(*key))
+
+    def _get(self, key, create):
+        if key in self._chunks:
+            self._chunks.move_to_end(key)
+            return self._chunks[key]
+        shape = (2, self.chunk, self.chunk, self.chunk)
+        if self.path is None:
+            if not create:
+                return None
+            data = np.zeros(shape, dtype=np.float32)
+        elif key in self._on_disk:
+            data = np.load(self._chunk_file(key), mmap_mode='r+')
+        elif create:
+            data = np.lib.format.open_memmap(self._chunk_file(key), mode='w+', dtype=np.float32, shape=shape)
+            self._on_disk.add(key)
+        else:
+            return None
+        self._chunks[key] = data
+        if self.path is not None and len(self._chunks) > self.max_open:
+            _, oldest = self._chunks.popitem(last=False)
+            oldest.flush()
+        return data
+
+    def keys(self):
+        return sorted(self._on_disk | set(self._chunks))
+
+    def flush(self):
+        if self.path is None:
+            return
+        for data in self._chunks.values():
+            data.flush()
+        tmp = os.path.join(self.path, MOSAIC_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'voxel': self.voxel, 'chunk': self.chunk, 'chunks': [list(key) for key in self.keys()]}, f)
+        os.replace(tmp, os.path.join(self.path, MOSAIC_FILE))
+
+    # ---- accumulate ----
+    def _accumulate(self, start, values, weights):
+        # add weights * values and weights into the global box starting at voxel index start
+        stop = [s + n for s, n in zip(start, values.shape)]
+        c = self.chunk
+        for cx in range(start[0] // c, (stop[0] - 1) // c + 1):
+            for cy in range(start[1] // c, (stop[1] - 1) // c + 1):
+                for cz in range(start[2] // c, (stop[2] - 1) // c + 1):
+                    base = (cx * c, cy * c, cz * c)
+                    lo = [max(s, b) for s, b in zip(start, base)]
+                    hi = [min(e, b + c) for e, b in zip(stop, base)]
+                    src = tuple(slice(l - s, h - s) for l, h, s in zip(lo, hi, start))
+                    dst = tuple(slice(l - b, h - b) for l, h, b in zip(lo, hi, base))
+                    data = self._get((cx, cy, cz), create=True)
+                    data[0][dst] += weights[src] * values[src]
+                    data[1][dst] += weights[src]
+
+    def add(self, frame, x, y, axes, weights=None):
+        '''
+        frame: (nx, ny, nz) raw image over the arena axes (X, Y, Z coordinates in cm, see
+        raw_store.arena_axes), a slice (nx, ny) having a one-value Z axis. x, y: sensor position.
+        '''
+        ax_x, ax_y, ax_z = axes
+        frame = np.asarray(frame, dtype=np.float32).reshape(len(ax_x), len(ax_y), len(ax_z))
+        if weights is None:
+            weights = taper_weights(frame.shape)
+        # y = y_sensor - Y runs the other way to the frame's Y axis
+        frame = frame[:, ::-1]
+        weights = np.broadcast_to(weights, frame.shape)[:, ::-1]
+        start = (int(round((x + ax_x[0]) / self.voxel)),
+                 int(round((y - ax_y[-1]) / self.voxel)),
+                 int(round(ax_z[0] / self.voxel)))
+        self._accumulate(start, frame, weights)
+
+    # ---- read ----
+    def bounds(self):
+        # voxel index box (start, stop) of every allocated chunk; None if empty
+        keys = self.keys()
+        if not keys:
+            return None
+        keys = np.array(keys)
+        return keys.min(axis=0) * self.chunk, (keys.max(axis=0) + 1) * self.chunk
+
+    def read(self, start, stop):
+        # weighted average over the voxel box [start, stop), nan where no frame reached
+        out = np.full([e - s for s, e in zip(start, stop)], np.nan, dtype=np.float32)
+        c = self.chunk
+        for key in self.keys():
+            base = [k * c for k in key]
+            lo = [max(s, b) for s, b in zip(start, base)]
+            hi = [min(e, b + c) for e, b in zip(stop, base)]
+            if any(l >= h for l, h in zip(lo, hi)):
+                continue
+            data = self._get(key, create=False)
+            src = tuple(slice(l - b, h - b) for l, h, b in zip(lo, hi, base))
+            dst = tuple(slice(l - s, h - s) for l, h, s in zip(lo, hi, start))
+            total, weight = data[0][src], data[1][src]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out[dst] = np.where(weight > 0, total / weight, np.nan)
+        return out
+
+    def volume(self):
+        # the whole wall as one dense grid and the (x, y, z) cm of its first voxel
+        bounds = self.bounds()
+        if bounds is None:
+            return np.empty((0, 0, 0), dtype=np.float32), np.zeros(3)
+        start, stop = bounds
+        return self.read(start, stop), start * self.voxel
+
+    def points(self, threshold):
+        # every voxel whose average is above threshold as x, y, z (cm), value; one chunk at a time
+        found = []
+        c = self.chunk
+        for key in self.keys():
+            data = self._get(key, create=False)
+            total, weight = data[0], data[1]
+            hit = (weight > 0) & (total > threshold * weight)
+            if not hit.any():
+                continue
+            index = np.argwhere(hit)
+            values = total[hit] / weight[hit]
+            found.append(np.column_stack([(index + np.array(key) * c) * self.voxel, values]))
+        return np.concatenate(found) if found else np.empty((0, 4))
+
+
+def open_mosaic(path, max_open=DEFAULT_MAX_OPEN):
+    with open(os.path.join(path, MOSAIC_FILE), 'r') as f:
+        meta = json.load(f)
+    return WallMosaic(meta['voxel'], path, meta['chunk'], max_open)
+
+
+def mosaic_session(session_path, out_dir=None, chunk=CHUNK, max_open=DEFAULT_MAX_OPEN):
+    # every recorded raw frame of a session into one mosaic (on disk in out_dir, else in memory)
+    from scan_data.raw_store import arena_axes, open_raw
+    raw = open_raw(session_path)
+    ax_x, ax_y, ax_z = arena_axes(raw.arena)
+    mosaic = WallMosaic(raw.arena['x'][2], out_dir, chunk, max_open)
+    depth = raw.column('depth')
+    weights = None
+    for i in range(len(raw)):
+        z_axis = ax_z if raw.mode == 'image' else np.array([depth[i]])
+        if weights is None:
+            weights = taper_weights((len(ax_x), len(ax_y), len(z_axis)))
+        mosaic.add(raw.images[i], raw.column('x')[i], raw.column('y')[i], (ax_x, ax_y, z_axis), weights)
+    mosaic.flush()
+    return mosaic
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python -m scan_data.mosaic pathTo/walabotSession_$(time) [out_dir]")
+        sys.exit(1)
+
+    mosaic = mosaic_session(sys.argv[1], sys.argv[2] if len(sys.argv) == 3 else None)
+    volume, origin = mosaic.volume()
+    print(f"{len(mosaic.keys())} chunk(s), wall volume {volume.shape} voxels from {origin} cm")
@@ -0,0 +1,186 @@
+'''
+Occupancy grid of the wall: the evidence of every reading, hits and misses, per x/y cell.
+
+Each cell holds the log-odds that a pipe is there, the z sum and the number of targets in it
+(float32, float32, uint32: fixed memory per cell, however many triggers land on it).
+    a target at (x, y)          adds L_HIT to its cell
+    "No Target Detected" at the sensor position (xL, yL) adds L_MISS to every cell of the window
+                                around it: x in [xL - 2, xL + 2], y in [yL - 2, yL + 2]
+
+The sensor images the whole arena (x in [xL - 3, xL + 4], y in [yL - 4, yL + 6], since a target at
+arena X, Y lands on x = xL + X, y = yL - Y; footprint() gives that window), but in the archived
+logs its targets come up within about 2 cm of where it is held, and clearing the whole arena on
+every miss wipes out pipes it saw only from right above: over every log in walabotOut_txt/ the
+arena window keeps 141 of the 315 cells with targets, MISS_WINDOW 253, and process_points finds
+14 and 24 of the 25 pipes it finds in the raw targets.
+
+Log-odds are clamped to [-CLAMP, CLAMP] after every update, so a cell seen often can still change.
+
+update() takes a batch of readings (a whole session, or one trigger from the scan loop). Targets
+go in with one np.add.at; the rectangles of the misses with a summed-area table (+1/-1 at the four
+corners, two cumsums) when there are many, else as slices. The grid grows like PointStore, so the
+cost is O(readings + wall area) and the memory O(wall area).
+
+    grid = OccupancyGrid()
+    grid.update(x, y, z, is_hit)
+    points = grid.occupied()    # (n, 3) cell centres (mean z) more likely full than empty
+
+python -m scan_data.occupancy pathTo/walabotOut_$(time).txt [--cell 1.0] [--arena] [--png grid.png]
+'''
+
+import argparse
+import numpy as np
+
+CELL_CM = 1.0  # edge of a grid cell
+MISS_WINDOW = (-2, 2, -2, 2)  # wall x and y ranges (cm) a miss clears around the sensor
+ARENA = {'x': (-3, 4), 'y': (-6, 4)}  # InWallApp's SetArenaX / SetArenaY (min, max) in cm
+L_HIT = float(np.log(0.7 / 0.3))  # a target: the cell is full with p = 0.7
+L_MISS = float(np.log(0.45 / 0.55))  # no target: every cell in view is empty with p = 0.55
+CLAMP = 5.0
+OCCUPIED = 0.5  # probability above which occupied() reports a cell
+SLICE_MISSES = 64  # fewer misses than this in one update are added as slices
+MARGIN = 16  # cells added on every side when the grid grows
+
+
+def footprint(arena=ARENA):
+    # wall x and y ranges of the whole arena seen from the sensor at (0, 0): x = xL + X, y = yL - Y
+    (x0, x1), (y0, y1) = arena['x'][:2], arena['y'][:2]
+    return x0, x1, -y1, -y0
+
+
+class OccupancyGrid:
+    def __init__(self, cell_cm=CELL_CM, window=MISS_WINDOW, l_hit=L_HIT, l_miss=L_MISS, clamp=CLAMP):
+        self.cell = float(cell_cm)
+        self.window = window  # MISS_WINDOW, or footprint(arena) to clear all the sensor sees
+        self.l_hit = l_hit
+        self.l_miss = l_miss
+        self.clamp = clamp
+        self.origin = np.zeros(2, dtype=np.int64)  # cell index (ix, iy) of log_odds[0, 0]
+        self.log_odds = np.zeros((0, 0), dtype=np.float32)  # [ix, iy]
+        self.z_sum = np.zeros((0, 0), dtype=np.float32)
+        self.hits = np.zeros((0, 0), dtype=np.uint32)
+        self.readings = 0
+
+    def _index(self, value):
+        return np.floor(np.asarray(value, dtype=np.float64) / self.cell).astype(np.int64)
+
+    # ---- grow every layer so cells [low, high] (inclusive, global indices) are on the grid ----
+    def _cover(self, low, high):
+        shape = np.array(self.log_odds.shape)
+        top = self.origin + shape - 1
+        if shape.all() and (low >= self.origin).all() and (high <= top).all():
+            return
+        if shape.all():
+            low, high = np.minimum(low, self.origin), np.maximum(high, top)
+            # at least double along a growing axis, so a scan growing cell by cell copies O(area)
+            grow = np.maximum(high - low + 1 - shape, 0)
+            pad = np.where(grow > 0, np.maximum(shape - grow, 0) // 2, 0) + MARGIN
+        else:
+            pad = MARGIN
+        new_origin = low - pad
+        new_shape = tuple(int(v) for v in high + pad - new_origin + 1)
+        offset = self.origin - new_origin
+        for name in ('log_odds', 'z_sum', 'hits'):
+            old = getattr(self, name)
+            new = np.zeros(new_shape, dtype=old.dtype)
+            new[offset[0]:offset[0] + old.shape[0], offset[1]:offset[1] + old.shape[1]] = old
+            setattr(self, name, new)
+        self.origin = new_origin
+
+    def update(self, x, y, z, is_hit):
+        '''
+        Readings as logged (x, y, z, is_hit arrays): targets for hits, the sensor position for
+        misses. Returns self.
+        '''
+        x, y, z = (np.atleast_1d(np.asarray(c, dtype=np.float64)) for c in (x, y, z))
+        is_hit = np.atleast_1d(np.asarray(is_hit, dtype=bool))
+        if len(x) == 0:
+            return self
+        self.readings += len(x)
+        dx0, dx1, dy0, dy1 = self.window
+
+        # cells of every target, and the corner cells of every miss rectangle (inclusive)
+        hit_cells = np.stack([self._index(x[is_hit]), self._index(y[is_hit])], axis=1)
+        mx, my = x[~is_hit], y[~is_hit]
+        miss_low = np.stack([self._index(mx + dx0), self._index(my + dy0)], axis=1)
+        miss_high = np.stack([self._index(mx + dx1), self._index(my + dy1)], axis=1)
+        corners = np.concatenate([hit_cells, miss_low, miss_high])
+        self._cover(corners.min(axis=0), corners.max(axis=0))
+        shape = self.log_odds.shape
+
+        # ---- negative evidence: every cell each miss had in view ----
+        if len(mx):
+            low, high = miss_low - self.origin, miss_high - self.origin + 1
+            if len(mx) < SLICE_MISSES:
+                for (i0, j0), (i1, j1) in zip(low, high):
+                    self.log_odds[i0:i1, j0:j1] += self.l_miss
+            else:
+                table = np.zeros((shape[0] + 1, shape[1] + 1), dtype=np.float64)
+                np.add.at(table, (low[:, 0], low[:, 1]), 1)
+                np.add.at(table, (high[:, 0], low[:, 1]), -1)
+                np.add.at(table, (low[:, 0], high[:, 1]), -1)
+                np.add.at(table, (high[:, 0], high[:, 1]), 1)
+                counts = table.cumsum(axis=0).cumsum(axis=1)[:-1, :-1]
+                self.log_odds += (counts * self.l_miss).astype(np.float32)
+
+        # ---- positive evidence: the cell of every target (ravel() of the layers is a view) ----
+        if len(hit_cells):
+            flat = np.ravel_multi_index((hit_cells - self.origin).T, shape)
+            np.add.at(self.log_odds.ravel(), flat, np.float32(self.l_hit))
+            np.add.at(self.z_sum.ravel(), flat, z[is_hit].astype(np.float32))
+            np.add.at(self.hits.ravel(), flat, np.uint32(1))
+
+        # only the cells this update touched can be out of range
+        (i0, j0), (i1, j1) = corners.min(axis=0) - self.origin, corners.max(axis=0) - self.origin + 1
+        touched = self.log_odds[i0:i1, j0:j1]
+        np.clip(touched, -self.clamp, self.clamp, out=touched)
+        return self
+
+    def probability(self):
+        # p(occupied) of every cell; 0.5 where nothing was seen
+        return 1 / (1 + np.exp(-self.log_odds))
+
+    def centres(self, axis):
+        # wall coordinate (cm) of the middle of every cell along axis 0 (x) or 1 (y)
+        return (self.origin[axis] + np.arange(self.log_odds.shape[axis]) + 0.5) * self.cell
+
+    def occupied(self, probability=OCCUPIED):
+        '''
+        (n, 3) x, y, z of the cells more likely full than probability: cell centre, mean z of
+        their targets. Input for process_points.extract_segments.
+        '''
+        threshold = np.log(probability / (1 - probability))
+        ix, iy = np.nonzero((self.log_odds > threshold) & (self.hits > 0))
+        z = self.z_sum[ix, iy] / self.hits[ix, iy]
+        return np.column_stack([self.centres(0)[ix], self.centres(1)[iy], z]).astype(np.float64)
+
+    @property
+    def nbytes(self):
+        return self.log_odds.nbytes + self.z_sum.nbytes + self.hits.nbytes
+
+
+if __name__ == '__main__':
+    from session_pipeline import read_scan
+
+    parser = argparse.ArgumentParser(description="Occupancy grid of a scan")
+    parser.add_argument('scan', help='walabotOut_$(time).txt log or walabotSession_$(time) directory')
+    parser.add_argument('--cell', type=float, default=CELL_CM, help='cell edge in cm')
+    parser.add_argument('--arena', action='store_true', help='a miss clears the whole arena, not MISS_WINDOW')
+    parser.add_argument('--png', help='also save the probability of every cell as an image')
+    args = parser.parse_args()
+
+    x, y, z, is_hit = read_scan(args.scan)
+    grid = OccupancyGrid(args.cell, footprint() if args.arena else MISS_WINDOW).update(x, y, z, is_hit)
+    print(f"{len(x)} readings ({int(np.count_nonzero(is_hit))} targets) -> {grid.log_odds.shape[0]} x "
+          f"{grid.log_odds.shape[1]} cells ({grid.nbytes / 1024:.0f} KiB), {len(grid.occupied())} occupied")
+    if args.png:
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=(10, 6))
+        ax = fig.add_subplot()
+        extent = [grid.centres(0)[0], grid.centres(0)[-1], grid.centres(1)[0], grid.centres(1)[-1]]
+        image = ax.imshow(grid.probability().T, origin='lower', extent=extent, cmap='RdGy_r', vmin=0, vmax=1)
+        fig.colorbar(image, ax=ax, label='p(pipe)')
+        ax.set_xlabel('X Axis')
+        ax.set_ylabel('Y Axis')
+        fig.savefig(args.png, dpi=150)
+        print(f"Occupancy grid saved as: {args.png}")
@@ -0,0 +1,97 @@
+'''
+Session-scoped, append-only buffer of Walabot readings.
+
+Every trigger appends its targets (or one "No Target Detected" row) here, so the scan loop,
+the plots and the ifc generation can read the whole session without re-parsing walabotOut_*.txt.
+Columns are preallocated NumPy arrays that double in size when full, so appending is amortized
+O(new points) instead of O(total points).
+
+Rows are never rewritten once appended, so the arrays returned by the column properties can be
+handed to other code as a snapshot: a later append either writes past their end or into a new buffer.
+'''
+
+import numpy as np
+
+INITIAL_CAPACITY = 1024
+
+
+class PointStore:
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.size = 0
+        self._x = np.empty(capacity, dtype=np.float64)
+        self._y = np.empty(capacity, dtype=np.float64)
+        self._z = np.empty(capacity, dtype=np.float64)
+        self._amplitude = np.empty(capacity, dtype=np.float64)
+        self._hit = np.empty(capacity, dtype=bool)
+        self._trigger = np.empty(capacity, dtype=np.int32)  # which Enter press the reading came from
+        self._row = np.empty(capacity, dtype=np.int32)  # which y line of the wall scan
+
+    def __len__(self):
+        return self.size
+
+    # ---- grow every column geometrically so appends stay amortized O(1) per point ----
+    def _reserve(self, extra):
+        needed = self.size + extra
+        capacity = max(len(self._x), 1)  # capacity=0 would never grow
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ('_x', '_y', '_z', '_amplitude', '_hit', '_trigger', '_row'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def append(self, x, y, z, amplitude, hit, trigger=0, row=0):
+        x = np.atleast_1d(np.asarray(x, dtype=np.float64))
+        n = len(x)
+        self._reserve(n)
+        start, end = self.size, self.size + n
+        self._x[start:end] = x
+        self._y[start:end] = y
+        self._z[start:end] = z
+        self._amplitude[start:end] = amplitude
+        self._hit[start:end] = hit
+        self._trigger[start:end] = trigger
+        self._row[start:end] = row
+        self.size = end
+
+    @property
+    def x(self):
+        return self._x[:self.size]
+
+    @property
+    def y(self):
+        return self._y[:self.size]
+
+    @property
+    def z(self):
+        return self._z[:self.size]
+
+    @property
+    def amplitude(self):
+        return self._amplitude[:self.size]
+
+    @property
+    def hit(self):
+        return self._hit[:self.size]
+
+    @property
+    def trigger(self):
+        return self._trigger[:self.size]
+
+    @property
+    def row(self):
+        return self._row[:self.size]
+
+    def columns(self):
+        # same order as the old read_data(): x, y, z, is_hit
+        return self.x, self.y, self.z, self.hit
+
+    def since(self, start):
+        # rows [start:stop) for a reader on another thread. size is read before the buffers:
+        # append() only bumps size after the rows are written, and a regrow copies every row below
+        # size, so whichever buffer is picked up holds valid rows up to stop.
+        stop = self.size
+        return stop, self._x[start:stop], self._y[start:stop], self._z[start:stop], self._hit[start:stop]
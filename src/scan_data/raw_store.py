@@ -0,0 +1,166 @@
+'''
+Raw Walabot images of a scan session, one per trigger, next to the points in the session directory.
+
+GetImagingTargets() only reports the few peaks above the threshold; the raw image is the whole
+energy volume of the arena. With RECORD_RAW_IMAGES in megascript_v2.py every trigger appends
+    'slice'   GetRawImageSlice(), float32[size_x, size_y] at the depth of the strongest reflection
+    'image'   GetRawImage(), float32[size_x, size_y, size_z] over the whole arena
+to the session directory (walabotSession_$(time)/):
+    raw.json        mode, frame shape, arena (SetArenaX/Y/Z min, max, resolution), column names
+    raw_images.f32  the frames back to back, little-endian float32
+    raw_index.f64   one row per frame: trigger, row, x, y (sensor position, cm), power, depth, energy
+
+Both binary files are only ever appended to, so recording costs O(frame) per trigger and a crash
+loses at most the frame being written; the frame count is taken from the file sizes. Reading maps
+the frames with np.memmap, so a long session is never loaded whole.
+
+python -m scan_data.raw_store pathTo/walabotSession_$(time)
+'''
+
+import json
+import os
+import sys
+import numpy as np
+
+FORMAT_VERSION = 1
+RAW_HEADER_FILE = 'raw.json'
+RAW_IMAGES_FILE = 'raw_images.f32'
+RAW_INDEX_FILE = 'raw_index.f64'
+INDEX_COLUMNS = ('trigger', 'row', 'x', 'y', 'power', 'depth', 'energy')
+MODES = ('slice', 'image')
+
+
+def has_raw(path):
+    return os.path.isfile(os.path.join(path, RAW_HEADER_FILE))
+
+
+def arena_axes(arena):
+    # coordinates (cm) of the arena grid along x, y and z, as set with SetArenaX/Y/Z(min, max, res)
+    return tuple(np.arange(lo, hi + res / 2, res) for lo, hi, res in (arena['x'], arena['y'], arena['z']))
+
+
+class RawImageStore:
+    def __init__(self, path, mode='slice', arena=None):
+        if mode not in MODES:
+            raise ValueError(f"raw image mode must be one of {', '.join(MODES)}, not {mode!r}")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.header = {
+            'format': FORMAT_VERSION,
+            'mode': mode,
+            'shape': None,  # set by the first frame
+            'dtype': '<f4',
+            'arena': arena,
+            'index_columns': list(INDEX_COLUMNS),
+        }
+        self.count = 0
+        self._images = open(os.path.join(path, RAW_IMAGES_FILE), 'wb')
+        self._index = open(os.path.join(path, RAW_INDEX_FILE), 'wb')
+        self._write_header()
+
+    def _write_header(self):
+        tmp = os.path.join(self.path, RAW_HEADER_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.header, f, indent=2)
+        os.replace(tmp, os.path.join(self.path, RAW_HEADER_FILE))
+
+    @property
+    def mode(self):
+        return self.header['mode']
+
+    def append(self, raster, trigger, row, x, y, power=np.nan, depth=np.nan, energy=np.nan):
+        # raster: the nested lists the SDK returns (or an array); x, y: sensor position of the trigger
+        frame = np.asarray(raster, dtype='<f4')
+        if self.header['shape'] is None:
+            self.header['shape'] = list(frame.shape)
+            self._write_header()
+        elif list(frame.shape) != self.header['shape']:
+            raise ValueError(f"raw frame of shape {frame.shape}, expected {tuple(self.header['shape'])}")
+        self._images.write(frame.tobytes())
+        self._index.write(np.array([trigger, row, x, y, power, depth, energy], dtype='<f8').tobytes())
+        self._images.flush()
+        self._index.flush()
+        self.count += 1
+
+    def capture(self, wlbt, trigger, row, x, y):
+        # read the image of the trigger that was just made from the SDK and append it
+        if self.mode == 'image':
+            raster, _, _, _, power = wlbt.GetRawImage()
+            depth = np.nan
+        else:
+            raster, _, _, depth, power = wlbt.GetRawImageSlice()
+        self.append(raster, trigger, row, x, y, power, depth, wlbt.GetImageEnergy())
+
+    def close(self):
+        self._images.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RawImages:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, RAW_HEADER_FILE), 'r') as f:
+            self.header = json.load(f)
+        if self.header.get('format') != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported raw image format {self.header.get('format')}")
+        shape = tuple(self.header['shape'] or ())
+        dtype = np.dtype(self.header['dtype'])
+        frame_bytes = int(np.prod(shape)) * dtype.itemsize if shape else 0
+        images_path = os.path.join(path, RAW_IMAGES_FILE)
+        index = np.fromfile(os.path.join(path, RAW_INDEX_FILE), dtype='<f8')
+        # frames whose image and index row were both written completely
+        count = min(os.path.getsize(images_path) // frame_bytes if frame_bytes else 0,
+                    len(index) // len(INDEX_COLUMNS))
+        self.index = index[:count * len(INDEX_COLUMNS)].reshape(count, len(INDEX_COLUMNS))
+        self.images = (np.memmap(images_path, dtype=dtype, mode='r', shape=(count,) + shape) if count
+                       else np.empty((0,) + shape, dtype=dtype))
+
+    def __len__(self):
+        return len(self.images)
+
+    @property
+    def mode(self):
+        return self.header['mode']
+
+    @property
+    def arena(self):
+        return self.header['arena']
+
+    def column(self, name):
+        return self.index[:, INDEX_COLUMNS.index(name)]
+
+    def points(self, threshold):
+        '''
+        Every voxel (or slice pixel) of every frame above threshold as a reading in wall coordinates,
+        like PrintSensorTargets places targets: x = x + X, y = y - Y, z = Z (the slice depth for
+        slices). Returns (n, 4) x, y, z, amplitude.
+        '''
+        ax_x, ax_y, ax_z = arena_axes(self.arena)
+        frame, *cell = np.nonzero(self.images > threshold)
+        amplitude = np.asarray(self.images[(frame, *cell)], dtype=np.float64)
+        x = self.column('x')[frame] + ax_x[cell[0]]
+        y = self.column('y')[frame] - ax_y[cell[1]]
+        z = ax_z[cell[2]] if self.mode == 'image' else self.column('depth')[frame]
+        return np.column_stack([x, y, z, amplitude])
+
+
+def open_raw(path):
+    return RawImages(path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Usage: python -m scan_data.raw_store pathTo/walabotSession_$(time)")
+        sys.exit(1)
+
+    raw = open_raw(sys.argv[1])
+    print(json.dumps(raw.header))
+    print(f"{len(raw)} frame(s)")
+    if len(raw):
+        print(f"energy: min {np.nanmin(raw.column('energy'))}, max {np.nanmax(raw.column('energy'))}")
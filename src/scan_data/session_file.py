@@ -0,0 +1,153 @@
+'''
+Binary, columnar container for one scan session, kept next to the walabotOut_*.txt log.
+
+A session is a directory (walabotSession_$(time)/) holding
+    header.json     arena settings, spacing, column names, point count, wall dimensions
+    points.npy      float32[7, n]: x, y, z, amplitude, hit, trigger, row (one contiguous row per column)
+    segments.npy    float32[m, 6]: x1, y1, z1, x2, y2, z2 of the pipes, y already made positive (optional)
+    raw.json, raw_images.f32, raw_index.f64
+                    raw energy image of every trigger (optional, see raw_store.py)
+
+.npy files are used rather than one .npz because numpy can only memory-map plain .npy files, so
+process_points, generate_ifc and temp.py open the columns with np.load(mmap_mode='r') and never
+re-parse formatted floats. export_text() writes the old text formats back out for debugging.
+
+python -m scan_data.session_file pathTo/walabotSession_$(time) [out.txt]
+'''
+
+import json
+import os
+import sys
+import numpy as np
+
+COLUMNS = ('x', 'y', 'z', 'amplitude', 'hit', 'trigger', 'row')
+FORMAT_VERSION = 1
+HEADER_FILE = 'header.json'
+POINTS_FILE = 'points.npy'
+SEGMENTS_FILE = 'segments.npy'
+
+
+def is_session(path):
+    return os.path.isfile(os.path.join(path, HEADER_FILE))
+
+
+def _write_npy(path, array):
+    # write next to the target and rename, so a reader never maps a half-written file
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def _write_header(path, header):
+    tmp = os.path.join(path, HEADER_FILE + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(header, f, indent=2)
+    os.replace(tmp, os.path.join(path, HEADER_FILE))
+
+
+def save_session(path, columns, arena=None, spacing=None, **extra):
+    # columns: dict (or PointStore-like object) with every name in COLUMNS
+    os.makedirs(path, exist_ok=True)
+    if not isinstance(columns, dict):
+        columns = {name: getattr(columns, name) for name in COLUMNS}
+    n = len(columns['x'])
+    points = np.empty((len(COLUMNS), n), dtype=np.float32)
+    for i, name in enumerate(COLUMNS):
+        points[i] = columns[name]
+    _write_npy(os.path.join(path, POINTS_FILE), points)
+
+    header = read_header(path) if is_session(path) else {}
+    header.update(extra)
+    header.update({
+        'format': FORMAT_VERSION,
+        'columns': list(COLUMNS),
+        'count': n,
+        'arena': arena if arena is not None else header.get('arena'),
+        'spacing': spacing if spacing is not None else header.get('spacing'),
+    })
+    _write_header(path, header)
+
+
+def save_segments(path, segments, wall_dim):
+    # segments: (m, 6) x1, y1, z1, x2, y2, z2 ready for ifc generation
+    segments = np.asarray(segments, dtype=np.float32).reshape(-1, 6)
+    _write_npy(os.path.join(path, SEGMENTS_FILE), segments)
+    header = read_header(path)
+    header['wall_dim'] = [float(v) for v in wall_dim]
+    header['segment_count'] = len(segments)
+    _write_header(path, header)
+
+
+def read_header(path):
+    with open(os.path.join(path, HEADER_FILE), 'r') as f:
+        return json.load(f)
+
+
+class Session:
+    def __init__(self, path, mmap_mode='r'):
+        self.path = path
+        self.header = read_header(path)
+        if self.header.get('format') != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported session format {self.header.get('format')}")
+        self.points = np.load(os.path.join(path, POINTS_FILE), mmap_mode=mmap_mode)
+        segments_path = os.path.join(path, SEGMENTS_FILE)
+        self.segments = np.load(segments_path, mmap_mode=mmap_mode) if os.path.exists(segments_path) else None
+
+    def __len__(self):
+        return self.points.shape[1]
+
+    def column(self, name):
+        return self.points[COLUMNS.index(name)]
+
+    @property
+    def wall_dim(self):
+        return self.header.get('wall_dim')
+
+    def columns(self):
+        # same order as read_data(): x, y, z, is_hit (float64 copies, safe to modify)
+        x, y, z = (self.column(name).astype(np.float64) for name in ('x', 'y', 'z'))
+        return x, y, z, self.column('hit') != 0
+
+    def hits(self):
+        # (n, 3) x, y, z of the readings with a target, what process_points works on
+        hit = self.column('hit') != 0
+        return np.stack([self.column(name)[hit] for name in ('x', 'y', 'z')], axis=1).astype(np.float64)
+
+
+def open_session(path, mmap_mode='r'):
+    return Session(path, mmap_mode=mmap_mode)
+
+
+def export_text(path, out_file):
+    # walabotOut_*.txt style dump of the points, for debugging or the old tools
+    session = open_session(path)
+    x, y, z, amplitude, hit = (session.column(name) for name in ('x', 'y', 'z', 'amplitude', 'hit'))
+    with open(out_file, 'w') as f:
+        for i in range(len(session)):
+            if hit[i]:
+                f.write(f"x: {x[i]} cm, y: {y[i]} cm, z: {z[i]} cm, a: {amplitude[i]} cm\n")
+            else:
+                f.write(f"No Target Detected at x: {x[i]} cm, y: {y[i]} cm, z: {z[i]} cm\n")
+
+
+def export_segments_text(path, out_file):
+    # coordsForifc_*.txt style dump of the wall and pipes
+    session = open_session(path)
+    with open(out_file, 'w') as f:
+        wall_dim = session.wall_dim
+        f.write(f"WALL, {wall_dim[0]}, {wall_dim[1]}, {wall_dim[2]}\n")
+        for x1, y1, z1, x2, y2, z2 in session.segments:
+            f.write(f"PIPE, {x1}, {y1}, {z1}, {x2}, {y2}, {z2}\n")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python -m scan_data.session_file pathTo/walabotSession_$(time) [out.txt]")
+        sys.exit(1)
+
+    session = open_session(sys.argv[1])
+    print(json.dumps(session.header))
+    if len(sys.argv) == 3:
+        export_text(sys.argv[1], sys.argv[2])
+        print(f"Points exported as text to: {sys.argv[2]}")
@@ -0,0 +1,232 @@
+'''
+Walabot acquisition off the operator's thread.
+
+The SDK keeps the last completed scan for the Get actions and never hands out the same scan
+twice, so Trigger and Get may run in parallel (WalabotAPI.h). Acquisition keeps the sensor busy
+on its own threads and puts every scan into a small ring buffer:
+
+    sensor thread   Trigger(), Trigger(), ...          (pipelined=True)
+    get thread      GetImagingTargets() [+ raw image] of each scan as soon as it completes -> ring
+
+or both on one thread, one after the other (pipelined=False). When the ring is full the oldest
+frame is dropped: only fresh scans matter, the operator moves the sensor between them.
+
+capture() is what pressing Enter does: it waits for the first frame whose Trigger started after
+the call (the sensor is in its new place by then). By default a Trigger only starts when a
+capture asks for one, so capture() takes one Trigger + Get, and back-to-back captures overlap
+the next Trigger with the last Get. continuous=True keeps the sensor triggering non-stop instead
+(the most scans per second, but a capture also waits for the scan in progress to finish).
+A Trigger or Get that raises puts a Failed marker in the ring in place of its frame, so the
+capture waiting for that scan raises instead of waiting for a frame that never comes.
+
+Logging, raw image storage and previews then run on a Stage (one worker thread, in submission
+order), so the prompt comes back while they are written.
+
+    acquisition = Acquisition(wlbt, raw_mode='slice').start()
+    recorder = Stage(record)          # record(frame, x, y, trigger, row)
+    frame = acquisition.capture(5.0)  # Enter
+    recorder.submit(frame, x, y, trigger, row)
+    recorder.drain()                  # before reading what record() wrote
+    acquisition.stop(); recorder.close()
+'''
+
+import queue
+import threading
+import time
+import traceback
+from collections import deque, namedtuple
+
+RING_CAPACITY = 8
+
+# seq: number of the scan; started/finished: perf_counter() when its Trigger began / its Get ended;
+# raw: (raster, power, depth, energy) when a raw mode is on, else None
+Frame = namedtuple('Frame', ['seq', 'started', 'finished', 'targets', 'raw'])
+# a scan whose Trigger or Get raised error, in the ring where its Frame would have been
+Failed = namedtuple('Failed', ['seq', 'started', 'finished', 'error'])
+
+
+class RingBuffer:
+    # newest frames, bounded; readers wait on a condition for one that is new enough
+    def __init__(self, capacity=RING_CAPACITY):
+        self._frames = deque(maxlen=capacity)
+        self._cond = threading.Condition()
+        self.dropped = 0  # frames pushed out before anyone read them
+        self.closed = False
+
+    def put(self, frame):
+        with self._cond:
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1
+            self._frames.append(frame)
+            self._cond.notify_all()
+
+    def wait_after(self, started, timeout=None):
+        # the oldest frame whose Trigger began at or after started
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        with self._cond:
+            while True:
+                for frame in self._frames:
+                    if frame.started >= started:
+                        return frame
+                if self.closed:
+                    raise RuntimeError("acquisition stopped")
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"no new Walabot frame within {timeout} s")
+                self._cond.wait(remaining)
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class Acquisition:
+    def __init__(self, sdk, raw_mode=None, pipelined=True, continuous=False, capacity=RING_CAPACITY):
+        self.sdk = sdk
+        self.raw_mode = raw_mode  # None, 'slice' or 'image', as for raw_store.RawImageStore
+        self.pipelined = pipelined
+        self.continuous = continuous
+        self._requests = threading.Semaphore(0)  # captures waiting for a Trigger to start
+        self.ring = RingBuffer(capacity)
+        self.scans = 0  # frames produced
+        self.errors = 0
+        self._stop = threading.Event()
+        self._scan_cond = threading.Condition()
+        self._completed = None  # (seq, started) of the last scan whose Trigger finished
+        self._threads = []
+
+    def start(self):
+        if self.pipelined:
+            targets = (self._trigger_loop, self._get_loop)
+        else:
+            targets = (self._serial_loop,)
+        for target in targets:
+            thread = threading.Thread(target=target, name=f'walabot-{target.__name__[1:-5]}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    # ---- sensor side ----
+    def _get(self, seq, started):
+        targets = self.sdk.GetImagingTargets()
+        raw = None
+        if self.raw_mode == 'image':
+            raster, _, _, _, power = self.sdk.GetRawImage()
+            raw = (raster, power, float('nan'), self.sdk.GetImageEnergy())
+        elif self.raw_mode == 'slice':
+            raster, _, _, depth, power = self.sdk.GetRawImageSlice()
+            raw = (raster, power, depth, self.sdk.GetImageEnergy())
+        self.ring.put(Frame(seq, started, time.perf_counter(), targets, raw))
+        self.scans += 1
+
+    def _guarded(self, step, seq, started):
+        # a failed scan is reported and marked in the ring for the capture waiting on it; the sensor
+        # keeps going
+        try:
+            step()
+            return True
+        except Exception as e:
+            self.errors += 1
+            traceback.print_exc()
+            self.ring.put(Failed(seq, started, time.perf_counter(), e))
+            return False
+
+    def _wait_for_request(self):
+        # False once stopping
+        if not self.continuous:
+            self._requests.acquire()
+        return not self._stop.is_set()
+
+    def _serial_loop(self):
+        seq = 0
+        while self._wait_for_request():
+            started = time.perf_counter()
+            if self._guarded(self.sdk.Trigger, seq, started):
+                self._guarded(lambda: self._get(seq, started), seq, started)
+                seq += 1
+
+    def _trigger_loop(self):
+        seq = 0
+        while self._wait_for_request():
+            started = time.perf_counter()
+            if self._guarded(self.sdk.Trigger, seq, started):
+                with self._scan_cond:
+                    self._completed = (seq, started)
+                    self._scan_cond.notify_all()
+                seq += 1
+        with self._scan_cond:
+            self._scan_cond.notify_all()
+
+    def _get_loop(self):
+        last = -1
+        while True:
+            with self._scan_cond:
+                while not self._stop.is_set() and (self._completed is None or self._completed[0] == last):
+                    self._scan_cond.wait()
+                if self._stop.is_set():
+                    return
+                # read before the Get starts: if another scan completes meanwhile, the Get returns
+                # that newer one, which only makes the frame fresher than its label says
+                seq, started = self._completed
+            self._guarded(lambda: self._get(seq, started), seq, started)
+            last = seq
+
+    # ---- operator side ----
+    def capture(self, timeout=None):
+        # the first scan triggered from now on; blocks until its Get is done (TimeoutError after
+        # timeout s), raises RuntimeError if its Trigger or Get failed
+        started = time.perf_counter()
+        if not self.continuous:
+            self._requests.release()
+        frame = self.ring.wait_after(started, timeout)
+        if isinstance(frame, Failed):
+            raise RuntimeError(f"Walabot scan {frame.seq} failed: {frame.error!r}") from frame.error
+        return frame
+
+    def stop(self):
+        self._stop.set()
+        self._requests.release()
+        with self._scan_cond:
+            self._scan_cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self.ring.close()
+
+
+class Stage:
+    '''
+    One worker thread running fn on every submission, in order. Unlike preview.PreviewWorker
+    nothing is coalesced, so it suits logging and storage.
+    '''
+    def __init__(self, fn, name='acquisition-stage', maxsize=0):
+        self._fn = fn
+        self._queue = queue.Queue(maxsize)
+        self.done = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, *args):
+        self._queue.put(args)
+
+    def _run(self):
+        while True:
+            args = self._queue.get()
+            try:
+                if args is None:
+                    return
+                self._fn(*args)
+                self.done += 1
+            except Exception:
+                # a failed record must not kill the worker (or the scan)
+                traceback.print_exc()
+            finally:
+                self._queue.task_done()
+
+    def drain(self):
+        # wait until everything submitted so far has run
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
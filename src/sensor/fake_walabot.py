@@ -0,0 +1,123 @@
+'''
+Stand-in for the Walabot SDK's WalabotAPI.py, for running and timing the scan loop without the
+sensor. Same module-level functions and constants as the parts of the SDK InWallApp uses.
+
+Trigger() takes TRIGGER_SECONDS and records a new scan; every Get (GetImagingTargets,
+GetRawImageSlice, GetRawImage) takes GET_SECONDS and returns data of the last completed scan, so
+a Get may run on another thread while the next Trigger is in progress, as with the real SDK.
+Targets are random points in the arena (none for about 30% of scans); raw images are random
+energies of the arena's shape.
+
+    WALABOT_API=sensor/fake_walabot.py python megascript_v2.py
+    import sensor.fake_walabot as wlbt; wlbt.configure(trigger_seconds=0.05, get_seconds=0.02)
+'''
+
+import random
+import threading
+import time
+from collections import namedtuple
+
+PROF_SHORT_RANGE_IMAGING = 0x00010000
+FILTER_TYPE_NONE = 0
+STATUS_CONNECTED = 2
+STATUS_SCANNING = 4
+STATUS_CALIBRATING = 5
+
+TRIGGER_SECONDS = 0.0
+GET_SECONDS = 0.0
+CALIBRATION_TRIGGERS = 3
+
+ImagingTarget = namedtuple('ImagingTarget', ['xPosCm', 'yPosCm', 'zPosCm', 'amplitude'])
+
+_lock = threading.Lock()
+_rng = random.Random(7)
+_arena = {'x': (-3.0, 4.0, 0.5), 'y': (-6.0, 4.0, 0.5), 'z': (3.0, 8.0, 0.5)}
+_scan = 0  # completed Trigger() calls
+_calibration_left = 0
+stats = {'triggers': 0, 'gets': 0}
+
+
+def configure(trigger_seconds=0.0, get_seconds=0.0, seed=7):
+    global TRIGGER_SECONDS, GET_SECONDS, _rng, _scan
+    TRIGGER_SECONDS = trigger_seconds
+    GET_SECONDS = get_seconds
+    _rng = random.Random(seed)
+    _scan = 0
+    stats.update(triggers=0, gets=0)
+
+
+def _nothing(*args, **kwargs):
+    pass
+
+
+Init = Initialize = ConnectAny = SetProfile = SetDynamicImageFilter = SetThreshold = _nothing
+Start = Stop = Disconnect = Clean = _nothing
+
+
+def SetArenaX(start, end, res):
+    _arena['x'] = (start, end, res)
+
+
+def SetArenaY(start, end, res):
+    _arena['y'] = (start, end, res)
+
+
+def SetArenaZ(start, end, res):
+    _arena['z'] = (start, end, res)
+
+
+def StartCalibration():
+    global _calibration_left
+    _calibration_left = CALIBRATION_TRIGGERS
+
+
+def GetStatus():
+    return (STATUS_CALIBRATING if _calibration_left else STATUS_SCANNING, 100 * (_calibration_left == 0))
+
+
+def Trigger():
+    global _scan, _calibration_left
+    time.sleep(TRIGGER_SECONDS)
+    with _lock:
+        _scan += 1
+        stats['triggers'] += 1
+        _calibration_left = max(0, _calibration_left - 1)
+
+
+def _get():
+    time.sleep(GET_SECONDS)
+    with _lock:
+        stats['gets'] += 1
+        return _rng
+
+
+def _size(axis):
+    start, end, res = _arena[axis]
+    return int(round((end - start) / res)) + 1
+
+
+def GetImagingTargets():
+    rng = _get()
+    if rng.random() < 0.3:
+        return []
+    (x0, x1, _), (y0, y1, _), (z0, z1, _) = _arena['x'], _arena['y'], _arena['z']
+    return [ImagingTarget(rng.uniform(x0, x1), rng.uniform(y0, y1), rng.uniform(z0, z1), rng.uniform(60, 90))
+            for _ in range(rng.randint(1, 3))]
+
+
+def GetRawImageSlice():
+    rng = _get()
+    size_x, size_y = _size('x'), _size('y')
+    raster = [[rng.random() for _ in range(size_y)] for _ in range(size_x)]
+    return raster, size_x, size_y, rng.uniform(*_arena['z'][:2]), 1.0
+
+
+def GetRawImage():
+    rng = _get()
+    size_x, size_y, size_z = _size('x'), _size('y'), _size('z')
+    raster = [[[rng.random() for _ in range(size_z)] for _ in range(size_y)] for _ in range(size_x)]
+    return raster, size_x, size_y, size_z, 1.0
+
+
+def GetImageEnergy():
+    return _get().uniform(0, 1e-3)
@@ -0,0 +1,310 @@
+'''
+Replay an archived scan through InWallApp without the Walabot: ReplayWalabot serves the targets
+(and raw images, if the session recorded them) of a walabotOut_$(time).txt log or a
+walabotSession_$(time) directory through the WalabotAPI surface, and ScriptedInput types the
+operator's answers, timing how long the app takes to come back to the prompt after each one.
+
+The app places a target at x = xL + xPosCm, y = yL - yPosCm, where (xL, yL) is where it thinks the
+sensor is. plan() works out the answers (spacing, Enter, "2" and the height change of each new
+line) so the app walks the recorded positions, and ReplayWalabot hands out every target relative
+to the position the app will be at for that trigger, so the replayed readings land where they were
+recorded (to the last bit of the float arithmetic).
+
+Triggers and lines are exact for a session (its trigger and row columns). A text log has no
+trigger numbers: every "No Target Detected" line is one trigger, consecutive target lines are
+taken as one trigger (split_hit_runs() divides them up again where the readings around them show
+how many triggers there were), and a new line starts where a "No Target Detected" reading changes
+y. The spacing is the session's, or for a log the smallest step between neighbouring misses of a
+line. InWallApp always walks a line left to right from x = 3, so the no-target readings of older logs
+scanned back and forth come back in that order, and a line that went left of x = 3 starts at 3;
+the targets still land where they were recorded, but such a wall can come out a few cm off.
+
+python -m sensor.replay walabotOut_txt/walabotOut_$(time).txt [--generate 2] [--trigger-ms 40 --get-ms 25]
+python megascript_v2.py --replay walabotOut_txt/walabotSession_$(time)
+'''
+
+import argparse
+import os
+import time
+from collections import namedtuple
+import numpy as np
+
+from sensor.fake_walabot import ImagingTarget
+
+X_START = 3  # -xArenaMin in InWallApp, where every line starts
+DEFAULT_SPACING = 2.0
+
+# row: line of the scan; targets: (k, 4) x, y, z, amplitude where they were recorded (k = 0 for
+# no target); position: (x, y) of the sensor if the log says (no-target readings), else None
+ReplayTrigger = namedtuple('ReplayTrigger', ['row', 'targets', 'position'])
+
+
+def read_triggers(path):
+    from scan_data.session_file import is_session, open_session
+    if is_session(path):
+        session = open_session(path)
+        columns = np.stack([session.column(name) for name in ('x', 'y', 'z', 'amplitude')], axis=1).astype(np.float64)
+        hit = session.column('hit') != 0
+        trigger, row = session.column('trigger').astype(np.int64), session.column('row').astype(np.int64)
+        triggers = []
+        starts = np.flatnonzero(np.diff(trigger, prepend=-1))
+        for start, stop in zip(starts, np.append(starts[1:], len(trigger))):
+            if hit[start]:
+                triggers.append(ReplayTrigger(int(row[start]), columns[start:stop], None))
+            else:
+                triggers.append(ReplayTrigger(int(row[start]), np.empty((0, 4)), tuple(columns[start, :2])))
+        return triggers, session.header.get('spacing')
+
+    from scan_data.loader import load_log
+    log = load_log(path)
+    columns = np.stack([log.x, log.y, log.z, log.amplitude], axis=1)
+    triggers = []
+    row, last_miss = 0, None
+    for i in range(len(columns)):
+        if log.hit[i]:
+            if triggers and triggers[-1].position is None:
+                previous = triggers.pop()
+                triggers.append(previous._replace(targets=np.vstack([previous.targets, columns[i:i + 1]])))
+            else:
+                triggers.append(ReplayTrigger(row, columns[i:i + 1], None))
+            continue
+        position = (float(log.x[i]), float(log.y[i]))
+        if last_miss is not None and position[1] != last_miss[1]:
+            row += 1
+        last_miss = position
+        triggers.append(ReplayTrigger(row, np.empty((0, 4)), position))
+    spacing = log_spacing(triggers)
+    return split_hit_runs(triggers, spacing), spacing
+
+
+def log_spacing(triggers):
+    # smallest step in x between neighbouring no-target readings of a line
+    steps = []
+    previous = None
+    for trigger in triggers:
+        if trigger.position is None:
+            continue
+        if previous is not None and previous.row == trigger.row and trigger.position[0] != previous.position[0]:
+            steps.append(abs(trigger.position[0] - previous.position[0]))
+        previous = trigger
+    return min(steps) if steps else DEFAULT_SPACING
+
+
+def split_hit_runs(triggers, spacing):
+    '''
+    A run of target lines between two no-target readings of a line may be several triggers: as many
+    as the app must have taken to get from one reading's x to the other's (x = 3 + k * spacing).
+    Split such runs into that many triggers, in order, where the line's readings fit that grid.
+    '''
+    def step(trigger):
+        k = (trigger.position[0] - X_START) / spacing
+        return int(round(k)) if abs(k - round(k)) < 1e-6 else None
+
+    steps = {}  # row -> k of its no-target readings, or None if they are off the grid or not increasing
+    for trigger in triggers:
+        if trigger.position is not None and steps.get(trigger.row, []) is not None:
+            k = step(trigger)
+            known = steps.setdefault(trigger.row, [])
+            steps[trigger.row] = known + [k] if k is not None and (not known or k > known[-1]) else None
+
+    result = []
+    last_k, row = -1, None
+    for i, trigger in enumerate(triggers):
+        if trigger.row != row:
+            last_k, row = -1, trigger.row
+        if trigger.position is not None:
+            last_k = step(trigger) if steps.get(row) is not None else last_k
+            result.append(trigger)
+            continue
+        following = triggers[i + 1] if i + 1 < len(triggers) else None
+        if steps.get(row) is None or following is None or following.row != row:
+            result.append(trigger)
+            continue
+        count = min(step(following) - last_k - 1, len(trigger.targets))
+        result.extend(trigger._replace(targets=part) for part in np.array_split(trigger.targets, max(count, 1)))
+    return result
+
+
+def plan(triggers, spacing=None, generate=1):
+    '''
+    The operator answers that replay these triggers, and where the app will put the sensor for each
+    (computed with the same float arithmetic as InWallApp). Returns (script, positions); script is
+    a list of (kind, text) for ScriptedInput.
+    '''
+    spacing = str(spacing if spacing is not None else log_spacing(triggers))
+    script = [('spacing', spacing), ('calibrate', 'n')]
+    positions = []
+    x_length, y_length = X_START, 0
+    row = triggers[0].row if triggers else 0
+    line_y = 0  # y the app is at for the current line
+    for i, trigger in enumerate(triggers):
+        if i > 0 and trigger.row != row:
+            # the height change comes from a recorded position of the new line, if it has one
+            new_y = next((t.position[1] for t in triggers[i:] if t.row == trigger.row and t.position), line_y)
+            change = repr(float(new_y - line_y))
+            script += [('new line', '2'), ('trigger', change)]
+            y_length += float(change)
+            x_length = X_START
+            row, line_y = trigger.row, new_y
+        else:
+            if i > 0:
+                x_length += float(spacing)
+            script.append(('trigger', ''))
+        positions.append((x_length, y_length))
+    script += [('generate', '3')] * generate + [('end', '4')]
+    return script, positions
+
+
+class ReplayWalabot:
+    '''
+    The WalabotAPI functions InWallApp calls, answered from a recording. Every Trigger() moves on to
+    the next recorded trigger; the Gets return it. trigger_seconds / get_seconds simulate the sensor.
+    '''
+    PROF_SHORT_RANGE_IMAGING = 0x00010000
+    FILTER_TYPE_NONE = 0
+    STATUS_SCANNING = 4
+    STATUS_CALIBRATING = 5
+
+    def __init__(self, triggers, positions, raw=None, trigger_seconds=0.0, get_seconds=0.0):
+        self.triggers = triggers
+        self.positions = positions
+        self.raw = raw  # raw_store.RawImages of the session, or None for zero images
+        self.trigger_seconds = trigger_seconds
+        self.get_seconds = get_seconds
+        self.current = -1  # index of the last Trigger()
+        self.arena = {'x': (-3.0, 4.0, 0.5), 'y': (-6.0, 4.0, 0.5), 'z': (3.0, 8.0, 0.5)}
+
+    def _nothing(self, *args, **kwargs):
+        pass
+
+    Init = Initialize = ConnectAny = SetProfile = SetDynamicImageFilter = SetThreshold = _nothing
+    Start = Stop = Disconnect = Clean = StartCalibration = _nothing
+
+    def SetArenaX(self, start, end, res):
+        self.arena['x'] = (start, end, res)
+
+    def SetArenaY(self, start, end, res):
+        self.arena['y'] = (start, end, res)
+
+    def SetArenaZ(self, start, end, res):
+        self.arena['z'] = (start, end, res)
+
+    def GetStatus(self):
+        return (self.STATUS_SCANNING, 100)
+
+    def Trigger(self):
+        time.sleep(self.trigger_seconds)
+        self.current += 1
+
+    def GetImagingTargets(self):
+        time.sleep(self.get_seconds)
+        if not 0 <= self.current < len(self.triggers):
+            return []
+        x_length, y_length = self.positions[self.current]
+        return [ImagingTarget(x - x_length, y_length - y, z, a) for x, y, z, a in self.triggers[self.current].targets]
+
+    def _raw(self, index):
+        # recorded frame of this trigger, if the session has one
+        if self.raw is None:
+            return None
+        found = np.flatnonzero(self.raw.column('trigger') == index)
+        return found[0] if len(found) else None
+
+    def _zeros(self, axes):
+        sizes = [int(round((self.arena[a][1] - self.arena[a][0]) / self.arena[a][2])) + 1 for a in axes]
+        return np.zeros(sizes).tolist(), sizes
+
+    def GetRawImageSlice(self):
+        time.sleep(self.get_seconds)
+        frame = self._raw(self.current)
+        if frame is None:
+            raster, (size_x, size_y) = self._zeros('xy')
+            return raster, size_x, size_y, self.arena['z'][0], 0.0
+        image = self.raw.images[frame]
+        depth = self.raw.column('depth')[frame]
+        return image.tolist(), image.shape[0], image.shape[1], depth, self.raw.column('power')[frame]
+
+    def GetRawImage(self):
+        time.sleep(self.get_seconds)
+        frame = self._raw(self.current)
+        if frame is None:
+            raster, (size_x, size_y, size_z) = self._zeros('xyz')
+            return raster, size_x, size_y, size_z, 0.0
+        image = self.raw.images[frame]
+        return image.tolist(), *image.shape, self.raw.column('power')[frame]
+
+    def GetImageEnergy(self):
+        frame = self._raw(self.current)
+        return 0.0 if frame is None else float(self.raw.column('energy')[frame])
+
+
+class ScriptedInput:
+    # stands in for input(): hands out the script's answers and times each one until the next prompt
+    def __init__(self, script):
+        self.script = list(script)
+        self.given = 0
+        self._handed_at = None
+        self.latencies = []  # (kind, seconds until the app asked for the next answer)
+
+    def __call__(self, prompt=''):
+        self._finish()
+        if self.given >= len(self.script):
+            raise EOFError("replay script finished")
+        kind, text = self.script[self.given]
+        self.given += 1
+        self._handed_at = (kind, time.perf_counter())
+        return text
+
+    def _finish(self):
+        if self._handed_at is not None:
+            kind, handed_at = self._handed_at
+            self.latencies.append((kind, time.perf_counter() - handed_at))
+            self._handed_at = None
+
+    def finish(self):
+        # the app returned after the last answer
+        self._finish()
+
+    def summary(self):
+        kinds = {}
+        for kind, seconds in self.latencies:
+            kinds.setdefault(kind, []).append(seconds)
+        return kinds
+
+
+def print_latencies(operator, total):
+    print(f"\n{'answer':<12}{'count':>7}{'mean ms':>10}{'max ms':>10}")
+    for kind, times in operator.summary().items():
+        print(f"{kind:<12}{len(times):>7}{np.mean(times) * 1000:>10.1f}{np.max(times) * 1000:>10.1f}")
+    print(f"{'replay':<12}{'':>7}{total * 1000:>10.1f}")
+
+
+def replay(path, app, generate=1, trigger_seconds=0.0, get_seconds=0.0):
+    '''
+    Run app (InWallApp from megascript_v2.py) on the recording at path. Returns the ScriptedInput,
+    whose latencies hold the time per answer.
+    '''
+    from scan_data.raw_store import has_raw, open_raw
+    triggers, spacing = read_triggers(path)
+    script, positions = plan(triggers, spacing, generate)
+    raw = open_raw(path) if os.path.isdir(path) and has_raw(path) else None
+    sdk = ReplayWalabot(triggers, positions, raw, trigger_seconds, get_seconds)
+    operator = ScriptedInput(script)
+
+    start = time.perf_counter()
+    app(sdk=sdk, read_input=operator)
+    operator.finish()
+    print_latencies(operator, time.perf_counter() - start)
+    return operator
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay an archived scan through InWallApp")
+    parser.add_argument('recording', help='walabotOut_$(time).txt log or walabotSession_$(time) directory')
+    parser.add_argument('--generate', type=int, default=1, help='times to press "3" at the end')
+    parser.add_argument('--trigger-ms', type=float, default=0.0, help='simulated Trigger() time')
+    parser.add_argument('--get-ms', type=float, default=0.0, help='simulated time of every Get')
+    args = parser.parse_args()
+
+    from megascript_v2 import InWallApp
+    replay(args.recording, InWallApp, args.generate, args.trigger_ms / 1000, args.get_ms / 1000)
@@ -0,0 +1,340 @@
+'''
+The post-scan stages shared by temp.py and batch_process.py, for one walabotOut_$(time).txt log
+(or walabotSession_$(time) directory):
+
+    clean     drop "No Target Detected" lines and the amplitude -> walabotClean_$(time).txt
+    process   pipe_plotting/process_points.py                   -> segments_$(time).txt (+ png)
+    rebase    make all y positive, add the wall dimensions      -> coordsForifc_$(time).txt
+    ifc       generate_ifc/generate_ifc.py                      -> wall_with_pipes_$(time).ifc
+
+Every output path is passed in, so several sessions can be processed side by side. With a
+StageCache (stage_cache.py) a stage whose inputs and parameters have not changed copies its last
+outputs back instead of running again.
+
+run_pipeline() does the same clean -> process -> rebase -> ifc on arrays already in memory (the
+scan loop's PointStore, or a log read once) and writes only the IFC; the text files in between are
+written only when asked for as debug artifacts.
+'''
+
+import os
+import re
+import sys
+import time
+import numpy as np
+
+import pipe_plotting.process_points as proc
+import pipe_plotting.pipe_network as network
+import pipe_plotting.clustering as density
+import generate_ifc.generate_ifc as ifc
+import scan_data.loader as loader
+import scan_data.fusion as fusion
+import scan_data.occupancy as occupancy
+import scan_data.session_file as session_file
+from scan_data.session_file import HEADER_FILE, POINTS_FILE, SEGMENTS_FILE, is_session, open_session
+
+STAGES = ('read', 'clean', 'process', 'rebase', 'ifc')
+
+
+def session_timestamp(log):
+    # walabotOut_041825_1331.txt / walabotSession_041825_1331 -> 041825_1331
+    name = os.path.basename(os.path.normpath(log))
+    match = re.match(r'walabot(?:Out|Session)_(.+?)(?:\.txt)?$', name)
+    return match.group(1) if match else os.path.splitext(name)[0]
+
+
+def output_paths(log, out_dir, stamp=None):
+    # same names megascript_v2.py gives one session, all in one directory
+    stamp = stamp or session_timestamp(log)
+    return {
+        'clean': os.path.join(out_dir, f'walabotClean_{stamp}.txt'),
+        'segments': os.path.join(out_dir, f'segments_{stamp}.txt'),
+        'plot': os.path.join(out_dir, f'{stamp}.png'),
+        'ifc_coords': os.path.join(out_dir, f'coordsForifc_{stamp}.txt'),
+        'ifc': os.path.join(out_dir, f'wall_with_pipes_{stamp}.ifc'),
+    }
+
+
+def read_scan(log):
+    # x, y, z, is_hit of every reading; a binary session is memory-mapped instead of parsed
+    if is_session(log):
+        return open_session(log).columns()
+    return loader.read_data(log)
+
+
+def wall_dimensions(x, y, z):
+    # transforms -y to +y and make so min(y) is always 0
+    low_y = np.min(y)
+    if low_y < 0:
+        y = y - low_y
+
+    # before data is cleaned and after y all made positive, grab the max xyz of all data collected (even if no target) to get wall dimensions
+    return (np.max(x), np.max(y), np.max(z) - 6) #max(z) always 8, so subtract 6 to get 2cm thick wall
+
+
+def clean_log(unprocessed_filename, cleaned_filename):
+    with open(unprocessed_filename, "r") as infile, open(cleaned_filename, "w") as outfile:
+        for line in infile:
+            # Skip lines containing "No Target Detected"
+            if "No Target Detected" in line:
+                continue
+            cleaned_line = (
+                line.split("a:")[0]  # Remove "a:" and anything after it
+                    .replace("x: ", "")
+                    .replace(" y:", "")
+                    .replace(" z:", "")
+                    .replace("cm", "")
+                    .strip()
+            )
+            outfile.write(cleaned_line + "\n")
+
+
+def rebase_segments(segments_filename, ifc_coords_filename, wall_dim):
+    # reformat segments.txt for ifcCoords.txt, aka make all negative y positive; returns the pipes
+    with open(segments_filename, 'r') as infile, open(ifc_coords_filename, 'w') as outfile:
+        # Write in wall dimensions that were collected from the uncleaned data
+        line = f'WALL, {wall_dim[0]}, {wall_dim[1]}, {wall_dim[2]}'
+        outfile.write(line + '\n')
+
+        lines = infile.readlines()
+        y_values = []
+
+        # Collect all y1 and y2 values to determine the minimum y
+        for line in lines:
+            parts = line.strip().split(',')
+            y1 = float(parts[1])
+            y2 = float(parts[4])
+            y_values.extend([y1, y2])
+
+        # Find the minimum y value (a scan without pipes still gets its wall)
+        low_y = min(y_values, default=0)
+
+        # If the minimum y is negative, adjust all y values
+        pipes = []
+        for line in lines:
+            parts = line.strip().split(',')
+            x1, y1, z1, x2, y2, z2 = map(float, parts)
+
+            if low_y < 0:
+                y1 -= low_y
+                y2 -= low_y
+
+            # Write the adjusted line to the output file
+            outfile.write(f"PIPE, {x1}, {y1}, {z1}, {x2}, {y2}, {z2}\n")
+            pipes.append([x1, y1, z1, x2, y2, z2])
+    return pipes
+
+
+def _input_file(log):
+    # what a stage reading the scan depends on; a session's header changes when its segments are saved
+    return os.path.join(log, POINTS_FILE) if is_session(log) else log
+
+
+def _cached(cache, stage, fn, inputs, params=None, code=(), outputs=None, arrays=()):
+    if cache is None:
+        return fn()
+    return cache.run(stage, fn, inputs=inputs, params=params, code=code, outputs=outputs, arrays=arrays)
+
+
+def stage_read(log, cache=None):
+    # wall dimensions from every reading of the scan
+    def run():
+        return [float(v) for v in wall_dimensions(*read_scan(log)[:3])]
+    # read_scan / wall_dimensions live here, a session is opened by session_file
+    return _cached(cache, 'read', run, [_input_file(log)], code=[loader, session_file, sys.modules[__name__]])
+
+
+def stage_clean(log, cleaned_filename, cache=None):
+    def run():
+        clean_log(log, cleaned_filename)
+    _cached(cache, 'clean', run, [log], code=[sys.modules[__name__]], outputs={'clean': cleaned_filename})
+
+
+def stage_process(points_input, segments_filename, plot_png=None, cache=None, clustering=None):
+    clustering = clustering or proc.CLUSTERING
+
+    def run():
+        proc.run_all(points_input, segments_filename, plot_png, clustering=clustering)
+    outputs = {'segments': segments_filename}
+    if plot_png:
+        outputs['plot'] = plot_png
+    params = {'x_tolerance': proc.X_TOLERANCE, 'y_tolerance': proc.Y_TOLERANCE,
+              'min_segment_length': proc.MIN_SEGMENT_LENGTH, 'merge_collinear': proc.MERGE_COLLINEAR,
+              'merge_z_tolerance': proc.MERGE_Z_TOLERANCE}
+    code = [proc, network]
+    if clustering != 'axis':
+        params.update(_clustering_params(clustering))
+        code.append(density)
+    _cached(cache, 'process', run, [_input_file(points_input)], params, code, outputs)
+
+
+def stage_rebase(segments_filename, ifc_coords_filename, wall_dim, cache=None):
+    def run():
+        return rebase_segments(segments_filename, ifc_coords_filename, wall_dim)
+    params = {'wall_dim': [float(v) for v in wall_dim]}
+    return _cached(cache, 'rebase', run, [segments_filename], params, [sys.modules[__name__]],
+                   {'ifc_coords': ifc_coords_filename})
+
+
+def stage_ifc(ifc_input, ifc_filename, cache=None):
+    # ifc_input: a coordsForifc text file or a session directory with its segments saved
+    def run():
+        ifc.generate(ifc_input, ifc_filename)
+    inputs = [ifc_input]
+    if os.path.isdir(ifc_input):
+        inputs = [os.path.join(ifc_input, name) for name in (SEGMENTS_FILE, HEADER_FILE)]
+    _cached(cache, 'ifc', run, inputs, {'pipe_radius_cm': ifc.PIPE_RADIUS_CM}, [ifc], {'ifc': ifc_filename})
+
+
+def process_session(log, outputs, plot=False, cache=None, clustering=None):
+    '''
+    Run every stage on one log. outputs holds the paths from output_paths(); clustering is
+    process_points' step 3 backend (default proc.CLUSTERING). Returns the seconds
+    spent in each stage, keyed by STAGES, and the names of the stages that came from the cache.
+    '''
+    timings = {}
+    cached = []
+    start = time.perf_counter()
+    hits = cache.hits if cache is not None else 0
+
+    def lap(stage):
+        nonlocal start, hits
+        now = time.perf_counter()
+        timings[stage] = now - start
+        start = now
+        if cache is not None and cache.hits > hits:
+            cached.append(stage)
+            hits = cache.hits
+
+    wall_dim = stage_read(log, cache)
+    lap('read')
+
+    # a session needs no cleaning, process_points reads its hit columns directly
+    cleaned_filename = log
+    if not is_session(log):
+        cleaned_filename = outputs['clean']
+        stage_clean(log, cleaned_filename, cache)
+    lap('clean')
+
+    # Input cleaned data through ML algorithm
+    stage_process(cleaned_filename, outputs['segments'], outputs['plot'] if plot else None, cache, clustering)
+    lap('process')
+
+    stage_rebase(outputs['segments'], outputs['ifc_coords'], wall_dim, cache)
+    lap('rebase')
+
+    # Input reformatted data into ifc generation program
+    stage_ifc(outputs['ifc_coords'], outputs['ifc'], cache)
+    lap('ifc')
+    return timings, cached
+
+
+def rebase_pipes(segments):
+    # rebase_segments() on an (m, 6) array: make all negative y positive
+    pipes = np.array(segments, dtype=np.float64).reshape(-1, 6)
+    if len(pipes):
+        low_y = pipes[:, [1, 4]].min()
+        if low_y < 0:
+            pipes[:, [1, 4]] -= low_y
+    return pipes
+
+
+def write_points(points, filename):
+    # x, y, z per line, what process_points.read_points reads
+    with open(filename, 'w') as f:
+        for x, y, z in points:
+            f.write(f"{x}, {y}, {z}\n")
+
+
+def write_ifc_coords(wall_dim, pipes, filename):
+    # the coordsForifc text generate_ifc.generate reads
+    with open(filename, 'w') as f:
+        f.write(f'WALL, {wall_dim[0]}, {wall_dim[1]}, {wall_dim[2]}\n')
+        for x1, y1, z1, x2, y2, z2 in pipes:
+            f.write(f"PIPE, {x1}, {y1}, {z1}, {x2}, {y2}, {z2}\n")
+
+
+def read_fusion_columns(log):
+    # amplitude and trigger of every reading for fusion.fuse_hits; a text log has no trigger numbers
+    if is_session(log):
+        session = open_session(log)
+        return session.column('amplitude'), session.column('trigger')
+    return loader.load_log(log).amplitude, None
+
+
+def _clustering_params(clustering):
+    # what the density backends of process_points depend on, for the cache key
+    return {'clustering': clustering, 'dims': proc.DENSITY_DIMS[clustering], 'eps_cm': density.EPS_CM,
+            'min_samples': density.MIN_SAMPLES, 'line_width_cm': density.LINE_WIDTH_CM}
+
+
+def run_pipeline(x, y, z, is_hit, ifc_filename, plot_png=None, debug=None, cache=None, fittings=False,
+                 fuse=False, amplitude=None, trigger=None, occupancy_grid=False, clustering=None, stream=False):
+    '''
+    Every reading of a scan (x, y, z, is_hit arrays, y as logged) -> IFC file, all in memory.
+    debug optionally maps 'clean', 'segments' and/or 'ifc_coords' to paths for the intermediate
+    text files. fittings adds IfcPipeFittings at elbows and tees. fuse replaces the targets by one
+    amplitude-weighted point per spot (scan_data/fusion.py) before process_points, using the
+    amplitude and trigger columns when given. occupancy_grid instead feeds process_points the
+    cells of an occupancy grid (scan_data/occupancy.py) of every reading, misses included, that are
+    more likely full than empty. clustering picks process_points' step 3 backend ('axis', 'dbscan'
+    or 'dbscan3d', default proc.CLUSTERING). stream writes the IFC entity by entity
+    (StreamingIfcWriter) instead of building an ifcopenshell model first; the segments and re-based
+    pipes are still all in memory before that, so it only saves the model's memory. Returns the
+    wall dimensions and the (m, 6) pipes written to the IFC.
+    '''
+    x, y, z = (np.asarray(column, dtype=np.float64) for column in (x, y, z))
+    is_hit = np.asarray(is_hit, dtype=bool)
+    debug = debug or {}
+    extra = [np.asarray(column) for column in (amplitude, trigger) if fuse and column is not None]
+    clustering = clustering or proc.CLUSTERING
+
+    def run():
+        wall_dim = [float(v) for v in wall_dimensions(x, y, z)]
+
+        # clean: only the readings with a target, amplitude dropped (after weighing them, with fuse)
+        if occupancy_grid:
+            grid = occupancy.OccupancyGrid().update(x, y, z, is_hit)
+            points = grid.occupied()
+            print(f"Occupancy grid: {int(np.count_nonzero(is_hit))} targets -> {len(points)} occupied cells")
+        elif fuse:
+            fused = fusion.fuse_hits(x, y, z, is_hit, amplitude, trigger)
+            points = np.column_stack([fused.x, fused.y, fused.z])
+            print(f"Fused targets: {int(np.count_nonzero(is_hit))} -> {len(points)} points")
+        else:
+            points = np.column_stack([x[is_hit], y[is_hit], z[is_hit]])
+        if 'clean' in debug:
+            write_points(points, debug['clean'])
+
+        segments = proc.extract_segments(points, clustering=clustering)
+        if plot_png:
+            proc.plot_segments(points, segments, plot_png)
+        if 'segments' in debug:
+            proc.write_segments(segments, debug['segments'])
+
+        pipes = rebase_pipes(segments)
+        if 'ifc_coords' in debug:
+            write_ifc_coords(wall_dim, pipes, debug['ifc_coords'])
+
+        ifc.generate_from_arrays(wall_dim, pipes, ifc_filename, stream=stream, fittings=fittings)
+        return {'wall_dim': wall_dim, 'pipes': pipes.tolist()}
+
+    outputs = dict(debug, ifc=ifc_filename)
+    if plot_png:
+        outputs['plot'] = plot_png
+    params = {'x_tolerance': proc.X_TOLERANCE, 'y_tolerance': proc.Y_TOLERANCE,
+              'min_segment_length': proc.MIN_SEGMENT_LENGTH,
+              'merge_collinear': proc.MERGE_COLLINEAR, 'merge_z_tolerance': proc.MERGE_Z_TOLERANCE,
+              'pipe_radius_cm': ifc.PIPE_RADIUS_CM,
+              'fittings': fittings, 'stream': stream}
+    code = [proc, network, ifc, sys.modules[__name__]]
+    if fuse:
+        params.update(fuse_bin_cm=fusion.BIN_CM, fuse_min_triggers=fusion.MIN_TRIGGERS)
+        code.append(fusion)
+    if clustering != 'axis':
+        params.update(_clustering_params(clustering))
+        code.append(density)
+    if occupancy_grid:
+        params.update(occupancy_cell_cm=occupancy.CELL_CM, occupancy_window=list(occupancy.MISS_WINDOW))
+        code.append(occupancy)
+    result = _cached(cache, 'pipeline', run, [], params, code, outputs, [x, y, z, is_hit] + extra)
+    return result['wall_dim'], np.array(result['pipes'], dtype=np.float64).reshape(-1, 6)
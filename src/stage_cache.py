@@ -0,0 +1,158 @@
+'''
+On-disk cache of pipeline stage results, so rerunning temp.py, batch_process.py or megascript "3"
+on a scan that has not changed skips the stages whose inputs are the same.
+
+A stage is keyed by a sha256 of
+    - the stage name
+    - the bytes of its input files (the raw log, the cleaned points, the segments, ...) or arrays
+    - its parameters (X_TOLERANCE, Y_TOLERANCE, MIN_SEGMENT_LENGTH, PIPE_RADIUS_CM, wall size, ...)
+    - the source of the modules that implement it, so editing a stage invalidates its entries
+    - the names of the files it writes, so a run with a plot and one without have separate entries
+and its entry is a directory holding a copy of every file the stage wrote plus meta.json with the
+stage's return value. On a hit the files are copied back to where the caller wants them.
+
+The cache is bounded by size: after every store the least recently used entries (by the mtime of
+meta.json, which a hit refreshes) are deleted until the total is under max_bytes.
+'''
+
+import hashlib
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+
+DEFAULT_DIR = 'stage_cache'
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+META_FILE = 'meta.json'
+CHUNK_BYTES = 1 << 20
+
+_source_digests = {}
+
+
+def _update_file(h, path):
+    # a session directory counts as the files in it, in name order
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            h.update(name.encode())
+            _update_file(h, os.path.join(path, name))
+        return
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b''):
+            h.update(chunk)
+
+
+def source_digest(module):
+    # hash of a module's source file, computed once per process
+    path = module.__file__
+    if path not in _source_digests:
+        h = hashlib.sha256()
+        _update_file(h, path)
+        _source_digests[path] = h.hexdigest()
+    return _source_digests[path]
+
+
+class StageCache:
+    def __init__(self, root=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, stage, inputs=(), params=None, code=(), arrays=(), outputs=()):
+        h = hashlib.sha256(stage.encode())
+        for path in inputs:
+            h.update(b'\0file\0')
+            _update_file(h, path)
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            h.update(f'\0array\0{array.dtype.str}{array.shape}'.encode())
+            h.update(array.data)
+        h.update(json.dumps(params or {}, sort_keys=True).encode())
+        for module in code:
+            h.update(source_digest(module).encode())
+        h.update(json.dumps(sorted(outputs)).encode())
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def fetch(self, key, outputs):
+        # copies the cached files to the paths in outputs; returns (True, value) or (False, None)
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, META_FILE), 'r') as f:
+                meta = json.load(f)
+            if set(meta['files']) != set(outputs):
+                return False, None
+            for name, path in outputs.items():
+                shutil.copyfile(os.path.join(entry, name), path)
+            os.utime(os.path.join(entry, META_FILE))  # most recently used
+        except (OSError, ValueError, KeyError):
+            return False, None  # missing, half-evicted or unreadable: treat as a miss
+        return True, meta['value']
+
+    def store(self, key, outputs, value=None):
+        # stage in a private directory and rename it into place, so readers never see a partial entry
+        entry = self._entry(key)
+        tmp = os.path.join(self.root, f'tmp-{uuid.uuid4().hex}')
+        os.makedirs(tmp)
+        try:
+            for name, path in outputs.items():
+                shutil.copyfile(path, os.path.join(tmp, name))
+            with open(os.path.join(tmp, META_FILE), 'w') as f:
+                json.dump({'files': sorted(outputs), 'value': value}, f)
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            os.rename(tmp, entry)
+        except OSError:
+            pass  # another process stored the same key first, or the disk is full; nothing to keep
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def run(self, stage, fn, inputs=(), params=None, code=(), outputs=None, arrays=()):
+        '''
+        Return fn()'s value for these inputs, calling fn only on a miss. outputs maps a name to each
+        file fn writes; those files are restored on a hit. fn's value must be JSON serializable.
+        '''
+        outputs = outputs or {}
+        key = self.key(stage, inputs, params, code, arrays, outputs)
+        hit, value = self.fetch(key, outputs)
+        if hit:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = fn()
+        self.store(key, outputs, value)
+        return value
+
+    def _entries(self):
+        for prefix in os.listdir(self.root):
+            bucket = os.path.join(self.root, prefix)
+            if prefix.startswith('tmp-') or not os.path.isdir(bucket):
+                continue
+            for key in os.listdir(bucket):
+                entry = os.path.join(bucket, key)
+                try:
+                    size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+                    used = os.path.getmtime(os.path.join(entry, META_FILE))
+                except OSError:
+                    continue  # being evicted by someone else
+                yield used, size, entry
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root, exist_ok=True)
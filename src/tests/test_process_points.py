@@ -0,0 +1,28 @@
+'''
+Step 6b of process_points (merge_collinear_segments). Run from src/:
+    python -m pytest tests
+'''
+
+import numpy as np
+
+import pipe_plotting.process_points as proc
+
+
+def test_overlapping_pipes_at_one_depth_merge():
+    merged, saved = proc.merge_collinear_segments([[0, 0, 3, 0, 20, 3], [0, 5, 3.5, 0, 30, 3.5]])
+    assert saved == 1
+    z = (3 * 20 + 3.5 * 25) / 45  # length-weighted
+    assert np.allclose(merged, [[0, 0, z, 0, 30, z]])
+
+
+def test_overlapping_pipes_at_different_depths_stay_apart():
+    segments = [[0, 0, 3, 0, 20, 3], [0, 5, 8, 0, 30, 8]]
+    apart, saved = proc.merge_collinear_segments(segments)
+    assert saved == 0
+    assert np.array_equal(apart, segments)
+
+
+def test_z_tolerance_is_read_when_called(monkeypatch):
+    segments = [[0, 0, 3, 0, 20, 3], [0, 5, 3.5, 0, 30, 3.5]]
+    monkeypatch.setattr(proc, 'MERGE_Z_TOLERANCE', 0.1)
+    assert proc.merge_collinear_segments(segments)[1] == 0